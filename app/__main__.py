@@ -0,0 +1,16 @@
+import sys
+
+
+def main() -> int:
+    # With arguments: headless batch command; without: the desktop application
+    if len(sys.argv) > 1:
+        from app.cli import main as cli_main
+
+        return cli_main()
+    from app.main import main as gui_main
+
+    return gui_main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,16 +5,17 @@ from typing import Optional
 
 from PySide6.QtCore import QLocale, QTranslator, Qt, Signal, QObject
 from PySide6.QtGui import QIcon, QFont
-from PySide6.QtWidgets import QApplication
+from PySide6.QtWidgets import QApplication, QMessageBox, QProgressDialog
 
 from app.core.i18n import I18n
-from app.core.db import Database
-from app.core.migrations import MigrationManager
+from app.core.backend import RemoteDatabase, open_database
+from app.core.migrations import MigrationError, MigrationManager
 from app.core.settings import AppSettings
 from app.views.login import LoginDialog
 from app.views.main_window import MainWindow
-from app.core.logger import init_logging, get_logger
+from app.core.logger import init_logging, get_logger, shutdown_logging
 from app.core.auth import ensure_bootstrap_admin
+from app.core.audit import init_audit, shutdown_audit
 from app.core.utils import ensure_runtime_assets
 
 
@@ -25,6 +26,30 @@ class AppSignals(QObject):
 signals = AppSignals()
 
 
+def _migration_progress(app: QApplication):
+    # Shown only once a migration reports progress, i.e. never on a normal start
+    dialog: list[QProgressDialog] = []
+
+    def report(version: str, done: int, total: int) -> None:
+        if not dialog:
+            d = QProgressDialog(app.translate("App", "Mise à jour de la base de données..."), "", 0, 0)
+            d.setCancelButton(None)
+            d.setWindowModality(Qt.ApplicationModal)
+            d.setMinimumDuration(0)
+            dialog.append(d)
+        d = dialog[0]
+        d.setLabelText(app.translate("App", "Mise à jour de la base de données (%1)...").replace("%1", version))
+        d.setMaximum(total)
+        d.setValue(min(done, total))
+        app.processEvents()
+
+    def close() -> None:
+        if dialog:
+            dialog[0].close()
+
+    return report, close
+
+
 def run_app() -> int:
     # Application bootstrap
     app = QApplication(sys.argv)
@@ -32,10 +57,10 @@ def run_app() -> int:
     app.setApplicationName("Gestion Commerciale")
     app.setApplicationVersion("0.1.0")
 
-    init_logging()
+    base_dir = Path(__file__).resolve().parent.parent
+    init_logging(log_dir=base_dir / "logs")
     logger = get_logger(__name__)
 
-    base_dir = Path(__file__).resolve().parent.parent
     data_dir = Path(os.getenv("APP_DATA_DIR", base_dir / "data"))
     data_dir.mkdir(parents=True, exist_ok=True)
 
@@ -47,9 +72,20 @@ def run_app() -> int:
 
     # DB + migrations
     db_path = data_dir / "app.db"
-    db = Database(db_path)
-    migrator = MigrationManager(db=db, migrations_dir=base_dir / "app" / "migrations")
-    migrator.apply_pending_migrations()
+    db = open_database(db_path)
+    remote = isinstance(db, RemoteDatabase)
+    if not remote:
+        # A terminal on the shared service relies on the server having migrated
+        migrator = MigrationManager(db=db, migrations_dir=base_dir / "app" / "migrations")
+        report, close = _migration_progress(app)
+        try:
+            migrator.apply_pending_migrations(progress=report)
+        except MigrationError as e:
+            logger.exception("Database migration failed")
+            QMessageBox.critical(None, app.translate("App", "Erreur"), str(e))
+            return 1
+        finally:
+            close()
 
     # Settings
     settings = AppSettings(db=db)
@@ -58,6 +94,12 @@ def run_app() -> int:
     # Auth bootstrap
     ensure_bootstrap_admin(db)
 
+    # Audit trail, written in the background and flushed on exit
+    if not remote:
+        init_audit(db_path)
+        app.aboutToQuit.connect(shutdown_audit)
+    app.aboutToQuit.connect(shutdown_logging)
+
     # Login
     login = LoginDialog(db=db, i18n=i18n, signals=signals)
     if login.exec() != LoginDialog.Accepted:
@@ -0,0 +1,407 @@
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import date
+from pathlib import Path
+from typing import Callable, Optional
+
+# Qt, reportlab and openpyxl are imported inside the commands that need them so
+# that batch jobs start quickly and run on machines without a display.
+from app.core.audit import audit, init_audit, shutdown_audit
+from app.core.db import Database
+from app.core.logger import get_logger, init_logging, shutdown_logging
+from app.core.migrations import MigrationError, MigrationManager
+from app.core.settings import AppSettings
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+Command = Callable[[Database, argparse.Namespace], int]
+
+
+def _database_path(args: argparse.Namespace) -> Path:
+    if args.db:
+        return args.db
+    # Same resolution as the desktop application
+    return Path(os.getenv("APP_DATA_DIR", BASE_DIR / "data")) / "app.db"
+
+
+def cmd_migrate(db: Database, args: argparse.Namespace) -> int:
+    # Pending migrations already ran while opening the database
+    manager = MigrationManager(db=db, migrations_dir=BASE_DIR / "app" / "migrations")
+    if args.verify:
+        changed = manager.verify_checksums()
+        for version in changed:
+            print(f"modified after being applied: {version}")
+        if changed:
+            return 1
+    print(f"Schema up to date ({len(manager.applied_versions())} migrations)")
+    return 0
+
+
+def _print_progress(version: str, done: int, total: int) -> None:
+    print(f"{version}: {done}/{total}" if total > 1 else version, end="\r" if done < total else "\n")
+
+
+def cmd_backup(db: Database, args: argparse.Namespace) -> int:
+    dest: Path = args.dest
+    if dest.is_dir():
+        dest = dest / f"backup-{date.today().strftime('%Y%m%d')}.db"
+    target = sqlite3.connect(dest)
+    try:
+        db.conn.backup(target)
+    finally:
+        target.close()
+    audit("backup", details={"path": str(dest), "source": "cli"})
+    print(dest)
+    return 0
+
+
+def cmd_export_products(db: Database, args: argparse.Namespace) -> int:
+    from app.core.products_io import export_products_csv, export_products_xlsx
+
+    fmt = args.format or args.path.suffix.lstrip(".").lower()
+    export = {"csv": export_products_csv, "xlsx": export_products_xlsx}.get(fmt)
+    if export is None:
+        raise ValueError(f"Unsupported format: {fmt}")
+    count = export(db, args.path)
+    audit("export", "product", details={"format": fmt, "rows": count, "path": str(args.path), "source": "cli"})
+    print(f"{count} products exported to {args.path}")
+    return 0
+
+
+def cmd_import_products(db: Database, args: argparse.Namespace) -> int:
+    from app.core.products_io import import_products_csv, import_products_xlsx
+
+    fmt = args.format or args.path.suffix.lstrip(".").lower()
+    load = {"csv": import_products_csv, "xlsx": import_products_xlsx}.get(fmt)
+    if load is None:
+        raise ValueError(f"Unsupported format: {fmt}")
+    count = load(db, args.path)
+    audit("import", "product", details={"format": fmt, "rows": count, "path": str(args.path), "source": "cli"})
+    print(f"{count} products imported from {args.path}")
+    return 0
+
+
+def cmd_pdf(db: Database, args: argparse.Namespace) -> int:
+    from app.core.pdf import generate_document_pdf
+
+    if args.ids:
+        rows = db.query(f"SELECT id, number FROM documents WHERE id IN ({', '.join('?' for _ in args.ids)}) ORDER BY id;", args.ids)
+    else:
+        sql = "SELECT id, number FROM documents WHERE kind = ? AND status NOT IN ('draft', 'cancelled')"
+        params: list = [args.kind]
+        if args.date_from:
+            sql += " AND date >= ?"
+            params.append(args.date_from)
+        if args.date_to:
+            sql += " AND date <= ?"
+            params.append(args.date_to)
+        rows = db.query(sql + " ORDER BY id;", params)
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    written = 0
+    for row in rows:
+        path = args.out_dir / f"{row['number']}.pdf"
+        if path.exists() and not args.overwrite:
+            continue
+        generate_document_pdf(db, row["id"], path, BASE_DIR)
+        audit("export_pdf", "document", row["id"], {"path": str(path), "source": "cli"})
+        written += 1
+    print(f"{written} PDF written to {args.out_dir} ({len(rows) - written} skipped)")
+    return 0
+
+
+def cmd_convert(db: Database, args: argparse.Namespace) -> int:
+    from app.core.documents import CONVERSIONS, convert_documents
+
+    if args.ids:
+        ids = args.ids
+    else:
+        # Every validated source document of the period; converted ones are skipped
+        source = args.source or ("delivery" if args.target == "invoice" else "quote")
+        if args.target not in CONVERSIONS.get(source, ()):
+            raise ValueError(f"Cannot convert {source} to {args.target}")
+        sql = "SELECT id FROM documents WHERE kind = ? AND status = 'validated'"
+        params: list = [source]
+        if args.date_from:
+            sql += " AND date >= ?"
+            params.append(args.date_from)
+        if args.date_to:
+            sql += " AND date <= ?"
+            params.append(args.date_to)
+        ids = [r[0] for r in db.query(sql + ";", params)]
+    created = convert_documents(db, ids, args.target, args.date)
+    print(f"{len(created)} {args.target} documents created ({len(ids) - len(created)} skipped)")
+    return 0
+
+
+def cmd_statement(db: Database, args: argparse.Namespace) -> int:
+    from app.core.pdf import generate_statement_pdf
+
+    generate_statement_pdf(db, args.partner_id, args.path, BASE_DIR, args.date_from, args.date_to)
+    print(args.path)
+    return 0
+
+
+def cmd_close_day(db: Database, args: argparse.Namespace) -> int:
+    from app.core.cash import close_day
+
+    closing = close_day(db, args.day)
+    print(f"{closing['day']}: in {closing['total_in']:.2f}, out {closing['total_out']:.2f}, balance {closing['closing_balance']:.2f}")
+    return 0
+
+
+def cmd_maintenance(db: Database, args: argparse.Namespace) -> int:
+    from app.core.maintenance import run_maintenance
+
+    logger = get_logger(__name__)
+    if args.integrity:
+        result = db.scalar("PRAGMA integrity_check;")
+        print(f"integrity_check: {result}")
+        if result != "ok":
+            return 1
+    if args.rebuild_rollups:
+        from app.core.rollups import rebuild_rollups
+
+        rebuild_rollups(db)
+    if args.recompute_balances:
+        from app.core.receivables import recompute_paid_totals
+
+        recompute_paid_totals(db)
+    if args.vacuum:
+        # Also switches older files to incremental auto-vacuum
+        db.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        db.execute("VACUUM;")
+    results = run_maintenance(db, args.budget, args.task, force=args.force)
+    for r in results:
+        print(f"{r['task']}: {r['status']} in {r['ms']:.0f} ms ({r['detail']})")
+    logger.info("Maintenance done")
+    return 1 if any(r["detail"].startswith("FAILED") for r in results) else 0
+
+
+def cmd_serve(db: Database, args: argparse.Namespace) -> int:
+    import secrets
+
+    from app.core.service import run_service
+
+    settings = AppSettings(db=db)
+    token = args.token or os.getenv("APP_SERVER_TOKEN") or settings.get("service_token")
+    if not token:
+        token = secrets.token_urlsafe(24)
+        settings.set("service_token", token)
+        print(f"Generated service token (stored in settings): {token}")
+    print(f"Serving {db.path} on http://{args.host}:{args.port} - terminals use APP_SERVER_URL and APP_SERVER_TOKEN")
+    run_service(db.path, token, args.host, args.port, args.readers)
+    return 0
+
+
+def cmd_datagen(db: Database, args: argparse.Namespace) -> int:
+    from app.core.datagen import SCALES, generate
+
+    generate(db, SCALES[args.scale], args.seed, lambda table, done, total: print(f"{table}: {done}/{total}", end="\r"))
+    print()
+    return 0
+
+
+def cmd_sync(db: Database, args: argparse.Namespace) -> int:
+    from app.core import sync
+
+    if args.action == "export":
+        batch = sync.export_changes(db, args.peer, 0 if args.full else None)
+        sync.write_delta(batch, args.path)
+        # Sent again by every export until a delta from the peer acknowledges them
+        print(f"{len(batch['changes'])} changes for {batch['peer']} written to {args.path}")
+    elif args.action == "renumber":
+        from app.core.numbering import scope_numbers, unscoped_numbers
+
+        left = [number for _, number, new in unscoped_numbers(db) if new is None]
+        print(f"{scope_numbers(db)} documents renumbered with the store code")
+        if left:
+            print(f"{len(left)} numbers do not start with the prefix of their kind, rename them by hand: {', '.join(left[:10])}")
+    elif args.action == "import":
+        stats = sync.apply_changes(db, sync.read_delta(args.path))
+        print(f"{stats['applied']} applied, {stats['skipped']} skipped, {stats['conflicts']} conflicts")
+    else:
+        peer_db = Database(args.peer_db)
+        try:
+            MigrationManager(db=peer_db, migrations_dir=BASE_DIR / "app" / "migrations").apply_pending_migrations()
+            result = sync.sync_with(db, peer_db)
+        finally:
+            peer_db.conn.close()
+        for direction, stats in result.items():
+            print(f"{direction}: {stats['applied']} applied, {stats['skipped']} skipped, {stats['conflicts']} conflicts")
+    audit("sync", details={"action": args.action, "source": "cli"})
+    return 0
+
+
+def cmd_valuation(db: Database, args: argparse.Namespace) -> int:
+    from app.core import valuation
+
+    if args.action == "rebuild":
+        print(f"Valuation rebuilt from {valuation.rebuild(db)} stock moves")
+    else:
+        if args.out:
+            print(f"{valuation.export_valuation_csv(db, args.out)} products written to {args.out}")
+        totals = valuation.valuation_totals(db)
+        print(f"{totals['products']} products, {totals['qty']:g} units, WAC {totals['wac']:.2f}, FIFO {totals['fifo']:.2f}")
+    return 0
+
+
+def cmd_replenish(db: Database, args: argparse.Namespace) -> int:
+    from app.core.replenishment import create_purchase_orders, suggest
+
+    suggestions = suggest(db, args.as_of)
+    for s in suggestions:
+        print(f"{s.sku}\t{s.supplier or '-'}\t{s.qty:g}\t(stock {s.stock:g}, on order {s.on_order:g}, {s.velocity:.2f}/day)")
+    print(f"{len(suggestions)} products to reorder")
+    if args.create and suggestions:
+        orders = create_purchase_orders(db, suggestions)
+        print(f"{len(orders)} draft purchase orders created: {', '.join(o['number'] for o in orders)}")
+    return 0
+
+
+def cmd_archive(db: Database, args: argparse.Namespace) -> int:
+    from app.core import archive
+
+    if args.year is None:
+        for r in db.query("SELECT * FROM archives ORDER BY year;"):
+            print(f"{r['year']}\t{r['path']}\t{r['documents']} documents, {r['payments']} payments, {r['cash_register']} cash movements\t{r['archived_at']}")
+        return 0
+    counts = archive.archive_year(db, args.year)
+    print(f"{args.year} archived to {archive.archive_path(db, args.year)}: " + ", ".join(f"{n} {t}" for t, n in counts.items()))
+    print("The freed pages are given back by 'maintenance' (incremental_vacuum)")
+    audit("archive", details={"year": args.year, **counts, "source": "cli"})
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app", description="Gestion Commerciale - batch commands (no command starts the GUI)")
+    parser.add_argument("--db", type=Path, help="database file (default: $APP_DATA_DIR/app.db)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only log warnings and errors")
+    sub = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    p = sub.add_parser("migrate", help="apply pending migrations")
+    p.add_argument("--verify", action="store_true", help="check applied migration files against their recorded checksums")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("backup", help="online copy of the database")
+    p.add_argument("dest", type=Path, help="file or directory")
+    p.set_defaults(func=cmd_backup)
+
+    for name, func, help_text in (
+        ("export-products", cmd_export_products, "export the product list"),
+        ("import-products", cmd_import_products, "import or update products by SKU"),
+    ):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("path", type=Path)
+        p.add_argument("--format", choices=("csv", "xlsx"), help="default: from the file extension")
+        p.set_defaults(func=func)
+
+    p = sub.add_parser("pdf", help="render document PDFs")
+    p.add_argument("ids", type=int, nargs="*", help="document ids (default: every validated document of --kind)")
+    p.add_argument("--kind", choices=("invoice", "delivery", "quote", "purchase"), default="invoice")
+    p.add_argument("--from", dest="date_from", help="YYYY-MM-DD")
+    p.add_argument("--to", dest="date_to", help="YYYY-MM-DD")
+    p.add_argument("--out-dir", type=Path, default=Path("."))
+    p.add_argument("--overwrite", action="store_true", help="re-render existing files")
+    p.set_defaults(func=cmd_pdf)
+
+    p = sub.add_parser("convert", help="turn validated quotes/delivery notes into deliveries or invoices")
+    p.add_argument("target", choices=("delivery", "invoice"))
+    p.add_argument("ids", type=int, nargs="*", help="source document ids (default: every unconverted --source document of the period)")
+    p.add_argument("--source", choices=("quote", "delivery"), help="default: delivery for invoices, quote for deliveries")
+    p.add_argument("--from", dest="date_from", help="YYYY-MM-DD")
+    p.add_argument("--to", dest="date_to", help="YYYY-MM-DD")
+    p.add_argument("--date", help="date of the new documents (default: today)")
+    p.set_defaults(func=cmd_convert)
+
+    p = sub.add_parser("statement", help="customer statement PDF")
+    p.add_argument("partner_id", type=int)
+    p.add_argument("path", type=Path)
+    p.add_argument("--from", dest="date_from")
+    p.add_argument("--to", dest="date_to")
+    p.set_defaults(func=cmd_statement)
+
+    p = sub.add_parser("close-day", help="cash register Z closing")
+    p.add_argument("--day", help="YYYY-MM-DD (default: today)")
+    p.set_defaults(func=cmd_close_day)
+
+    p = sub.add_parser("maintenance", help="checkpoint, optimize, reclaim free pages and check the database")
+    p.add_argument("--integrity", action="store_true", help="run PRAGMA integrity_check first")
+    p.add_argument("--vacuum", action="store_true")
+    p.add_argument("--rebuild-rollups", action="store_true")
+    p.add_argument("--recompute-balances", action="store_true", help="recompute invoice paid totals from payments")
+    p.add_argument("--task", action="append", choices=("checkpoint", "optimize", "incremental_vacuum", "quick_check"), help="run this task, due or not (repeatable; default: the due tasks)")
+    p.add_argument("--budget", type=float, default=60.0, help="seconds before the remaining tasks are cut (default: 60)")
+    p.add_argument("--force", action="store_true", help="run every task, due or not")
+    p.set_defaults(func=cmd_maintenance)
+
+    p = sub.add_parser("serve", help="share this database with other terminals over HTTP")
+    p.add_argument("--host", default="127.0.0.1", help="0.0.0.0 to accept other machines")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--readers", type=int, default=4, help="read connections in the pool")
+    p.add_argument("--token", help="default: $APP_SERVER_TOKEN or the stored service_token setting")
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("sync", help="exchange changes with another store")
+    actions = p.add_subparsers(dest="action", required=True, metavar="action")
+    a = actions.add_parser("export", help="write the changes the store has not acknowledged as a delta file")
+    a.add_argument("peer", help="store code of the receiving store")
+    a.add_argument("path", type=Path, help="delta file (.json.gz)")
+    a.add_argument("--full", action="store_true", help="resend every row, not only the changes not acknowledged yet")
+    a = actions.add_parser("import", help="apply a delta file received from another store")
+    a.add_argument("path", type=Path)
+    actions.add_parser("renumber", help="insert the store code into the numbers of documents created before it was set")
+    a = actions.add_parser("peer", help="two-way sync with another store database file")
+    a.add_argument("peer_db", type=Path)
+    p.set_defaults(func=cmd_sync)
+
+    p = sub.add_parser("valuation", help="inventory valuation (weighted average cost and FIFO)")
+    actions = p.add_subparsers(dest="action", required=True, metavar="action")
+    actions.add_parser("rebuild", help="recompute the valuation from the whole stock ledger")
+    a = actions.add_parser("report", help="valuation totals, and per product with --out")
+    a.add_argument("--out", type=Path, help="CSV file")
+    p.set_defaults(func=cmd_valuation)
+
+    p = sub.add_parser("replenish", help="reorder suggestions from sales velocity")
+    p.add_argument("--as-of", help="YYYY-MM-DD (default: today)")
+    p.add_argument("--create", action="store_true", help="create the draft purchase orders, one per supplier")
+    p.set_defaults(func=cmd_replenish)
+
+    p = sub.add_parser("archive", help="move a closed fiscal year to its own database file")
+    p.add_argument("year", type=int, nargs="?", help="year to archive (default: list the archived years)")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser("datagen", help="fill an empty database with synthetic data")
+    p.add_argument("--scale", choices=("tiny", "small", "medium", "large"), default="small")
+    p.add_argument("--seed", type=int, default=42)
+    p.set_defaults(func=cmd_datagen)
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    init_logging(log_dir=BASE_DIR / "logs", level="WARNING" if args.quiet else None)
+    logger = get_logger(__name__)
+
+    db_path = _database_path(args)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    db = Database(db_path)
+    try:
+        MigrationManager(db=db, migrations_dir=BASE_DIR / "app" / "migrations").apply_pending_migrations(progress=None if args.quiet else _print_progress)
+        AppSettings(db=db).ensure_defaults()
+        init_audit(db_path)
+        return args.func(db, args)
+    except (ValueError, OSError, sqlite3.Error, MigrationError) as e:
+        logger.error(f"{args.command} failed: {e}")
+        return 1
+    finally:
+        shutdown_audit()
+        db.conn.close()
+        shutdown_logging()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
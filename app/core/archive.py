@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import re
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from typing import Iterator, Optional
+
+from app.core.db import Database
+from app.core.logger import get_logger, log_duration
+from app.core.metrics import timed
+from app.core.sync import TABLES as SYNCED_TABLES
+
+# Closed fiscal years move to one SQLite file per year next to the database
+# (archive/app-2023.db). The hot database keeps the rollups, stock ledger and
+# valuation, so summaries and stock are unaffected; the archived rows are only read
+# through history(), which attaches the files and exposes all_<table> union views.
+# Archiving is local to a store: the rows leave change capture with their history.
+ARCHIVE_TABLES = ("documents", "document_lines", "payments", "cash_register")
+_SYNCED = tuple(t for t in ARCHIVE_TABLES if t in SYNCED_TABLES)
+# Indexes created in each archive file
+_ARCHIVE_INDEXES = {
+    "documents": ("kind, date", "partner_id, date"),
+    "document_lines": ("document_id",),
+    "payments": ("document_id",),
+    "cash_register": ("created_at",),
+}
+_FILE_RE = re.compile(r"^app-(\d{4})\.db$")
+
+
+def archive_dir(db: Database) -> Path:
+    if db.path is None:
+        raise ValueError("Archiving needs the database file, not a remote terminal")
+    return Path(db.path).parent / "archive"
+
+
+def archive_path(db: Database, year: int) -> Path:
+    return archive_dir(db) / f"app-{year}.db"
+
+
+def archived_years(db: Database) -> list[int]:
+    return [r["year"] for r in db.query("SELECT year FROM archives ORDER BY year;")]
+
+
+def _year_range(year: int) -> tuple[str, str]:
+    return f"{year:04d}-01-01", f"{year + 1:04d}-01-01"
+
+
+def _selections(year: int) -> dict[str, tuple[str, tuple]]:
+    # WHERE clause (on schema "main") and parameters selecting the rows of the year.
+    # Payments follow their document; unallocated ones go by payment date.
+    start, end = _year_range(year)
+    docs = "SELECT id FROM main.documents WHERE date >= ? AND date < ?"
+    return {
+        "documents": ("date >= ? AND date < ?", (start, end)),
+        "document_lines": (f"document_id IN ({docs})", (start, end)),
+        "payments": (f"document_id IN ({docs}) OR (document_id IS NULL AND paid_at >= ? AND paid_at < ?)", (start, end, start, end)),
+        # The newest movement stays: the running balance trigger chains from it
+        "cash_register": ("created_at >= ? AND created_at < ? AND id < (SELECT MAX(id) FROM main.cash_register)", (start, end)),
+    }
+
+
+def check_closed(db: Database, year: int) -> None:
+    # Raises ValueError when the year still has work in progress
+    if year >= date.today().year:
+        raise ValueError(f"{year} is not a closed fiscal year")
+    start, end = _year_range(year)
+    drafts = db.scalar("SELECT COUNT(*) FROM documents WHERE date >= ? AND date < ? AND status = 'draft';", (start, end))
+    if drafts:
+        raise ValueError(f"{year} still has {drafts} draft documents")
+    unpaid = db.scalar(
+        "SELECT COUNT(*) FROM documents WHERE kind = 'invoice' AND open_balance > 0.005 AND status NOT IN ('draft', 'cancelled') AND date >= ? AND date < ?;",
+        (start, end),
+    )
+    if unpaid:
+        raise ValueError(f"{year} still has {unpaid} invoices with an open balance")
+    closed_until = db.scalar("SELECT IFNULL(MAX(period_end), '') FROM cash_closings;")
+    open_cash = db.scalar("SELECT COUNT(*) FROM cash_register WHERE created_at >= ? AND created_at < ? AND created_at >= ?;", (start, end, closed_until))
+    if open_cash:
+        raise ValueError(f"{year} has {open_cash} cash movements not covered by a closing")
+    selections = _selections(year)
+    for peer in db.query("SELECT store, sent_seq FROM sync_peers ORDER BY store;"):
+        # Changes the peer has not acknowledged would be lost with the change history.
+        # sent_seq only moves when the peer confirms it applied them (app.core.sync).
+        unsent = sum(
+            db.scalar(
+                f"SELECT COUNT(*) FROM change_log WHERE table_name = ? AND seq > ? AND IFNULL(author, '') != ? AND row_id IN (SELECT id FROM main.{table} WHERE {where});",
+                (table, peer["sent_seq"], peer["store"], *params),
+            )
+            for table, (where, params) in selections.items()
+            if table in _SYNCED
+        )
+        if unsent:
+            raise ValueError(f"{year} has {unsent} changes not yet acknowledged by store {peer['store']}: sync first")
+
+
+def _columns(db: Database, schema: str, table: str) -> list[tuple[str, str, int]]:
+    # (name, declared type, primary key position); table_xinfo also lists generated columns
+    return [(r["name"], r["type"], r["pk"]) for r in db.query(f"PRAGMA {schema}.table_xinfo({table});")]
+
+
+def _ensure_archive_table(db: Database, schema: str, table: str) -> list[str]:
+    # Plain copy of the hot table: no foreign keys (the parents stay in the hot
+    # database) and generated columns stored as values. New hot columns are added.
+    hot = _columns(db, "main", table)
+    existing = {c[0] for c in _columns(db, schema, table)}
+    if not existing:
+        cols = ", ".join(f'"{name}" {ctype}' + (" PRIMARY KEY" if pk == 1 else "") for name, ctype, pk in hot)
+        db.execute(f"CREATE TABLE {schema}.{table} ({cols});")
+        for i, index_cols in enumerate(_ARCHIVE_INDEXES.get(table, ())):
+            db.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_{table}_{i} ON {table}({index_cols});")
+    else:
+        for name, ctype, _ in hot:
+            if name not in existing:
+                db.execute(f'ALTER TABLE {schema}.{table} ADD COLUMN "{name}" {ctype};')
+    return [name for name, _, _ in hot]
+
+
+@timed("archive.year")
+def archive_year(db: Database, year: int) -> dict[str, int]:
+    # Copies the year into its archive file (committed first, re-runnable: rows already
+    # there are ignored), checks the copy, then deletes the rows from the hot database
+    # with change capture suspended, along with their change_log and row_versions
+    # entries: an entry left behind would be exported as a deletion of the row. Links
+    # from hot documents to archived ones (source_id) are kept.
+    # Returns the number of rows moved per table.
+    logger = get_logger(__name__)
+    check_closed(db, year)
+    if db.in_transaction:
+        raise ValueError("Cannot archive inside a transaction")
+    path = archive_path(db, year)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    selections = _selections(year)
+    counts: dict[str, int] = {}
+    with log_duration(logger, f"Archive {year}", path=str(path)):
+        db.execute("ATTACH DATABASE ? AS archive_target;", (str(path),))
+        try:
+            with db.transaction():
+                for table in ARCHIVE_TABLES:
+                    cols = ", ".join(f'"{c}"' for c in _ensure_archive_table(db, "archive_target", table))
+                    where, params = selections[table]
+                    db.execute(f"INSERT OR IGNORE INTO archive_target.{table} ({cols}) SELECT {cols} FROM main.{table} WHERE {where};", params)
+            for table in ARCHIVE_TABLES:
+                where, params = selections[table]
+                hot = db.scalar(f"SELECT COUNT(*) FROM main.{table} WHERE {where};", params)
+                copied = db.scalar(f"SELECT COUNT(*) FROM archive_target.{table} WHERE id IN (SELECT id FROM main.{table} WHERE {where});", params)
+                if copied != hot:
+                    raise RuntimeError(f"Archive copy of {table} is incomplete ({copied}/{hot}), nothing was deleted")
+                counts[table] = hot
+            # Hot documents converted from archived ones keep their source_id: without
+            # this, ON DELETE SET NULL would clear it, unseen by change capture. The
+            # pragma is a no-op inside a transaction, hence around it.
+            db.execute("PRAGMA foreign_keys = OFF;")
+            try:
+                with db.transaction():
+                    db.execute("UPDATE cdc_state SET capture = 0 WHERE id = 1;")
+                    try:
+                        for table in _SYNCED:
+                            where, params = selections[table]
+                            for log in ("change_log", "row_versions"):
+                                db.execute(f"DELETE FROM {log} WHERE table_name = ? AND row_id IN (SELECT id FROM main.{table} WHERE {where});", (table, *params))
+                        # Children first: payments and lines, then their documents
+                        for table in ("payments", "document_lines", "documents", "cash_register"):
+                            where, params = selections[table]
+                            db.execute(f"DELETE FROM main.{table} WHERE {where};", params)
+                    finally:
+                        db.execute("UPDATE cdc_state SET capture = 1 WHERE id = 1;")
+                    db.execute(
+                        """
+                        INSERT INTO archives (year, path, documents, document_lines, payments, cash_register) VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(year) DO UPDATE SET documents = documents + excluded.documents, document_lines = document_lines + excluded.document_lines,
+                            payments = payments + excluded.payments, cash_register = cash_register + excluded.cash_register, archived_at = CURRENT_TIMESTAMP;
+                        """,
+                        (year, path.name, counts["documents"], counts["document_lines"], counts["payments"], counts["cash_register"]),
+                    )
+            finally:
+                db.execute("PRAGMA foreign_keys = ON;")
+        finally:
+            db.execute("DETACH DATABASE archive_target;")
+    logger.info(f"Archived {year}: " + ", ".join(f"{n} {t}" for t, n in counts.items()))
+    return counts
+
+
+@contextmanager
+def history(db: Database, years: Optional[list[int]] = None) -> Iterator[list[int]]:
+    # Attaches the archive files (all, or the given years) and creates the temporary
+    # views all_documents, all_document_lines, all_payments and all_cash_register over
+    # the hot tables and the archives. Yields the years attached.
+    wanted = archived_years(db) if years is None else years
+    folder = archive_dir(db)
+    attached: list[int] = []
+    try:
+        for year in wanted:
+            path = folder / f"app-{year}.db"
+            if path.exists():
+                db.execute(f"ATTACH DATABASE ? AS arc_{year:04d};", (str(path),))
+                attached.append(year)
+        for table in ARCHIVE_TABLES:
+            hot = [c[0] for c in _columns(db, "main", table)]
+            parts = [f"SELECT {', '.join(hot)} FROM main.{table}"]
+            for year in attached:
+                have = {c[0] for c in _columns(db, f"arc_{year:04d}", table)}
+                cols = ", ".join(c if c in have else f"NULL AS {c}" for c in hot)
+                parts.append(f"SELECT {cols} FROM arc_{year:04d}.{table}")
+            db.execute(f"DROP VIEW IF EXISTS temp.all_{table};")
+            db.execute(f"CREATE TEMP VIEW all_{table} AS {' UNION ALL '.join(parts)};")
+        yield attached
+    finally:
+        for table in ARCHIVE_TABLES:
+            db.execute(f"DROP VIEW IF EXISTS temp.all_{table};")
+        for year in attached:
+            db.execute(f"DETACH DATABASE arc_{year:04d};")
+
+
+def archive_files(db: Database) -> list[tuple[int, Path]]:
+    folder = archive_dir(db)
+    if not folder.exists():
+        return []
+    return sorted((int(m.group(1)), p) for p in folder.iterdir() if (m := _FILE_RE.match(p.name)))
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+from app.core.db import Database
+from app.core.logger import get_logger
+
+
+_INSERT = "INSERT INTO activity_log (user_id, action, entity, entity_id, details, created_at) VALUES (?, ?, ?, ?, ?, ?);"
+
+
+class AuditLogger:
+    # Business actions are queued by the caller and written by a background
+    # thread in batched transactions, so auditing never adds a commit to the
+    # GUI thread.
+    def __init__(self, db_path: Path, batch_size: int = 200, flush_interval: float = 2.0) -> None:
+        self.db_path = Path(db_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.user_id: Optional[int] = None
+        self.logger = get_logger(__name__)
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def set_user(self, user_id: Optional[int]) -> None:
+        self.user_id = user_id
+
+    def record(self, action: str, entity: Optional[str] = None, entity_id: Optional[int] = None, details: Any = None) -> None:
+        if details is not None and not isinstance(details, str):
+            details = json.dumps(details, ensure_ascii=False, default=str)
+        stamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        self._queue.put((self.user_id, action, entity, entity_id, details, stamp))
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        if self._thread is None:
+            return False
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA busy_timeout = 5000;")
+        batch: list[tuple] = []
+        waiters: list[threading.Event] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = False
+            if item is None:
+                self._write(conn, batch)
+                break
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not False:
+                batch.append(item)
+            if waiters or len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._write(conn, batch)
+                batch = []
+                for w in waiters:
+                    w.set()
+                waiters = []
+                deadline = time.monotonic() + self.flush_interval
+        conn.close()
+
+    def _write(self, conn: sqlite3.Connection, batch: list[tuple]) -> None:
+        if not batch:
+            return
+        try:
+            with conn:
+                conn.executemany(_INSERT, batch)
+        except sqlite3.Error as e:
+            self.logger.error(f"Failed to write {len(batch)} audit entries: {e}")
+
+
+_AUDIT: Optional[AuditLogger] = None
+
+
+def init_audit(db_path: Path, **kwargs) -> AuditLogger:
+    global _AUDIT
+    if _AUDIT is None:
+        _AUDIT = AuditLogger(db_path, **kwargs)
+        _AUDIT.start()
+    return _AUDIT
+
+
+def get_audit() -> Optional[AuditLogger]:
+    return _AUDIT
+
+
+def audit(action: str, entity: Optional[str] = None, entity_id: Optional[int] = None, details: Any = None) -> None:
+    # No-op until init_audit() has been called (e.g. in scripts)
+    if _AUDIT is not None:
+        _AUDIT.record(action, entity, entity_id, details)
+
+
+def set_audit_user(user_id: Optional[int]) -> None:
+    if _AUDIT is not None:
+        _AUDIT.set_user(user_id)
+
+
+def shutdown_audit() -> None:
+    global _AUDIT
+    if _AUDIT is not None:
+        _AUDIT.close()
+        _AUDIT = None
+
+
+def query_activity(
+    db: Database,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    entity: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    limit: int = 100,
+) -> list[dict]:
+    # Newest first; pass the last id of a page as before_id to get the next one
+    where = []
+    params: list = []
+    if start:
+        where.append("a.created_at >= ?")
+        params.append(start)
+    if end:
+        where.append("a.created_at < ?")
+        params.append(end)
+    if entity:
+        where.append("a.entity = ?")
+        params.append(entity)
+    if entity_id is not None:
+        where.append("a.entity_id = ?")
+        params.append(entity_id)
+    if user_id is not None:
+        where.append("a.user_id = ?")
+        params.append(user_id)
+    if before_id is not None:
+        where.append("a.id < ?")
+        params.append(before_id)
+    sql = "SELECT a.id, a.created_at, a.user_id, IFNULL(u.username, '') AS username, a.action, a.entity, a.entity_id, a.details FROM activity_log a LEFT JOIN users u ON u.id = a.user_id"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY a.id DESC LIMIT ?;"
+    params.append(limit)
+    return [dict(r) for r in db.query(sql, params)]
+
+
+def audited_entities(db: Database) -> list[str]:
+    return [r[0] for r in db.query("SELECT DISTINCT entity FROM activity_log WHERE entity IS NOT NULL ORDER BY entity;")]
@@ -1,12 +1,111 @@
 from __future__ import annotations
 
-import bcrypt
+import os
+import threading
+import time
+from collections import OrderedDict, deque
 from typing import Optional
+
+import bcrypt
 from app.core.db import Database
+from app.core.logger import get_logger
+
+# bcrypt work factor: each step doubles the time of a hash. The policy lives in the
+# settings (bcrypt_rounds) and can be forced with APP_BCRYPT_ROUNDS; hashes made with
+# another cost are upgraded on the next successful login.
+DEFAULT_ROUNDS = 12
+MIN_ROUNDS = 4
+MAX_ROUNDS = 16
+# Salt and digest of a hash no password matches, checked at the policy cost for
+# unknown or inactive usernames so a login takes as long whether the user exists or not
+_DECOY = "/OOXIoSvA9AzqySyRNis9O3K3tyk9TUvt1m30Q7hGf48yFcgz6fSe"
+
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Too many failed attempts, retry in {retry_after:.0f} s")
+        self.retry_after = retry_after
+
+
+class LoginThrottle:
+    # Failed attempts per username in a sliding window. Once max_failures is reached the
+    # username is locked for lockout seconds, doubled on each new lock (capped), and the
+    # attempt is rejected before bcrypt runs. The cache is bounded so random usernames
+    # cannot grow it without limit.
+    def __init__(self, max_failures: int = 5, window: float = 300.0, lockout: float = 30.0, max_lockout: float = 900.0, max_entries: int = 1024) -> None:
+        self.max_failures = max_failures
+        self.window = window
+        self.lockout = lockout
+        self.max_lockout = max_lockout
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # username -> [failure times, locked until, lock count]
+        self._entries: OrderedDict[str, list] = OrderedDict()
+
+    @staticmethod
+    def _key(username: str) -> str:
+        return username.strip().lower()
+
+    def retry_after(self, username: str, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(self._key(username))
+            if entry is None:
+                return 0.0
+            return max(0.0, entry[1] - now)
+
+    def check(self, username: str) -> None:
+        wait = self.retry_after(username)
+        if wait > 0:
+            raise LoginThrottled(wait)
+
+    def failure(self, username: str, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        key = self._key(username)
+        with self._lock:
+            entry = self._entries.pop(key, None) or [deque(), 0.0, 0]
+            self._entries[key] = entry
+            failures = entry[0]
+            failures.append(now)
+            while failures and failures[0] < now - self.window:
+                failures.popleft()
+            if len(failures) >= self.max_failures:
+                entry[1] = now + min(self.lockout * 2 ** entry[2], self.max_lockout)
+                entry[2] += 1
+                failures.clear()
+                get_logger(__name__).warning(f"Login locked for {username!r} after repeated failures")
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def success(self, username: str) -> None:
+        with self._lock:
+            self._entries.pop(self._key(username), None)
+
+
+THROTTLE = LoginThrottle()
 
 
-def hash_password(password: str) -> bytes:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+def password_rounds(db: Optional[Database] = None) -> int:
+    value = os.getenv("APP_BCRYPT_ROUNDS")
+    if not value and db is not None:
+        value = db.scalar("SELECT value FROM settings WHERE key = 'bcrypt_rounds';")
+    try:
+        rounds = int(value) if value else DEFAULT_ROUNDS
+    except ValueError:
+        rounds = DEFAULT_ROUNDS
+    return min(max(rounds, MIN_ROUNDS), MAX_ROUNDS)
+
+
+def hash_rounds(hashed: bytes) -> Optional[int]:
+    # "$2b$12$..." -> 12
+    try:
+        return int(bytes(hashed).split(b"$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def hash_password(password: str, rounds: int = DEFAULT_ROUNDS) -> bytes:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds))
 
 
 def verify_password(password: str, hashed: bytes) -> bool:
@@ -16,13 +115,27 @@ def verify_password(password: str, hashed: bytes) -> bool:
         return False
 
 
+def decoy_hash(rounds: int) -> bytes:
+    return f"$2b${rounds:02d}${_DECOY}".encode("ascii")
+
+
+def verify_and_rehash(password: str, hashed: bytes, rounds: int) -> tuple[bool, Optional[bytes]]:
+    # CPU-bound and free of database access: safe to run in a worker thread.
+    # Returns (valid, new hash when the stored cost differs from the policy).
+    if not verify_password(password, hashed):
+        return False, None
+    if hash_rounds(hashed) != rounds:
+        return True, hash_password(password, rounds)
+    return True, None
+
+
 def ensure_bootstrap_admin(db: Database) -> None:
     # Create default roles
     db.execute(
         """
         INSERT OR IGNORE INTO roles (code, label)
-        VALUES 
-        ('admin', 'Administrateur'), 
+        VALUES
+        ('admin', 'Administrateur'),
         ('sales', 'Commercial'),
         ('stock', 'Stock'),
         ('account', 'Comptable');
@@ -31,25 +144,37 @@ def ensure_bootstrap_admin(db: Database) -> None:
     # Create default admin user (admin/admin) if none exists
     row = db.scalar("SELECT COUNT(1) FROM users;")
     if not row:
-        pwd = hash_password("admin")
+        pwd = hash_password("admin", password_rounds(db))
         db.execute(
             "INSERT INTO users (username, password_hash, role_code, is_active) VALUES (?, ?, ?, 1);",
             ("admin", pwd, "admin"),
         )
 
 
-def authenticate(db: Database, username: str, password: str) -> Optional[dict]:
+def find_login(db: Database, username: str, throttle: LoginThrottle = THROTTLE) -> dict:
+    # First, cheap half of a login: raises LoginThrottled during a lockout, otherwise
+    # returns what verify_and_rehash needs. Unknown or inactive users get a decoy (id
+    # None, decoy_hash) that costs the same bcrypt and never logs in.
+    throttle.check(username)
     rows = db.query("SELECT id, username, password_hash, role_code, is_active FROM users WHERE username = ?;", (username,))
-    if not rows:
-        return None
+    if not rows or not rows[0]["is_active"]:
+        return {"id": None, "username": username, "role": None, "password_hash": decoy_hash(password_rounds(db))}
     row = rows[0]
-    if not row["is_active"]:
+    return {"id": row["id"], "username": row["username"], "role": row["role_code"], "password_hash": row["password_hash"]}
+
+
+def complete_login(db: Database, login: dict, valid: bool, new_hash: Optional[bytes] = None, throttle: LoginThrottle = THROTTLE) -> Optional[dict]:
+    if not valid or login["id"] is None:
+        throttle.failure(login["username"])
         return None
-    if verify_password(password, row["password_hash"]):
-        return {
-            "id": row["id"],
-            "username": row["username"],
-            "role": row["role_code"],
-        }
-    return None
+    throttle.success(login["username"])
+    if new_hash is not None:
+        db.execute("UPDATE users SET password_hash = ? WHERE id = ?;", (new_hash, login["id"]))
+        get_logger(__name__).info(f"Password hash of {login['username']!r} upgraded to cost {hash_rounds(new_hash)}")
+    return {"id": login["id"], "username": login["username"], "role": login["role"]}
+
 
+def authenticate(db: Database, username: str, password: str, throttle: LoginThrottle = THROTTLE) -> Optional[dict]:
+    login = find_login(db, username, throttle)
+    valid, new_hash = verify_and_rehash(password, login["password_hash"], password_rounds(db))
+    return complete_login(db, login, valid, new_hash, throttle)
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import http.client
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional, Sequence, Union
+from urllib.parse import urlencode, urlsplit
+
+from app.core.db import CommitHook, Database, write_target
+from app.core.service import decode_value, encode_value
+
+
+class RemoteRow(Sequence):
+    # Behaves like sqlite3.Row: row["col"], row[0], keys(), dict(row), tuple(row)
+    __slots__ = ("_index", "_values")
+
+    def __init__(self, index: dict[str, int], values: list) -> None:
+        self._index = index
+        self._values = values
+
+    def keys(self) -> list[str]:
+        return list(self._index)
+
+    def __getitem__(self, key: Union[int, str, slice]) -> Any:
+        if isinstance(key, str):
+            try:
+                return self._values[self._index[key]]
+            except KeyError:
+                raise IndexError(f"No item with that key: {key}")
+        return self._values[key]
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._values)
+
+
+class RemoteCursor:
+    def __init__(self, lastrowid: Optional[int], rowcount: int) -> None:
+        self.lastrowid = lastrowid
+        self.rowcount = rowcount
+
+
+_ERRORS = {409: sqlite3.IntegrityError, 400: sqlite3.OperationalError}
+
+
+class RemoteDatabase:
+    # Same surface as Database, served by app.core.service; views and core
+    # functions run unchanged on top of it.
+    def __init__(self, url: str, token: str, timeout: float = 30.0) -> None:
+        parts = urlsplit(url)
+        self.url = url
+        self.path: Optional[Path] = None
+        self._host = parts.hostname or "127.0.0.1"
+        self._port = parts.port or 8765
+        self._token = token
+        self._timeout = timeout
+        self._local = threading.local()
+        self._tx: Optional[str] = None
+        self._tx_depth = 0
+        self.commit_hooks: list[CommitHook] = []
+        self._written: set[str] = set()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        raise RuntimeError("No direct connection through the service; run this on the server")
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+            self._local.conn = conn
+        return conn
+
+    def _request(self, method: str, path: str, payload: Any = None) -> Any:
+        headers = {"Authorization": f"Bearer {self._token}", "Content-Type": "application/json"}
+        if self._tx:
+            headers["X-Transaction"] = self._tx
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        for attempt in (0, 1):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body, headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # Kept-alive connection closed by the server: the request was not processed, retry once
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        result = json.loads(data) if data else {}
+        if resp.status >= 400:
+            raise _ERRORS.get(resp.status, sqlite3.DatabaseError)(result.get("error", f"HTTP {resp.status}"))
+        return result
+
+    @staticmethod
+    def _params(params: Any) -> Any:
+        if isinstance(params, dict):
+            return {k: encode_value(v) for k, v in params.items()}
+        return [encode_value(v) for v in params or []]
+
+    @contextmanager
+    def transaction(self) -> Iterator["RemoteDatabase"]:
+        # Server-side transaction; the service holds its single writer for us until commit
+        if not self._tx_depth:
+            self._tx = self._request("POST", "/tx/begin")["tx"]
+        self._tx_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._tx_depth -= 1
+            if not self._tx_depth:
+                self._written.clear()
+                try:
+                    self._request("POST", "/tx/rollback")
+                finally:
+                    self._tx = None
+            raise
+        else:
+            self._tx_depth -= 1
+            if not self._tx_depth:
+                try:
+                    self._request("POST", "/tx/commit")
+                finally:
+                    self._tx = None
+                self._notify()
+
+    def _track(self, sql: str) -> None:
+        if self.commit_hooks:
+            table = write_target(sql)
+            if table is not None:
+                self._written.add(table)
+
+    def _notify(self) -> None:
+        if not self._written:
+            return
+        tables, self._written = self._written, set()
+        for hook in list(self.commit_hooks):
+            hook(tables)
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._tx_depth > 0
+
+    def execute(self, sql: str, params: Optional[Sequence[Any]] = None) -> RemoteCursor:
+        result = self._request("POST", "/sql/execute", {"statements": [[sql, self._params(params)]]})["results"][0]
+        self._track(sql)
+        if not self._tx_depth:
+            self._notify()
+        return RemoteCursor(result["lastrowid"], result["rowcount"])
+
+    def executemany(self, sql: str, seq_of_params: Iterable[Sequence[Any]]) -> RemoteCursor:
+        statements = [[sql, self._params(p)] for p in seq_of_params]
+        results = self._request("POST", "/sql/execute", {"statements": statements})["results"]
+        self._track(sql)
+        if not self._tx_depth:
+            self._notify()
+        return RemoteCursor(results[-1]["lastrowid"] if results else None, sum(r["rowcount"] for r in results))
+
+    def query(self, sql: str, params: Optional[Sequence[Any]] = None) -> list[RemoteRow]:
+        result = self._request("POST", "/sql/query", {"sql": sql, "params": self._params(params)})
+        index = {name: i for i, name in enumerate(result["columns"])}
+        return [RemoteRow(index, [decode_value(v) for v in row]) for row in result["rows"]]
+
+    def iter_query(self, sql: str, params: Optional[Sequence[Any]] = None, size: int = 500) -> Iterator[RemoteRow]:
+        yield from self.query(sql, params)
+
+    def scalar(self, sql: str, params: Optional[Sequence[Any]] = None) -> Any:
+        row = self.query(sql, params)
+        if not row:
+            return None
+        return row[0][0]
+
+    def get(self, resource: str, item_id: Optional[int] = None, **filters: Any) -> Any:
+        # Paginated resource endpoints: get("products", search="vis", limit=50, after=...)
+        query = urlencode({k: v for k, v in filters.items() if v is not None})
+        path = f"/{resource}" + (f"/{item_id}" if item_id is not None else "")
+        return self._request("GET", path + (f"?{query}" if query else ""))
+
+
+def open_database(db_path: Path) -> Union[Database, RemoteDatabase]:
+    # APP_SERVER_URL points the terminal at a shared service instead of a local file
+    url = os.getenv("APP_SERVER_URL")
+    if url:
+        return RemoteDatabase(url, os.getenv("APP_SERVER_TOKEN", ""))
+    return Database(db_path)
@@ -0,0 +1,352 @@
+from __future__ import annotations
+
+import heapq
+import sqlite3
+import threading
+import unicodedata
+import weakref
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+
+from app.core.changes import change_bus
+from app.core.db import Database
+from app.core.logger import get_logger, log_duration
+from app.core.metrics import REGISTRY, timed
+
+
+@dataclass(slots=True)
+class CatalogEntry:
+    id: int
+    sku: str
+    barcode: Optional[str]
+    name: str
+    name_ar: str
+    price_ht: float
+    vat_rate: float
+    stock: float
+
+
+_SELECT = """
+SELECT p.id, p.sku, p.barcode, p.name_fr, p.name_ar, p.price_ht, p.vat_rate, IFNULL(s.qty, 0) AS stock
+FROM products p
+LEFT JOIN stock s ON s.product_id = p.id
+"""
+
+# Arabic letter variants typed interchangeably
+_ARABIC = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ة": "ه", "ـ": None})
+
+
+def fold(text: str) -> str:
+    # Case, accents (French) and harakat (Arabic) are ignored when searching
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).translate(_ARABIC).casefold()
+
+
+def _tokens(entry: CatalogEntry) -> set[str]:
+    words = {fold(entry.sku)}
+    words.update(fold(entry.name).split())
+    words.update(fold(entry.name_ar).split())
+    return words
+
+
+class PrefixIndex:
+    # Sorted vocabulary of folded words (SKU, French and Arabic name words), each with
+    # the sorted ids of the products containing it. A prefix is a bisect range in the
+    # vocabulary. A narrow range merges its posting lists in id order; a wide one (a
+    # letter or two matching thousands of SKUs) is walked in word order and stops at
+    # the limit, so a keystroke never costs more than MAX_LISTS lists or MAX_SCAN ids.
+    MAX_SCAN = 5000
+    MAX_LISTS = 64
+
+    def __init__(self) -> None:
+        self.words: list[str] = []
+        self.postings: dict[str, list[int]] = {}
+
+    @classmethod
+    def build(cls, postings: dict[str, list[int]]) -> "PrefixIndex":
+        # postings must already be sorted (products read in id order)
+        index = cls()
+        index.postings = postings
+        index.words = sorted(postings)
+        return index
+
+    def add(self, product_id: int, tokens: Iterable[str]) -> None:
+        for word in tokens:
+            ids = self.postings.get(word)
+            if ids is None:
+                self.postings[word] = [product_id]
+                insort(self.words, word)
+            else:
+                i = bisect_left(ids, product_id)
+                if i == len(ids) or ids[i] != product_id:
+                    ids.insert(i, product_id)
+
+    def remove(self, product_id: int, tokens: Iterable[str]) -> None:
+        for word in tokens:
+            ids = self.postings.get(word)
+            if ids is None:
+                continue
+            i = bisect_left(ids, product_id)
+            if i < len(ids) and ids[i] == product_id:
+                del ids[i]
+            if not ids:
+                del self.postings[word]
+                del self.words[bisect_left(self.words, word)]
+
+    def _range(self, prefix: str) -> range:
+        start = bisect_left(self.words, prefix)
+        # Every word with this prefix sorts before prefix + U+10FFFF
+        return range(start, bisect_left(self.words, prefix + "\U0010ffff", start))
+
+    def _cost(self, words: range) -> int:
+        # Ids to merge for a narrow range; a wide range is only bounded below by its size
+        if len(words) > self.MAX_LISTS:
+            return len(words)
+        return sum(len(self.postings[self.words[i]]) for i in words)
+
+    def _ids(self, words: range) -> Iterator[int]:
+        if len(words) <= self.MAX_LISTS:
+            return heapq.merge(*(self.postings[self.words[i]] for i in words))
+        return (product_id for i in words for product_id in self.postings[self.words[i]])
+
+    def search(self, terms: list[str], limit: int, accept=None) -> list[int]:
+        # The cheapest term drives the scan; accept(id) filters on the others.
+        # Returns ids in ascending order.
+        if not terms:
+            return []
+        driver = min((self._range(t) for t in terms), key=self._cost)
+        results: set[int] = set()
+        seen: set[int] = set()
+        for product_id in islice(self._ids(driver), self.MAX_SCAN):
+            if product_id in seen:
+                continue
+            seen.add(product_id)
+            if accept is None or accept(product_id):
+                results.add(product_id)
+                if len(results) >= limit:
+                    break
+        return sorted(results)
+
+
+class Catalog:
+    # In-memory product index for scanning and autocomplete: hash lookups by barcode and
+    # SKU, prefix search on SKU and names, no SQL. refresh() applies product changes
+    # recorded in change_log since the last call; stock is not in change_log, so it is
+    # reloaded when another connection wrote (PRAGMA data_version) and adjusted in
+    # place by writers on this connection. In the application it follows the change
+    # bus instead (follow_changes).
+    def __init__(self, db: Database) -> None:
+        self.db = db
+        self._by_id: dict[int, CatalogEntry] = {}
+        self._by_code: dict[str, int] = {}
+        self._prefix = PrefixIndex()
+        self._seq = 0
+        self._data_version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._loader: Optional[threading.Thread] = None
+        self.logger = get_logger(__name__)
+        self.loaded = False
+        self._following = False
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    @staticmethod
+    def _key(code: str) -> str:
+        return code.strip().upper()
+
+    def _index(self, entry: CatalogEntry) -> None:
+        old = self._by_id.get(entry.id)
+        if old is not None:
+            self._unindex(old)
+        self._by_id[entry.id] = entry
+        self._by_code[self._key(entry.sku)] = entry.id
+        if entry.barcode:
+            self._by_code[self._key(entry.barcode)] = entry.id
+        self._prefix.add(entry.id, _tokens(entry))
+
+    def _unindex(self, entry: CatalogEntry) -> None:
+        for code in (entry.sku, entry.barcode):
+            if code and self._by_code.get(self._key(code)) == entry.id:
+                del self._by_code[self._key(code)]
+        self._prefix.remove(entry.id, _tokens(entry))
+
+    @staticmethod
+    def _entry(row) -> CatalogEntry:
+        return CatalogEntry(row["id"], row["sku"], row["barcode"], row["name_fr"], row["name_ar"] or "", row["price_ht"], row["vat_rate"], row["stock"])
+
+    def _local_version(self) -> Optional[int]:
+        # Only meaningful on a local file; a remote terminal reloads stock on every refresh
+        return self.db.scalar("PRAGMA data_version;") if self.db.path is not None else None
+
+    def _read_all(self) -> Iterator:
+        if self.db.path is None or threading.current_thread() is threading.main_thread():
+            yield from self.db.iter_query(_SELECT + " ORDER BY p.id", size=2000)
+            return
+        # Background load: SQLite connections are not shared between threads
+        conn = sqlite3.connect(f"file:{self.db.path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield from conn.execute(_SELECT + " ORDER BY p.id")
+        finally:
+            conn.close()
+
+    def load(self) -> None:
+        seq = self.db.scalar("SELECT IFNULL(MAX(seq), 0) FROM change_log;")
+        self._build(seq)
+
+    def _build(self, seq: int) -> None:
+        # Built aside and swapped in, so lookups keep working on the previous state
+        by_id: dict[int, CatalogEntry] = {}
+        by_code: dict[str, int] = {}
+        postings: dict[str, list[int]] = {}
+        with log_duration(self.logger, "Catalog load"):
+            for row in self._read_all():
+                entry = self._entry(row)
+                by_id[entry.id] = entry
+                by_code[self._key(entry.sku)] = entry.id
+                if entry.barcode:
+                    by_code[self._key(entry.barcode)] = entry.id
+                for word in _tokens(entry):
+                    ids = postings.get(word)
+                    if ids is None:
+                        postings[word] = [entry.id]
+                    else:
+                        ids.append(entry.id)
+            prefix = PrefixIndex.build(postings)
+        with self._lock:
+            self._by_id, self._by_code, self._prefix = by_id, by_code, prefix
+            self._seq = seq
+            self._data_version = None
+            self.loaded = True
+        REGISTRY.set_gauge("catalog.products", len(by_id))
+
+    def start_background_load(self) -> None:
+        # Called at startup; refresh() and search() stay no-ops until it completes.
+        # The change_log position is taken first, so edits made during the load are
+        # picked up by the next refresh().
+        if self.loaded or (self._loader is not None and self._loader.is_alive()):
+            return
+        seq = self.db.scalar("SELECT IFNULL(MAX(seq), 0) FROM change_log;")
+        self._loader = threading.Thread(target=self._build, args=(seq,), name="catalog-loader", daemon=True)
+        self._loader.start()
+
+    def ensure_loaded(self) -> None:
+        # Waits for the background load when one is running
+        if self.loaded:
+            return
+        if self._loader is not None and self._loader.is_alive():
+            self._loader.join()
+        if not self.loaded:
+            self.load()
+
+    def refresh(self) -> int:
+        # Returns the number of products reloaded
+        if not self.loaded:
+            if self._loader is not None and self._loader.is_alive():
+                return 0
+            self.load()
+            return len(self._by_id)
+        ids = [r[0] for r in self.db.query("SELECT DISTINCT row_id FROM change_log WHERE seq > ? AND table_name = 'products';", (self._seq,))]
+        self._seq = self.db.scalar("SELECT IFNULL(MAX(seq), ?) FROM change_log;", (self._seq,))
+        if ids:
+            self.reload(ids)
+        version = self._local_version()
+        if version is None or version != self._data_version:
+            self._data_version = version
+            for row in self.db.query("SELECT product_id, qty FROM stock;"):
+                entry = self._by_id.get(row["product_id"])
+                if entry is not None:
+                    entry.stock = row["qty"]
+        return len(ids)
+
+    def reload(self, ids: Iterable[int]) -> None:
+        ids = list(ids)
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                found = set()
+                for row in self.db.query(f"{_SELECT} WHERE p.id IN ({', '.join('?' for _ in chunk)});", chunk):
+                    self._index(self._entry(row))
+                    found.add(row["id"])
+                for product_id in set(chunk) - found:
+                    entry = self._by_id.pop(product_id, None)
+                    if entry is not None:
+                        self._unindex(entry)
+
+    def follow_changes(self) -> None:
+        # From now on the change bus re-reads the products and stock that changed, and
+        # adjust_stock() is left to it
+        if not self._following:
+            change_bus(self.db).subscribe(("products", "stock"), self.apply_changes)
+            self._following = True
+
+    def apply_changes(self, changes: dict) -> None:
+        # Change bus subscriber (app.core.changes): products and stock rows by id, or
+        # everything when the ids are unknown
+        if not self.loaded:
+            return
+        products = changes.get("products", frozenset())
+        if products is None:
+            self.load()
+        elif products:
+            self.reload(products)
+        stock = changes.get("stock", frozenset())
+        if stock is None or len(stock) > 500:
+            rows = self.db.query("SELECT product_id, qty FROM stock;")
+        elif stock:
+            rows = self.db.query(f"SELECT product_id, qty FROM stock WHERE product_id IN ({', '.join('?' for _ in stock)});", tuple(stock))
+        else:
+            rows = []
+        for row in rows:
+            entry = self._by_id.get(row["product_id"])
+            if entry is not None:
+                entry.stock = row["qty"]
+
+    def lookup(self, code: str) -> Optional[CatalogEntry]:
+        product_id = self._by_code.get(self._key(code))
+        return self._by_id.get(product_id) if product_id is not None else None
+
+    def get(self, product_id: int) -> Optional[CatalogEntry]:
+        return self._by_id.get(product_id)
+
+    @timed("catalog.search")
+    def search(self, text: str, limit: int = 20) -> list[CatalogEntry]:
+        # Every word typed must start a word of the SKU or names: "lam gra" finds "Grande lampe"
+        terms = fold(text).split()
+        if not terms or not self.loaded:
+            return []
+        exact = self.lookup(text)
+
+        def accept(product_id: int) -> bool:
+            if len(terms) == 1:
+                return True
+            words = _tokens(self._by_id[product_id])
+            return all(any(w.startswith(t) for w in words) for t in terms)
+
+        with self._lock:
+            ids = self._prefix.search(terms, limit, accept)
+            results = [self._by_id[i] for i in ids]
+        if exact is not None:
+            results = [exact] + [e for e in results if e.id != exact.id][: limit - 1]
+        return results
+
+    def adjust_stock(self, product_id: int, delta: float) -> None:
+        if self._following:
+            return
+        entry = self._by_id.get(product_id)
+        if entry is not None:
+            entry.stock += delta
+
+
+_SHARED: "weakref.WeakKeyDictionary[Database, Catalog]" = weakref.WeakKeyDictionary()
+
+
+def shared_catalog(db: Database) -> Catalog:
+    # One catalog per database for every view that scans or searches products
+    catalog = _SHARED.get(db)
+    if catalog is None:
+        catalog = _SHARED[db] = Catalog(db)
+    return catalog
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import weakref
+from typing import Callable, Iterable, Optional
+
+from app.core.db import Database
+from app.core.logger import get_logger
+from app.core.metrics import REGISTRY, timed
+from app.core.sync import TABLES as CAPTURED_TABLES
+
+# Per-table change events for views and caches. Commits on this connection arrive
+# through the Database write path (commit_hooks); commits from other connections
+# (the service, a second instance, sync) are picked up by poll(), which only reads
+# anything when PRAGMA data_version moved. Subscribers get {table: row ids}, or
+# {table: None} when the rows are unknown and the table should be reloaded:
+# - synced tables: ids from change_log (None while capture is suspended)
+# - ledgers: the rows past the last id seen; stock and stock_valuation follow the
+#   products of the new stock moves
+# - anything else written on this connection: None. Other connections' writes to
+#   those tables are not seen.
+Changes = dict[str, Optional[frozenset[int]]]
+Subscriber = Callable[[Changes], None]
+
+_LEDGERS = ("stock_moves", "cash_register")
+# Append-only tables without an integer key of interest (reported without ids)
+_APPENDED = ("cash_closings",)
+_STOCK_TABLES = ("stock", "stock_valuation")
+# Bookkeeping written alongside every change
+_IGNORED = {"change_log", "row_versions"}
+
+
+class ChangeBus:
+    def __init__(self, db: Database) -> None:
+        self.db = db
+        self.logger = get_logger(__name__)
+        self._subscribers: list[tuple[frozenset[str], Subscriber]] = []
+        self._seq = db.scalar("SELECT IFNULL(MAX(seq), 0) FROM change_log;")
+        self._marks = {t: db.scalar(f"SELECT IFNULL(MAX(rowid), 0) FROM {t};") for t in _LEDGERS + _APPENDED}
+        self._data_version = self._local_version()
+        db.commit_hooks.append(self._on_commit)
+
+    def subscribe(self, tables: Iterable[str], callback: Subscriber) -> Callable[[], None]:
+        # Returns the function that unsubscribes
+        entry = (frozenset(tables), callback)
+        self._subscribers.append(entry)
+
+        def unsubscribe() -> None:
+            if entry in self._subscribers:
+                self._subscribers.remove(entry)
+
+        return unsubscribe
+
+    def _local_version(self) -> Optional[int]:
+        # Only meaningful on a local file; through the service every poll reads the deltas
+        return self.db.scalar("PRAGMA data_version;") if self.db.path is not None else None
+
+    def _collect(self, written: Optional[set[str]]) -> dict[str, Optional[set[int]]]:
+        # written: tables written on this connection, None for another connection's commit
+        changes: dict[str, Optional[set[int]]] = {}
+        if written is None or written & CAPTURED_TABLES.keys():
+            rows = self.db.query("SELECT seq, table_name, row_id FROM change_log WHERE seq > ? ORDER BY seq;", (self._seq,))
+            for r in rows:
+                changes.setdefault(r["table_name"], set()).add(r["row_id"])
+            if rows:
+                self._seq = rows[-1]["seq"]
+        products: set[int] = set()
+        for table in _LEDGERS:
+            if written is not None and table not in written:
+                continue
+            column = "product_id" if table == "stock_moves" else "NULL"
+            rows = self.db.query(f"SELECT id, {column} AS product_id FROM {table} WHERE id > ? ORDER BY id;", (self._marks[table],))
+            if rows:
+                self._marks[table] = rows[-1]["id"]
+                changes[table] = {r["id"] for r in rows}
+                if table == "stock_moves":
+                    products.update(r["product_id"] for r in rows)
+        for table in _APPENDED:
+            if written is not None and table not in written:
+                continue
+            mark = self.db.scalar(f"SELECT IFNULL(MAX(rowid), 0) FROM {table};")
+            if mark != self._marks[table]:
+                self._marks[table] = mark
+                changes[table] = None
+        for table in _STOCK_TABLES:
+            if products:
+                changes[table] = set(products)
+            if written is not None and table in written and not products:
+                changes[table] = None
+        for table in written or ():
+            if table not in changes and table not in _IGNORED:
+                # Captured table written with capture suspended, or an untracked table
+                changes[table] = None
+        return changes
+
+    def _publish(self, changes: dict[str, Optional[set[int]]]) -> None:
+        if not changes:
+            return
+        REGISTRY.inc("changes.events")
+        frozen = {t: frozenset(ids) if ids is not None else None for t, ids in changes.items()}
+        for tables, callback in list(self._subscribers):
+            wanted = {t: ids for t, ids in frozen.items() if t in tables}
+            if not wanted:
+                continue
+            try:
+                callback(wanted)
+            except Exception:
+                # A failing view must not break the write that notified it
+                self.logger.exception(f"Change subscriber failed for {sorted(wanted)}")
+
+    def _on_commit(self, written: set[str]) -> None:
+        self._publish(self._collect(written))
+
+    @timed("changes.poll")
+    def poll(self) -> int:
+        # Publishes what other connections committed since the last poll. Called from a
+        # timer; returns the number of tables reported.
+        version = self._local_version()
+        if version is not None and version == self._data_version:
+            return 0
+        self._data_version = version
+        changes = self._collect(None)
+        self._publish(changes)
+        return len(changes)
+
+
+_SHARED: "weakref.WeakKeyDictionary[Database, ChangeBus]" = weakref.WeakKeyDictionary()
+
+
+def change_bus(db: Database) -> ChangeBus:
+    # One bus per database, shared by the views and caches
+    bus = _SHARED.get(db)
+    if bus is None:
+        bus = _SHARED[db] = ChangeBus(db)
+    return bus
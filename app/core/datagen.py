@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Callable, Optional
+
+from app.core.db import Database
+from app.core.logger import get_logger, log_duration
+from app.core import rollups, valuation
+
+
+@dataclass(frozen=True)
+class Scale:
+    products: int
+    clients: int
+    suppliers: int
+    documents: int
+    lines: int
+    payments: int
+    cash_movements: int
+
+
+SCALES = {
+    "tiny": Scale(products=200, clients=100, suppliers=20, documents=1_000, lines=5_000, payments=500, cash_movements=200),
+    "small": Scale(products=5_000, clients=2_000, suppliers=200, documents=20_000, lines=100_000, payments=20_000, cash_movements=2_000),
+    "medium": Scale(products=50_000, clients=20_000, suppliers=1_000, documents=100_000, lines=1_000_000, payments=200_000, cash_movements=10_000),
+    "large": Scale(products=500_000, clients=50_000, suppliers=5_000, documents=1_000_000, lines=10_000_000, payments=2_000_000, cash_movements=50_000),
+}
+
+# Dates are spread from a fixed day rather than today so two runs with the same seed are identical
+START_DATE = date(2023, 1, 1)
+DAYS = 3 * 365
+CHUNK = 10_000
+
+# (kind, number prefix, share)
+_KINDS = (("invoice", "INV-", 0.60), ("delivery", "BL-", 0.15), ("quote", "QTE-", 0.15), ("purchase", "PUR-", 0.10))
+
+# French first names with their Arabic spelling
+_FIRST = (
+    ("Jean", "جان"), ("Marie", "ماري"), ("Pierre", "بيير"), ("Sophie", "صوفي"), ("Luc", "لوك"),
+    ("Camille", "كاميل"), ("Nicolas", "نيكولا"), ("Julie", "جولي"), ("Antoine", "أنطوان"), ("Claire", "كلير"),
+    ("Karim", "كريم"), ("Yasmine", "ياسمين"), ("Mehdi", "مهدي"), ("Sarah", "سارة"), ("Hugo", "هوغو"),
+    ("Léa", "ليا"), ("Mohamed", "محمد"), ("Fatima", "فاطمة"), ("Omar", "عمر"), ("Amina", "أمينة"),
+)
+_LAST = (
+    ("Martin", "مارتن"), ("Bernard", "برنار"), ("Dubois", "دوبوا"), ("Thomas", "توما"), ("Robert", "روبير"),
+    ("Richard", "ريشار"), ("Petit", "بوتي"), ("Durand", "دوران"), ("Leroy", "لوروا"), ("Moreau", "مورو"),
+    ("Benali", "بن علي"), ("Haddad", "حداد"), ("Mansouri", "منصوري"), ("Bouzid", "بوزيد"), ("Lefèvre", "لوفيفر"),
+    ("Girard", "جيرار"), ("Roux", "رو"), ("Fontaine", "فونتين"), ("Chevalier", "شوفالييه"), ("Benmoussa", "بن موسى"),
+)
+_COMPANY = (("SARL", "ش.ذ.م.م"), ("SA", "ش.م"), ("& Fils", "وأبناؤه"), ("Distribution", "للتوزيع"), ("Import-Export", "للاستيراد والتصدير"))
+_CITIES = ("Paris", "Lyon", "Marseille", "Lille", "Casablanca", "Rabat", "Tunis", "Alger", "Nantes", "Toulouse")
+_NOUNS = (
+    ("Chaise", "كرسي"), ("Table", "طاولة"), ("Lampe", "مصباح"), ("Câble", "كابل"), ("Clavier", "لوحة مفاتيح"),
+    ("Écran", "شاشة"), ("Cahier", "دفتر"), ("Stylo", "قلم"), ("Carton", "كرتون"), ("Savon", "صابون"),
+    ("Huile", "زيت"), ("Café", "قهوة"), ("Thé", "شاي"), ("Riz", "أرز"), ("Farine", "دقيق"),
+    ("Sucre", "سكر"), ("Ampoule", "مصباح كهربائي"), ("Tuyau", "أنبوب"), ("Peinture", "طلاء"), ("Vis", "برغي"),
+)
+_ADJECTIVES = (
+    ("standard", "عادي"), ("premium", "ممتاز"), ("grand", "كبير"), ("petit", "صغير"), ("bleu", "أزرق"),
+    ("rouge", "أحمر"), ("blanc", "أبيض"), ("noir", "أسود"), ("pro", "احترافي"), ("éco", "اقتصادي"),
+)
+_UNITS = ("u", "u", "u", "kg", "l", "m", "carton")
+_VAT_RATES = (20.0, 20.0, 20.0, 10.0, 5.5)
+_METHODS = ("cash", "cash", "card", "transfer", "check")
+
+Progress = Callable[[str, int, int], None]
+
+
+def _ean13(body: str) -> str:
+    # 12 digits + check digit; the 200-299 prefixes are reserved for in-store codes
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(body))
+    return body + str((10 - total % 10) % 10)
+
+
+def _chunks(total: int):
+    for start in range(0, total, CHUNK):
+        yield start, min(total, start + CHUNK)
+
+
+def _partners(rng: random.Random, kind: str, start: int, count: int) -> list[tuple]:
+    rows = []
+    for i in range(start, start + count):
+        first_fr, first_ar = rng.choice(_FIRST)
+        last_fr, last_ar = rng.choice(_LAST)
+        if kind == "supplier" or rng.random() < 0.4:
+            suffix_fr, suffix_ar = rng.choice(_COMPANY)
+            name_fr, name_ar = f"{last_fr} {suffix_fr}", f"{last_ar} {suffix_ar}"
+            email = f"contact{i}@{last_fr.lower().replace('è', 'e')}.example"
+        else:
+            name_fr, name_ar = f"{first_fr} {last_fr}", f"{first_ar} {last_ar}"
+            email = f"{first_fr.lower().replace('é', 'e')}.{i}@mail.example"
+        phone = f"0{rng.choice('567')}{rng.randrange(10**8):08d}"
+        address = f"{rng.randint(1, 250)} rue {rng.choice(_LAST)[0]}, {rng.choice(_CITIES)}"
+        created = (START_DATE + timedelta(days=rng.randrange(DAYS))).isoformat()
+        rows.append((i, kind, name_fr, name_ar, phone, email, address, f"TX{i:08d}", created))
+    return rows
+
+
+def _require_empty(db: Database) -> None:
+    for table in ("partners", "products", "documents", "payments", "cash_register"):
+        if db.scalar(f"SELECT EXISTS (SELECT 1 FROM {table});"):
+            raise ValueError(f"Table {table} is not empty; generate into a fresh database")
+
+
+def generate(db: Database, scale: Scale, seed: int = 42, progress: Optional[Progress] = None) -> None:
+    # Fills the business tables of an empty, migrated database. Ids are assigned
+    # explicitly, so the same seed and scale always give the same content.
+    logger = get_logger(__name__)
+    _require_empty(db)
+    rng = random.Random(seed)
+    report = progress or (lambda table, done, total: None)
+
+    db.execute("PRAGMA synchronous = OFF;")
+    try:
+        with log_duration(logger, "Synthetic data generation", seed=seed, **vars(scale)):
+            _generate(db, scale, rng, report)
+    finally:
+        db.execute("PRAGMA synchronous = FULL;")
+
+
+def _generate(db: Database, scale: Scale, rng: random.Random, report: Progress) -> None:
+    partner_sql = "INSERT INTO partners (id, kind, name_fr, name_ar, phone, email, address, tax_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);"
+    with db.transaction():
+        for start, end in _chunks(scale.clients):
+            db.executemany(partner_sql, _partners(rng, "client", start + 1, end - start))
+            report("clients", end, scale.clients)
+        for start, end in _chunks(scale.suppliers):
+            db.executemany(partner_sql, _partners(rng, "supplier", scale.clients + start + 1, end - start))
+            report("suppliers", end, scale.suppliers)
+
+    # Products are kept in memory (price, vat, names) to build the document lines
+    products: list[tuple[float, float, str]] = []
+    with db.transaction():
+        for start, end in _chunks(scale.products):
+            rows, stock = [], []
+            for i in range(start + 1, end + 1):
+                noun_fr, noun_ar = rng.choice(_NOUNS)
+                adj_fr, adj_ar = rng.choice(_ADJECTIVES)
+                model = rng.randrange(1000)
+                price = round(rng.lognormvariate(3, 1), 2)
+                vat = rng.choice(_VAT_RATES)
+                name_fr = f"{noun_fr} {adj_fr} {model:03d}"
+                rows.append((i, f"P{i:07d}", _ean13(f"200{i:09d}"), name_fr, f"{noun_ar} {adj_ar} {model:03d}", rng.choice(_UNITS), price, vat, START_DATE.isoformat()))
+                stock.append((i, float(rng.randint(0, 500))))
+                products.append((price, vat, name_fr))
+            db.executemany("INSERT INTO products (id, sku, barcode, name_fr, name_ar, unit, price_ht, vat_rate, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);", rows)
+            db.executemany("INSERT INTO stock (product_id, qty) VALUES (?, ?);", stock)
+            report("products", end, scale.products)
+
+    # Lines are spread over the documents around the average, at least one each
+    avg_lines = max(1, scale.lines // max(1, scale.documents))
+    counters = {kind: 0 for kind, _, _ in _KINDS}
+    kinds = [k for k, _, _ in _KINDS]
+    weights = [w for _, _, w in _KINDS]
+    prefixes = {k: p for k, p, _ in _KINDS}
+    invoices: list[tuple[int, float, str]] = []
+    line_id = 0
+    with db.transaction():
+        for start, end in _chunks(scale.documents):
+            docs, lines = [], []
+            for doc_id in range(start + 1, end + 1):
+                kind = rng.choices(kinds, weights)[0]
+                counters[kind] += 1
+                day = (START_DATE + timedelta(days=rng.randrange(DAYS))).isoformat()
+                if kind == "purchase":
+                    partner = scale.clients + rng.randint(1, max(1, scale.suppliers))
+                else:
+                    partner = rng.randint(1, max(1, scale.clients))
+                roll = rng.random()
+                status = "draft" if roll < 0.05 else "cancelled" if roll < 0.07 else "validated"
+                total_ht = total_tva = 0.0
+                for _ in range(rng.randint(1, 2 * avg_lines - 1) if line_id < scale.lines else 0):
+                    line_id += 1
+                    product_id = rng.randint(1, scale.products) if scale.products else None
+                    price, vat, name = products[product_id - 1] if product_id else (10.0, 20.0, "Article")
+                    qty = float(rng.randint(1, 20))
+                    ht = round(qty * price, 2)
+                    tva = round(ht * vat / 100, 2)
+                    total_ht += ht
+                    total_tva += tva
+                    lines.append((line_id, doc_id, product_id, name, qty, price, vat, ht, tva, ht + tva))
+                ttc = round(total_ht + total_tva, 2)
+                docs.append((doc_id, kind, f"{prefixes[kind]}{counters[kind]:06d}", partner, day, round(total_ht, 2), round(total_tva, 2), ttc, status, day))
+                if kind == "invoice" and status == "validated" and ttc > 0:
+                    invoices.append((doc_id, ttc, day))
+            db.executemany(
+                "INSERT INTO documents (id, kind, number, partner_id, date, total_ht, total_tva, total_ttc, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);",
+                docs,
+            )
+            db.executemany(
+                "INSERT INTO document_lines (id, document_id, product_id, description, qty, unit_price, vat_rate, total_ht, total_tva, total_ttc) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);",
+                lines,
+            )
+            report("documents", end, scale.documents)
+
+    # Payments settle whole or partial invoices; once an invoice is paid off the
+    # payment is left unallocated, as for an advance
+    remaining = {doc_id: ttc for doc_id, ttc, _ in invoices}
+    with db.transaction():
+        for start, end in _chunks(scale.payments):
+            rows = []
+            for pay_id in range(start + 1, end + 1):
+                doc_id, ttc, day = rng.choice(invoices) if invoices else (None, 50.0, START_DATE.isoformat())
+                left = remaining.get(doc_id, 0.0)
+                amount = round(min(left, ttc * rng.choice((1.0, 1.0, 0.5, 0.3))), 2)
+                if amount <= 0:
+                    doc_id, amount = None, round(ttc * 0.1 + 1, 2)
+                else:
+                    remaining[doc_id] = left - amount
+                paid_at = (date.fromisoformat(day) + timedelta(days=rng.randint(0, 120))).isoformat()
+                rows.append((pay_id, doc_id, rng.choice(_METHODS), amount, paid_at, paid_at))
+            db.executemany("INSERT INTO payments (id, document_id, method, amount, paid_at, created_at) VALUES (?, ?, ?, ?, ?, ?);", rows)
+            report("payments", end, scale.payments)
+
+    # Cash movements in chronological order so the running balance is meaningful
+    with db.transaction():
+        step = DAYS * 86400 // max(1, scale.cash_movements)
+        rows = []
+        for i in range(scale.cash_movements):
+            movement = "in" if rng.random() < 0.6 else "out"
+            stamp = (datetime(START_DATE.year, START_DATE.month, START_DATE.day) + timedelta(seconds=i * step)).strftime("%Y-%m-%d %H:%M:%S")
+            rows.append((movement, round(rng.uniform(5, 500), 2), "Encaissement" if movement == "in" else "Décaissement", stamp))
+        db.executemany("INSERT INTO cash_register (movement, amount, label, created_at) VALUES (?, ?, ?, ?);", rows)
+        report("cash_register", scale.cash_movements, scale.cash_movements)
+
+    rollups.rebuild_rollups(db)
+    # Validated purchases and deliveries in the ledger on their document date, so sales
+    # velocity and valuation have a history; the generated stock then enters the
+    # ledger as opening moves at the last purchase price
+    db.execute(
+        """
+        INSERT INTO stock_moves (product_id, qty, kind, reference, unit_cost, created_at)
+        SELECT l.product_id, SUM(l.qty), CASE d.kind WHEN 'purchase' THEN 'in' ELSE 'out' END, d.number,
+               CASE d.kind WHEN 'purchase' THEN SUM(l.qty * l.unit_price) / SUM(l.qty) END, d.date || ' 12:00:00'
+        FROM documents d
+        JOIN document_lines l ON l.document_id = d.id
+        WHERE d.kind IN ('purchase', 'delivery') AND d.status = 'validated' AND l.product_id IS NOT NULL
+        GROUP BY d.id, l.product_id
+        ORDER BY d.date, d.id, l.product_id;
+        """
+    )
+    valuation.open_balances(db)
+    valuation.rebuild(db)
+    db.execute("ANALYZE;")
@@ -1,8 +1,30 @@
 from __future__ import annotations
 
+import re
 import sqlite3
+import time
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Iterable, Optional, Sequence
+from typing import Any, Callable, Iterable, Iterator, Optional, Sequence
+
+from app.core.logger import get_logger
+from app.core.metrics import REGISTRY
+
+# Statements slower than this are counted and logged with their SQL
+SLOW_QUERY_MS = 200.0
+
+# Table written by an INSERT/REPLACE/UPDATE/DELETE statement on the main schema
+_WRITE_TARGET = re.compile(r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+(?:main\.)?[\"`]?(\w+)\b(?!\.)", re.I)
+
+# Called after each commit with the tables written since the previous one
+CommitHook = Callable[[set[str]], None]
+
+
+@lru_cache(maxsize=1024)
+def write_target(sql: str) -> Optional[str]:
+    match = _WRITE_TARGET.match(sql)
+    return match.group(1).lower() if match else None
 
 
 class Database:
@@ -11,29 +33,114 @@ class Database:
         self._conn = sqlite3.connect(self.path)
         self._conn.row_factory = sqlite3.Row
         self._conn.execute("PRAGMA foreign_keys = ON;")
+        # Lets idle maintenance give free pages back (app.core.maintenance). Only takes
+        # effect on a new file, before WAL mode writes the header; existing files switch
+        # at their next full VACUUM.
+        self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        # WAL lets background writers (audit log) commit while the GUI reads
+        self._conn.execute("PRAGMA journal_mode = WAL;")
+        self._conn.execute("PRAGMA busy_timeout = 5000;")
+        self._tx_depth = 0
+        self.logger = get_logger(__name__)
+        # Change notifications (app.core.changes); tables are only tracked once a hook is set
+        self.commit_hooks: list[CommitHook] = []
+        self._written: set[str] = set()
+
+    def _record(self, op: str, sql: str, start: float) -> None:
+        ms = (time.perf_counter() - start) * 1000
+        REGISTRY.observe(op, ms)
+        if ms >= SLOW_QUERY_MS:
+            REGISTRY.inc("db.slow_queries")
+            self.logger.warning(f"Slow {op} ({ms:.0f} ms): {' '.join(sql.split())[:300]}")
 
     @property
     def conn(self) -> sqlite3.Connection:
         return self._conn
 
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        # Groups several execute() calls into one commit; nested blocks join the outer one
+        self._tx_depth += 1
+        try:
+            yield self._conn
+        except BaseException:
+            self._tx_depth -= 1
+            if not self._tx_depth:
+                self._conn.rollback()
+                self._written.clear()
+            raise
+        else:
+            self._tx_depth -= 1
+            if not self._tx_depth:
+                self._conn.commit()
+                self._notify()
+
+    def _track(self, sql: str) -> None:
+        if self.commit_hooks:
+            table = write_target(sql)
+            if table is not None:
+                self._written.add(table)
+
+    def _notify(self) -> None:
+        if not self._written:
+            return
+        tables, self._written = self._written, set()
+        for hook in list(self.commit_hooks):
+            hook(tables)
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._tx_depth > 0
+
     def execute(self, sql: str, params: Optional[Sequence[Any]] = None) -> sqlite3.Cursor:
+        start = time.perf_counter()
         cur = self._conn.cursor()
         cur.execute(sql, params or [])
-        self._conn.commit()
+        self._track(sql)
+        if not self._tx_depth:
+            self._conn.commit()
+        self._record("db.execute", sql, start)
+        if not self._tx_depth:
+            self._notify()
         return cur
 
     def executemany(self, sql: str, seq_of_params: Iterable[Sequence[Any]]) -> sqlite3.Cursor:
+        start = time.perf_counter()
         cur = self._conn.cursor()
         cur.executemany(sql, seq_of_params)
-        self._conn.commit()
+        self._track(sql)
+        if not self._tx_depth:
+            self._conn.commit()
+        self._record("db.executemany", sql, start)
+        if not self._tx_depth:
+            self._notify()
         return cur
 
     def query(self, sql: str, params: Optional[Sequence[Any]] = None) -> list[sqlite3.Row]:
+        start = time.perf_counter()
         cur = self._conn.cursor()
         cur.execute(sql, params or [])
         rows = cur.fetchall()
+        self._record("db.query", sql, start)
+        REGISTRY.inc("db.rows_read", len(rows))
         return rows
 
+    def iter_query(self, sql: str, params: Optional[Sequence[Any]] = None, size: int = 500) -> Iterator[sqlite3.Row]:
+        # Streams rows in chunks instead of materialising the whole result set
+        start = time.perf_counter()
+        cur = self._conn.cursor()
+        cur.execute(sql, params or [])
+        self._record("db.iter_query", sql, start)
+        try:
+            while True:
+                rows = cur.fetchmany(size)
+                if not rows:
+                    break
+                REGISTRY.inc("db.rows_read", len(rows))
+                yield from rows
+        finally:
+            cur.close()
+
     def scalar(self, sql: str, params: Optional[Sequence[Any]] = None) -> Any:
         row = self.query(sql, params)
         if not row:
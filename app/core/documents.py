@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+from datetime import date
+from typing import Iterable, Optional, Union
+
+from app.core.audit import audit
+from app.core.catalog import Catalog
+from app.core.db import Database
+from app.core.logger import get_logger, log_duration
+from app.core.metrics import timed
+from app.core import rollups
+from app.core.numbering import allocate_numbers, next_number
+from app.core.stock import post_documents, reverse_document
+
+# Kinds a validated document can be converted to
+CONVERSIONS = {"quote": ("delivery", "invoice"), "delivery": ("invoice",)}
+
+
+def validate_document(db: Database, doc_id: int, catalog: Optional[Catalog] = None) -> bool:
+    # Deliveries and purchases post their stock moves; raises StockError when negative
+    # stock is not allowed and a product would go below zero
+    logger = get_logger(__name__)
+    with db.transaction():
+        status = db.scalar("SELECT status FROM documents WHERE id=?;", (doc_id,))
+        if status != "draft":
+            return False
+        db.execute("UPDATE documents SET status='validated' WHERE id=?;", (doc_id,))
+        deltas = post_documents(db, [doc_id])
+        rollups.apply_document(db, doc_id, 1)
+    _adjust_catalog(catalog, deltas)
+    logger.info(f"Validated document {doc_id}")
+    audit("validate", "document", doc_id)
+    return True
+
+
+def cancel_document(db: Database, doc_id: int, catalog: Optional[Catalog] = None) -> bool:
+    # A validated document leaves the rollups and its stock moves are reversed; a
+    # document converted into another one stays until that one is cancelled
+    logger = get_logger(__name__)
+    with db.transaction():
+        status = db.scalar("SELECT status FROM documents WHERE id=?;", (doc_id,))
+        if status not in ("draft", "validated"):
+            return False
+        child = db.scalar("SELECT number FROM documents WHERE source_id=? AND status <> 'cancelled' LIMIT 1;", (doc_id,))
+        if child:
+            raise ValueError(f"Converted into {child}, cancel it first")
+        db.execute("UPDATE documents SET status='cancelled' WHERE id=?;", (doc_id,))
+        deltas = {}
+        if status == "validated":
+            deltas = reverse_document(db, doc_id)
+            rollups.apply_document(db, doc_id, -1)
+    _adjust_catalog(catalog, deltas)
+    logger.info(f"Cancelled document {doc_id}")
+    audit("cancel", "document", doc_id)
+    return True
+
+
+def _adjust_catalog(catalog: Optional[Catalog], deltas: dict[int, float]) -> None:
+    if catalog is not None:
+        for product_id, delta in deltas.items():
+            catalog.adjust_stock(product_id, delta)
+
+
+def create_draft(db: Database, kind: str, partner_id: Optional[int] = None) -> tuple[int, str]:
+    with db.transaction():
+        number = next_number(db, kind)
+        cur = db.execute(
+            "INSERT INTO documents (kind, number, partner_id, date, status) VALUES (?, ?, ?, ?, 'draft');",
+            (kind, number, partner_id, date.today().isoformat()),
+        )
+    audit("create", "document", cur.lastrowid, {"kind": kind, "number": number})
+    return cur.lastrowid, number
+
+
+def line_totals(qty: float, unit_price: float, vat_rate: float) -> tuple[float, float, float]:
+    ht = round(qty * unit_price, 2)
+    tva = round(qty * unit_price * vat_rate / 100.0, 2)
+    return ht, tva, round(ht + tva, 2)
+
+
+def save_lines(db: Database, doc_id: int, lines: list[dict]) -> None:
+    # Replaces the lines of a draft and recomputes its totals. Each line has
+    # product_id (or None), description, qty, unit_price and vat_rate.
+    with db.transaction():
+        status = db.scalar("SELECT status FROM documents WHERE id=?;", (doc_id,))
+        if status != "draft":
+            raise ValueError("Only draft documents can be edited")
+        rows = []
+        for line in lines:
+            ht, tva, ttc = line_totals(line["qty"], line["unit_price"], line["vat_rate"])
+            rows.append((doc_id, line.get("product_id"), line["description"], line["qty"], line["unit_price"], line["vat_rate"], ht, tva, ttc))
+        db.execute("DELETE FROM document_lines WHERE document_id=?;", (doc_id,))
+        db.executemany(
+            "INSERT INTO document_lines (document_id, product_id, description, qty, unit_price, vat_rate, total_ht, total_tva, total_ttc) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);",
+            rows,
+        )
+        total_ht = round(sum(r[6] for r in rows), 2)
+        total_tva = round(sum(r[7] for r in rows), 2)
+        db.execute(
+            "UPDATE documents SET total_ht=?, total_tva=?, total_ttc=? WHERE id=?;",
+            (total_ht, total_tva, round(total_ht + total_tva, 2), doc_id),
+        )
+    audit("update", "document", doc_id, {"lines": len(rows)})
+
+
+@timed("documents.convert")
+def convert_documents(
+    db: Database,
+    doc_ids: Iterable[int],
+    target: str,
+    doc_date: Union[date, str, None] = None,
+    catalog: Optional[Catalog] = None,
+) -> list[dict]:
+    # Creates one validated document of kind target per source, copying header and
+    # lines with INSERT ... SELECT, all in one transaction with a single block of
+    # numbers. Sources that are not validated, cannot become target or were already
+    # converted (a quote delivered is invoiced through its delivery note) are skipped.
+    # Deliveries post their stock moves through the stock engine.
+    # Returns [{"source_id", "id", "number"}] for the documents created.
+    logger = get_logger(__name__)
+    sources = [kind for kind, targets in CONVERSIONS.items() if target in targets]
+    if not sources:
+        raise ValueError(f"Cannot convert to {target}")
+    doc_ids = sorted(set(doc_ids))
+    day = doc_date.isoformat() if isinstance(doc_date, date) else (doc_date or date.today().isoformat())
+    kinds = ", ".join("?" for _ in sources)
+    with log_duration(logger, f"Conversion to {target}", count=len(doc_ids)), db.transaction():
+        eligible: list[int] = []
+        for i in range(0, len(doc_ids), 500):
+            chunk = doc_ids[i:i + 500]
+            rows = db.query(
+                f"""
+                SELECT s.id FROM documents s
+                WHERE s.id IN ({", ".join("?" for _ in chunk)}) AND s.kind IN ({kinds}) AND s.status = 'validated'
+                  AND NOT EXISTS (SELECT 1 FROM documents t WHERE t.source_id = s.id AND t.status <> 'cancelled')
+                ORDER BY s.id;
+                """,
+                (*chunk, *sources),
+            )
+            eligible.extend(r["id"] for r in rows)
+        if not eligible:
+            return []
+        numbers = allocate_numbers(db, target, len(eligible))
+        # The write lock is held from here on: every id above this one is ours
+        last_id = db.scalar("SELECT IFNULL(MAX(id), 0) FROM documents;")
+        db.executemany(
+            "INSERT INTO documents (kind, number, partner_id, date, total_ht, total_tva, total_ttc, status, notes, source_id) "
+            "SELECT ?, ?, partner_id, ?, total_ht, total_tva, total_ttc, 'validated', notes, id FROM documents WHERE id = ?;",
+            [(target, number, day, source_id) for number, source_id in zip(numbers, eligible)],
+        )
+        db.execute(
+            """
+            INSERT INTO document_lines (document_id, product_id, description, qty, unit_price, vat_rate, total_ht, total_tva, total_ttc)
+            SELECT t.id, l.product_id, l.description, l.qty, l.unit_price, l.vat_rate, l.total_ht, l.total_tva, l.total_ttc
+            FROM documents t
+            JOIN document_lines l ON l.document_id = t.source_id
+            WHERE t.id > ?
+            ORDER BY t.id, l.id;
+            """,
+            (last_id,),
+        )
+        created = [dict(r) for r in db.query("SELECT source_id, id, number FROM documents WHERE id > ? ORDER BY id;", (last_id,))]
+        deltas = post_documents(db, [c["id"] for c in created])
+        rollups.apply_documents(db, [c["id"] for c in created], 1)
+    _adjust_catalog(catalog, deltas)
+    for c in created:
+        audit("create", "document", c["id"], {"kind": target, "number": c["number"], "source_id": c["source_id"]})
+    logger.info(f"Converted {len(created)} of {len(doc_ids)} documents to {target}")
+    return created
@@ -1,26 +1,148 @@
+from __future__ import annotations
+
+import atexit
+import gzip
+import json
 import logging
+import os
+import queue
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from typing import Iterator, Optional, Union
 
 _LOGGER_INITIALIZED = False
+_LISTENER: Optional[QueueListener] = None
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 10
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DailyRotatingFileHandler(RotatingFileHandler):
+    # Rolls over when the file exceeds max_bytes or on the first record of a new day;
+    # rotated files are gzipped. Runs on the listener thread, never on the caller's.
+    def __init__(self, filename: Union[str, Path], max_bytes: int, backup_count: int):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.namer = lambda name: name + ".gz"
+        self.rotator = _gzip_rotator
+        path = Path(self.baseFilename)
+        self._day = date.fromtimestamp(path.stat().st_mtime) if path.exists() else date.today()
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if date.fromtimestamp(record.created) != self._day:
+            return Path(self.baseFilename).exists()
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self._day = date.today()
+
 
+def _gzip_rotator(source: str, dest: str) -> None:
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
 
-def init_logging() -> None:
-    global _LOGGER_INITIALIZED
+
+def _parse_levels(spec: str) -> dict[str, str]:
+    # "app.core.db=DEBUG,app.core.pdf=WARNING"
+    levels = {}
+    for item in spec.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def init_logging(
+    log_dir: Optional[Union[str, Path]] = None,
+    level: Optional[str] = None,
+    json_format: Optional[bool] = None,
+    module_levels: Optional[dict[str, str]] = None,
+    max_bytes: Optional[int] = None,
+    backup_count: Optional[int] = None,
+) -> None:
+    global _LOGGER_INITIALIZED, _LISTENER
     if _LOGGER_INITIALIZED:
         return
-    logs_dir = Path("logs")
-    logs_dir.mkdir(exist_ok=True)
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
-        handlers=[
-            logging.FileHandler(logs_dir / "app.log", encoding="utf-8"),
-            logging.StreamHandler(),
-        ],
-    )
+    # Environment variables override the defaults so support can raise verbosity without a rebuild
+    logs_dir = Path(os.getenv("APP_LOG_DIR") or log_dir or "logs")
+    logs_dir.mkdir(parents=True, exist_ok=True)
+    level = os.getenv("APP_LOG_LEVEL") or level or "INFO"
+    if json_format is None:
+        json_format = os.getenv("APP_LOG_FORMAT", "text").lower() == "json"
+    levels = dict(module_levels or {})
+    levels.update(_parse_levels(os.getenv("APP_LOG_LEVELS", "")))
+    max_bytes = int(os.getenv("APP_LOG_MAX_BYTES") or max_bytes or DEFAULT_MAX_BYTES)
+    backup_count = int(os.getenv("APP_LOG_BACKUPS") or backup_count or DEFAULT_BACKUP_COUNT)
+
+    file_handler = DailyRotatingFileHandler(logs_dir / ("app.jsonl" if json_format else "app.log"), max_bytes, backup_count)
+    file_handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    # Callers only enqueue records; formatting, console output and disk I/O happen on the listener thread
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    root.addHandler(QueueHandler(log_queue))
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _LISTENER = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _LISTENER.start()
+    atexit.register(shutdown_logging)
     _LOGGER_INITIALIZED = True
 
 
+def shutdown_logging() -> None:
+    global _LISTENER
+    if _LISTENER is None:
+        return
+    # Drains the queue before the handlers are closed
+    _LISTENER.stop()
+    for handler in _LISTENER.handlers:
+        handler.close()
+    _LISTENER = None
+
+
 def get_logger(name: str) -> logging.Logger:
     return logging.getLogger(name)
 
+
+@contextmanager
+def log_duration(logger: logging.Logger, operation: str, level: int = logging.INFO, **fields) -> Iterator[dict]:
+    # Logs "<operation> done in N ms" with duration_ms and the given fields attached to the record;
+    # the yielded dict can be filled with more fields (row counts...) inside the block
+    extra = {"operation": operation, **fields}
+    start = time.perf_counter()
+    try:
+        yield extra
+    finally:
+        if logger.isEnabledFor(level):
+            extra["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            logger.log(level, f"{operation} done in {extra['duration_ms']} ms", extra=extra)
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+from app.core.db import Database
+from app.core.logger import get_logger, log_duration
+from app.core.metrics import timed
+
+# Routine upkeep of the database file, run when the application is idle
+# (app.views.idle_maintenance) or from "python -m app maintenance". Every task stops
+# at the time budget: long statements are interrupted through the progress handler.
+# The time of the last run of each task is kept in settings (maintenance_last_<task>).
+TASKS = ("checkpoint", "optimize", "incremental_vacuum", "quick_check")
+# Minimum time between two runs; 0: whenever the task has something to do
+INTERVALS = {
+    "checkpoint": timedelta(0),
+    "optimize": timedelta(hours=1),
+    "incremental_vacuum": timedelta(0),
+    "quick_check": timedelta(days=7),
+}
+# Free pages worth giving back, and pages released per incremental_vacuum step
+VACUUM_MIN_FREE_PAGES = 256
+VACUUM_STEP_PAGES = 512
+# WAL size above which the idle checkpoint runs
+CHECKPOINT_MIN_WAL_BYTES = 4 * 1024 * 1024
+# quick_check cannot resume once interrupted: above this size it would never finish
+# within an idle budget, so it is left to "python -m app maintenance"
+IDLE_QUICK_CHECK_MAX_BYTES = 64 * 1024 * 1024
+# Rows sampled per index by ANALYZE (0: whole tables)
+ANALYSIS_LIMIT = 1000
+_PROGRESS_OPS = 20000
+
+
+def _setting_key(task: str) -> str:
+    return f"maintenance_last_{task}"
+
+
+def last_run(db: Database, task: str) -> Optional[datetime]:
+    value = db.scalar("SELECT value FROM settings WHERE key = ?;", (_setting_key(task),))
+    return datetime.fromisoformat(value) if value else None
+
+
+def _mark_done(db: Database, task: str, now: datetime) -> None:
+    db.execute(
+        "INSERT INTO settings (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value;",
+        (_setting_key(task), now.isoformat(timespec="seconds")),
+    )
+
+
+def _wal_bytes(db: Database) -> int:
+    wal = Path(str(db.path) + "-wal")
+    return wal.stat().st_size if wal.exists() else 0
+
+
+def file_stats(db: Database) -> dict:
+    return {
+        "pages": db.scalar("PRAGMA page_count;"),
+        "free_pages": db.scalar("PRAGMA freelist_count;"),
+        "size_mb": round(Path(db.path).stat().st_size / 1024 / 1024, 2),
+        "wal_mb": round(_wal_bytes(db) / 1024 / 1024, 2),
+        "auto_vacuum": ("none", "full", "incremental")[db.scalar("PRAGMA auto_vacuum;")],
+    }
+
+
+def due_tasks(db: Database, now: Optional[datetime] = None, idle: bool = False) -> list[str]:
+    # idle: only the tasks an idle run can finish
+    now = now or datetime.now(timezone.utc)
+    due = []
+    for task in TASKS:
+        last = last_run(db, task)
+        if last is not None and now - last < INTERVALS[task]:
+            continue
+        if task == "checkpoint" and _wal_bytes(db) < CHECKPOINT_MIN_WAL_BYTES:
+            continue
+        if task == "incremental_vacuum" and db.scalar("PRAGMA freelist_count;") < VACUUM_MIN_FREE_PAGES:
+            continue
+        if task == "quick_check" and idle and Path(db.path).stat().st_size > IDLE_QUICK_CHECK_MAX_BYTES:
+            continue
+        due.append(task)
+    return due
+
+
+def _checkpoint(db: Database, mode: str) -> str:
+    # Without waiting on the other connections (audit writer, service readers): what
+    # they still use is left for the next run
+    timeout = db.scalar("PRAGMA busy_timeout;")
+    db.execute("PRAGMA busy_timeout = 0;")
+    try:
+        busy, log_pages, done = db.conn.execute(f"PRAGMA wal_checkpoint({mode});").fetchone()
+    finally:
+        db.execute(f"PRAGMA busy_timeout = {timeout};")
+    return f"{done}/{log_pages} WAL pages" + (" (database busy)" if busy else "")
+
+
+def _optimize(db: Database, deadline: float) -> str:
+    db.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT};")
+    if not db.scalar("SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1';"):
+        # No statistics at all yet: PRAGMA optimize would only cover recently used tables
+        db.execute("ANALYZE;")
+        return "ANALYZE"
+    db.execute("PRAGMA optimize;")
+    return "PRAGMA optimize"
+
+
+def _incremental_vacuum(db: Database, deadline: float) -> str:
+    if db.scalar("PRAGMA auto_vacuum;") != 2:
+        return "auto_vacuum is off: run maintenance --vacuum once to enable it"
+    before = free = db.scalar("PRAGMA freelist_count;")
+    # Small steps so the budget is checked between them
+    while free and time.perf_counter() < deadline:
+        db.conn.execute(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES});").fetchall()
+        free = db.scalar("PRAGMA freelist_count;")
+    return f"{before - free} pages released, {free} left"
+
+
+def _quick_check(db: Database, deadline: float) -> str:
+    rows = [r[0] for r in db.conn.execute("PRAGMA quick_check(20);").fetchall()]
+    if rows != ["ok"]:
+        get_logger(__name__).error("Database quick_check failed: " + "; ".join(rows))
+        return "FAILED: " + "; ".join(rows)
+    return "ok"
+
+
+_RUNNERS = {"optimize": _optimize, "incremental_vacuum": _incremental_vacuum, "quick_check": _quick_check}
+
+
+@timed("maintenance.run")
+def run_maintenance(
+    db: Database,
+    budget: float = 2.0,
+    tasks: Optional[Iterable[str]] = None,
+    force: bool = False,
+    checkpoint_mode: str = "TRUNCATE",
+) -> list[dict]:
+    # Runs the given tasks (default: the due ones, all of them with force) in TASKS
+    # order within `budget` seconds. A task cut by the budget is not marked done and is
+    # due again next time. Returns [{"task", "status", "ms", "detail"}] where status is
+    # done, interrupted or skipped.
+    if db.path is None:
+        raise ValueError("Maintenance runs on the server, not on a remote terminal")
+    if db.in_transaction:
+        raise ValueError("Cannot run maintenance inside a transaction")
+    logger = get_logger(__name__)
+    wanted = set(TASKS if tasks is None and force else tasks or due_tasks(db))
+    todo = [t for t in TASKS if t in wanted]
+    if not todo:
+        return []
+    deadline = time.perf_counter() + budget
+    results = []
+
+    def interrupt() -> int:
+        return 1 if time.perf_counter() > deadline else 0
+
+    before = file_stats(db)
+    with log_duration(logger, "Database maintenance", tasks=todo, budget_s=budget, before=before) as extra:
+        db.conn.set_progress_handler(interrupt, _PROGRESS_OPS)
+        try:
+            for task in todo:
+                if time.perf_counter() >= deadline:
+                    results.append({"task": task, "status": "skipped", "ms": 0.0, "detail": "time budget spent"})
+                    continue
+                start = time.perf_counter()
+                try:
+                    if task == "checkpoint":
+                        detail = _checkpoint(db, checkpoint_mode)
+                    else:
+                        detail = _RUNNERS[task](db, deadline)
+                    status = "done"
+                except sqlite3.OperationalError as e:
+                    # A progress handler abort is reported as "interrupted"
+                    if "interrupt" not in str(e):
+                        raise
+                    status, detail = "interrupted", "time budget spent"
+                ms = round((time.perf_counter() - start) * 1000, 1)
+                results.append({"task": task, "status": status, "ms": ms, "detail": detail})
+                logger.info(f"Maintenance {task}: {status} in {ms} ms ({detail})")
+        finally:
+            db.conn.set_progress_handler(None, 0)
+        now = datetime.now(timezone.utc)
+        for r in results:
+            if r["status"] == "done":
+                _mark_done(db, r["task"], now)
+        after = extra["after"] = file_stats(db)
+    logger.info(
+        f"Database {before['size_mb']} MB ({before['free_pages']} free pages, WAL {before['wal_mb']} MB)"
+        f" -> {after['size_mb']} MB ({after['free_pages']} free pages, WAL {after['wal_mb']} MB)"
+    )
+    return results
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import ContextDecorator
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+# Latest samples kept per histogram; percentiles are computed over this window
+SAMPLE_WINDOW = 2048
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    def __init__(self, window: int = SAMPLE_WINDOW) -> None:
+        self.samples: deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def summary(self) -> dict[str, float]:
+        ordered = sorted(self.samples)
+        out = {"count": self.count, "mean": self.total / self.count if self.count else 0.0, "max": self.max}
+        for p in PERCENTILES:
+            out[f"p{p}"] = ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] if ordered else 0.0
+        return out
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = {}
+        self._histograms: dict[str, Histogram] = {}
+        self._gauges: dict[str, Union[float, Callable[[], Any]]] = {}
+        self.started_at = time.time()
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, ms: float) -> None:
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = Histogram()
+            hist.observe(ms)
+
+    def set_gauge(self, name: str, value: Union[float, Callable[[], Any]]) -> None:
+        # A callable is evaluated lazily, only when a snapshot is taken
+        with self._lock:
+            self._gauges[name] = value
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started_at = time.time()
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {name: h.summary() for name, h in self._histograms.items()}
+            gauges = dict(self._gauges)
+        values = {}
+        for name, gauge in gauges.items():
+            try:
+                values[name] = gauge() if callable(gauge) else gauge
+            except Exception as e:
+                values[name] = f"error: {e}"
+        return {
+            "taken_at": datetime.now().isoformat(timespec="seconds"),
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "pid": os.getpid(),
+            "python": sys.version.split()[0],
+            "platform": sys.platform,
+            "timings_ms": dict(sorted(timings.items())),
+            "counters": dict(sorted(counters.items())),
+            "gauges": dict(sorted(values.items())),
+        }
+
+    def export(self, path: Union[str, Path]) -> None:
+        Path(path).write_text(json.dumps(self.snapshot(), indent=2, ensure_ascii=False, default=str), encoding="utf-8")
+
+
+REGISTRY = MetricsRegistry()
+
+
+def inc(name: str, value: float = 1) -> None:
+    REGISTRY.inc(name, value)
+
+
+def observe(name: str, ms: float) -> None:
+    REGISTRY.observe(name, ms)
+
+
+class timed(ContextDecorator):
+    # Records the wall time of a block or of each call of a decorated function, in ms
+    def __init__(self, name: str, registry: Optional[MetricsRegistry] = None) -> None:
+        self.name = name
+        self.registry = registry or REGISTRY
+        self._start = 0.0
+
+    def _recreate_cm(self) -> "timed":
+        # Fresh instance per call so decorated functions stay reentrant
+        return type(self)(self.name, self.registry)
+
+    def __enter__(self) -> "timed":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.registry.observe(self.name, (time.perf_counter() - self._start) * 1000)
+        if exc_type is not None:
+            self.registry.inc(f"{self.name}.errors")
+        return False
+
+
+def process_memory_mb() -> Optional[float]:
+    try:
+        import psutil  # optional
+
+        return round(psutil.Process().memory_info().rss / 1024 / 1024, 1)
+    except ImportError:
+        pass
+    try:
+        import resource
+
+        # Peak RSS: kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        return None
+
+
+_COUNTED_TABLES = ("partners", "products", "documents", "document_lines", "payments", "cash_register", "activity_log")
+
+
+def register_database_gauges(db, registry: Optional[MetricsRegistry] = None) -> None:
+    registry = registry or REGISTRY
+    registry.set_gauge("process.memory_mb", process_memory_mb)
+    for table in _COUNTED_TABLES:
+        registry.set_gauge(f"rows.{table}", lambda table=table: db.scalar(f"SELECT COUNT(*) FROM {table};"))
+    if db.path is None:
+        return
+    for suffix in ("", "-wal"):
+        path = Path(str(db.path) + suffix)
+        registry.set_gauge(f"file.db{suffix}_mb", lambda path=path: round(path.stat().st_size / 1024 / 1024, 2) if path.exists() else 0.0)
@@ -1,10 +1,85 @@
 from __future__ import annotations
 
+import hashlib
+import importlib.util
+import os
+import re
 from pathlib import Path
-from typing import List
+from typing import Callable, List, Optional
 
 from app.core.db import Database
-from app.core.logger import get_logger
+from app.core.logger import get_logger, log_duration
+
+# progress(version, done, total) - total is 0 when unknown
+Progress = Callable[[str, int, int], None]
+
+_NUMBER_RE = re.compile(r"^(\d+)_")
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+def _number(version: str) -> int:
+    m = _NUMBER_RE.match(version)
+    return int(m.group(1)) if m else 0
+
+
+class MigrationContext:
+    # Handed to the upgrade(ctx) function of a Python migration. Python migrations are
+    # resumable: everything they do before a crash must be safe to run again (IF NOT
+    # EXISTS DDL, backfills through ctx.backfill which records its position).
+    def __init__(self, db: Database, version: str, progress: Optional[Progress] = None) -> None:
+        self.db = db
+        self.version = version
+        self.progress = progress
+        self.logger = get_logger(f"{__name__}.{version}")
+
+    def execute_script(self, sql: str) -> None:
+        _run_script(self.db, sql)
+
+    def backfill(self, step: str, table: str, process: Callable[[Database, list[int]], None], where: str = "", chunk_size: int = 2000) -> int:
+        # Calls process(db, ids) for the rows of table in id order, chunk_size at a time.
+        # Each chunk commits together with the position reached, so an interrupted
+        # backfill resumes after the last committed chunk.
+        key = f"{self.version}:{step}"
+        cond = f" AND ({where})" if where else ""
+        row = self.db.query("SELECT last_id, done FROM schema_migration_progress WHERE step = ?;", (key,))
+        last_id, done = (row[0]["last_id"], row[0]["done"]) if row else (0, 0)
+        total = done + (self.db.scalar(f"SELECT COUNT(*) FROM {table} WHERE id > ?{cond};", (last_id,)) or 0)
+        if done:
+            self.logger.info(f"Resuming {key} after id {last_id} ({done}/{total})")
+        while True:
+            ids = [r[0] for r in self.db.query(f"SELECT id FROM {table} WHERE id > ?{cond} ORDER BY id LIMIT ?;", (last_id, chunk_size))]
+            if not ids:
+                break
+            with self.db.transaction():
+                process(self.db, ids)
+                last_id, done = ids[-1], done + len(ids)
+                self.db.execute(
+                    "INSERT INTO schema_migration_progress (step, last_id, done) VALUES (?, ?, ?) "
+                    "ON CONFLICT(step) DO UPDATE SET last_id = excluded.last_id, done = excluded.done;",
+                    (key, last_id, done),
+                )
+            if self.progress:
+                self.progress(self.version, done, total)
+        return done
+
+
+def _run_script(db: Database, sql: str, tail: str = "") -> None:
+    # executescript() commits first and then runs in autocommit mode: wrap the whole
+    # file (and the bookkeeping in tail) in one explicit transaction instead.
+    conn = db.conn
+    try:
+        conn.executescript(f"BEGIN IMMEDIATE;\n{sql}\n;\n{tail}\nCOMMIT;")
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+
+def _checksum(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes().replace(b"\r\n", b"\n")).hexdigest()
 
 
 class MigrationManager:
@@ -12,9 +87,11 @@ class MigrationManager:
         self.db = db
         self.migrations_dir = Path(migrations_dir)
         self.logger = get_logger(__name__)
-        self._ensure_schema_table()
+        self._ensured = False
 
     def _ensure_schema_table(self) -> None:
+        if self._ensured:
+            return
         self.db.execute(
             """
             CREATE TABLE IF NOT EXISTS schema_migrations (
@@ -24,25 +101,97 @@ class MigrationManager:
             );
             """
         )
+        columns = {r["name"] for r in self.db.query("PRAGMA table_info(schema_migrations);")}
+        if "checksum" not in columns:
+            self.db.execute("ALTER TABLE schema_migrations ADD COLUMN checksum TEXT;")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migration_progress (
+                step TEXT PRIMARY KEY,
+                last_id INTEGER NOT NULL,
+                done INTEGER NOT NULL
+            );
+            """
+        )
+        self._ensured = True
 
     def applied_versions(self) -> set[str]:
+        self._ensure_schema_table()
         rows = self.db.query("SELECT version FROM schema_migrations ORDER BY version;")
         return {r["version"] for r in rows}
 
     def available_migrations(self) -> List[Path]:
         if not self.migrations_dir.exists():
             return []
-        return sorted(self.migrations_dir.glob("*.sql"))
+        files = list(self.migrations_dir.glob("*.sql")) + [p for p in self.migrations_dir.glob("*.py") if not p.name.startswith("_")]
+        return sorted(files, key=lambda p: p.stem)
+
+    def latest_number(self) -> int:
+        # File names only: no reads, no checksums
+        if not self.migrations_dir.exists():
+            return 0
+        return max((_number(name) for name in os.listdir(self.migrations_dir) if name.endswith((".sql", ".py"))), default=0)
 
-    def apply_pending_migrations(self) -> None:
+    def is_up_to_date(self) -> bool:
+        # PRAGMA user_version lives in the database header and records the number of the
+        # last migration applied; a match skips the schema_migrations query and checksums.
+        return self.db.scalar("PRAGMA user_version;") == self.latest_number() > 0
+
+    def verify_checksums(self) -> list[str]:
+        # Applied migrations whose file changed since; older rows get their checksum recorded
+        self._ensure_schema_table()
+        recorded = {r["version"]: r["checksum"] for r in self.db.query("SELECT version, checksum FROM schema_migrations;")}
+        changed = []
+        for path in self.available_migrations():
+            if path.stem not in recorded:
+                continue
+            checksum = _checksum(path)
+            if recorded[path.stem] is None:
+                self.db.execute("UPDATE schema_migrations SET checksum = ? WHERE version = ?;", (checksum, path.stem))
+            elif recorded[path.stem] != checksum:
+                changed.append(path.stem)
+                self.logger.warning(f"Migration {path.stem} was modified after being applied")
+        return changed
+
+    def apply_pending_migrations(self, progress: Optional[Progress] = None, force: bool = False) -> list[str]:
+        if not force and self.is_up_to_date():
+            return []
         applied = self.applied_versions()
-        for sql_file in self.available_migrations():
-            version = sql_file.stem
+        self.verify_checksums()
+        done = []
+        for path in self.available_migrations():
+            version = path.stem
             if version in applied:
                 continue
-            sql = sql_file.read_text(encoding="utf-8")
             self.logger.info(f"Applying migration {version}")
-            self.db.conn.executescript(sql)
-            self.db.execute("INSERT INTO schema_migrations (version) VALUES (?)", (version,))
-            self.logger.info(f"Applied migration {version}")
+            with log_duration(self.logger, f"Migration {version}", version=version):
+                try:
+                    if path.suffix == ".py":
+                        self._apply_python(path, progress)
+                    else:
+                        self._apply_sql(path)
+                except Exception as e:
+                    raise MigrationError(f"Migration {version} failed: {e}") from e
+            done.append(version)
+            if progress:
+                progress(version, 1, 1)
+        latest = max((_number(p.stem) for p in self.available_migrations()), default=0)
+        self.db.execute(f"PRAGMA user_version = {latest};")
+        return done
+
+    def _record_sql(self, path: Path) -> str:
+        version = path.stem.replace("'", "''")
+        return f"INSERT INTO schema_migrations (version, checksum) VALUES ('{version}', '{_checksum(path)}');"
+
+    def _apply_sql(self, path: Path) -> None:
+        # The file and its schema_migrations row commit together, or not at all
+        _run_script(self.db, path.read_text(encoding="utf-8"), self._record_sql(path))
 
+    def _apply_python(self, path: Path, progress: Optional[Progress]) -> None:
+        spec = importlib.util.spec_from_file_location(f"app_migration_{path.stem}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.upgrade(MigrationContext(self.db, path.stem, progress))
+        with self.db.transaction():
+            self.db.execute(self._record_sql(path))
+            self.db.execute("DELETE FROM schema_migration_progress WHERE step LIKE ?;", (f"{path.stem}:%",))
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import re
+from typing import Optional
+
+from app.core.db import Database
+
+# Sequence settings hold the last number issued, e.g. "INV-000123"
+SEQ_SETTINGS = {
+    "invoice": "invoice_seq",
+    "quote": "quote_seq",
+    "delivery": "delivery_seq",
+    "purchase": "purchase_seq",
+}
+DEFAULT_PREFIXES = {"invoice": "INV-", "quote": "QTE-", "delivery": "BL-", "purchase": "PUR-"}
+_STORE_RE = re.compile(r"^[A-Z0-9]{1,8}$")
+_SEQ_RE = re.compile(r"^(.*?)(\d+)$")
+
+
+def store_code(db: Database) -> str:
+    return (db.scalar("SELECT value FROM settings WHERE key = 'store_code';") or "").strip().upper()
+
+
+def validate_store_code(code: str) -> str:
+    code = code.strip().upper()
+    if code and not _STORE_RE.match(code):
+        raise ValueError("Store code must be 1 to 8 letters or digits")
+    return code
+
+
+def _parse(seq: Optional[str], kind: str) -> tuple[str, int, int]:
+    m = _SEQ_RE.match(seq or "")
+    if not m:
+        return (seq or DEFAULT_PREFIXES.get(kind, "DOC-")), 0, 6
+    return m.group(1), int(m.group(2)), len(m.group(2))
+
+
+def allocate_numbers(db: Database, kind: str, count: int = 1) -> list[str]:
+    # Numbers are "<prefix><store>-<counter>" once a store code is set, so documents
+    # created in different shops never collide when their databases are synced.
+    # The counter never goes below the highest number already used with that prefix.
+    if count < 1:
+        return []
+    key = SEQ_SETTINGS.get(kind)
+    if key is None:
+        raise ValueError(f"Unknown document kind: {kind}")
+    with db.transaction():
+        prefix, last, width = _parse(db.scalar("SELECT value FROM settings WHERE key = ?;", (key,)), kind)
+        store = store_code(db)
+        full_prefix = f"{prefix}{store}-" if store else prefix
+        # Range scan on the unique index of documents.number; ":" sorts right after the digits
+        highest = db.scalar("SELECT number FROM documents WHERE number > ? AND number < ? ORDER BY number DESC LIMIT 1;", (full_prefix, full_prefix + ":"))
+        if highest:
+            tail = highest[len(full_prefix):]
+            if tail.isdigit():
+                last = max(last, int(tail))
+        numbers = [f"{full_prefix}{n:0{width}d}" for n in range(last + 1, last + count + 1)]
+        db.execute(
+            "INSERT INTO settings (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value;",
+            (key, f"{prefix}{last + count:0{width}d}"),
+        )
+    return numbers
+
+
+def next_number(db: Database, kind: str) -> str:
+    return allocate_numbers(db, kind, 1)[0]
+
+
+def unscoped_numbers(db: Database) -> list[tuple[int, str, str]]:
+    # Documents created here whose number has no store part, i.e. numbered before the
+    # store code was set. [(id, number, number with the store part)]; the new number
+    # is None when the number does not start with the prefix of its kind.
+    store = store_code(db)
+    found = []
+    for kind, key in SEQ_SETTINGS.items():
+        prefix = _parse(db.scalar("SELECT value FROM settings WHERE key = ?;", (key,)), kind)[0]
+        full_prefix = f"{prefix}{store}-"
+        rows = db.query(
+            """
+            SELECT id, number FROM documents d
+            WHERE kind = ? AND substr(number, 1, ?) != ?
+              AND NOT EXISTS (SELECT 1 FROM sync_map m WHERE m.table_name = 'documents' AND m.local_id = d.id)
+            ORDER BY id;
+            """,
+            (kind, len(full_prefix), full_prefix),
+        )
+        for r in rows:
+            number = r["number"]
+            found.append((r["id"], number, full_prefix + number[len(prefix):] if store and number.startswith(prefix) else None))
+    return found
+
+
+def scope_numbers(db: Database) -> int:
+    # Inserts the store code into the numbers listed by unscoped_numbers()
+    # ("BL-000150" -> "BL-S1-000150"); the counter part is kept. Returns the number of
+    # documents renumbered.
+    if not store_code(db):
+        raise ValueError("Set the store code before renumbering documents")
+    with db.transaction():
+        changes = [(new, doc_id) for doc_id, _, new in unscoped_numbers(db) if new is not None]
+        db.executemany("UPDATE documents SET number = ? WHERE id = ?;", changes)
+    return len(changes)
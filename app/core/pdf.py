@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+import re
+import threading
+from functools import lru_cache
+from io import BytesIO
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import Any, BinaryIO, Callable, Iterable, Optional, Sequence, Union
 
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
@@ -12,24 +16,42 @@ import arabic_reshaper
 from bidi.algorithm import get_display
 
 from app.core.db import Database
+from app.core.metrics import timed
+from app.core.pdf_template import Column, PageTemplate, load_logo
+
+
+_FONT_NAME = "NotoNaskhArabic"
+_FALLBACK_FONT = "Helvetica"
+# font file -> registered reportlab name, filled once per process
+_FONT_REGISTRY: dict[str, str] = {}
+_FONT_LOCK = threading.Lock()
+
+_ARABIC_RE = re.compile("[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]")
 
 
 def _ensure_font(font_path: Path) -> str:
-    name = "NotoNaskhArabic"
-    try:
-        pdfmetrics.getFont(name)
+    key = str(font_path)
+    name = _FONT_REGISTRY.get(key)
+    if name is not None:
+        return name
+    with _FONT_LOCK:
+        name = _FONT_REGISTRY.get(key)
+        if name is not None:
+            return name
+        name = _FALLBACK_FONT
+        try:
+            pdfmetrics.getFont(_FONT_NAME)
+            name = _FONT_NAME
+        except Exception:
+            if font_path.exists():
+                pdfmetrics.registerFont(TTFont(_FONT_NAME, key))
+                name = _FONT_NAME
+        _FONT_REGISTRY[key] = name
         return name
-    except Exception:
-        pass
-    if font_path.exists():
-        pdfmetrics.registerFont(TTFont(name, str(font_path)))
-    return name
 
 
-def _shape_if_ar(text: str) -> str:
-    if not text:
-        return ""
-    # Perform Arabic shaping and bidi
+@lru_cache(maxsize=8192)
+def _shape_cached(text: str) -> str:
     try:
         reshaped = arabic_reshaper.reshape(text)
         return get_display(reshaped)
@@ -37,28 +59,127 @@ def _shape_if_ar(text: str) -> str:
         return text
 
 
-def generate_document_pdf(db: Database, doc_id: int, out_path: Path, base_dir: Path) -> None:
+def _shape_if_ar(text: str) -> str:
+    if not text:
+        return ""
+    # Latin-only strings need neither shaping nor bidi reordering
+    if not _ARABIC_RE.search(text):
+        return text
+    return _shape_cached(text)
+
+
+@lru_cache(maxsize=16384)
+def text_width(text: str, font_name: str, size: float) -> float:
+    return pdfmetrics.stringWidth(text, font_name, size)
+
+
+def fit_text(text: str, font_name: str, size: float, max_width: float, ellipsis: str = "...") -> str:
+    if not text or text_width(text, font_name, size) <= max_width:
+        return text or ""
+    # Longest prefix that fits with the ellipsis appended
+    budget = max_width - text_width(ellipsis, font_name, size)
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if text_width(text[:mid], font_name, size) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + ellipsis
+
+
+def clear_caches() -> None:
+    _shape_cached.cache_clear()
+    text_width.cache_clear()
+
+
+ROW_HEIGHT = 6 * mm
+
+LINE_COLUMNS = (
+    Column("Désignation", 20 * mm),
+    Column("Qté", 125 * mm, "right"),
+    Column("PU HT", 155 * mm, "right"),
+    Column("Total HT", 190 * mm, "right"),
+)
+
+STATEMENT_COLUMNS = (
+    Column("Date", 20 * mm),
+    Column("Pièce", 42 * mm),
+    Column("Libellé", 72 * mm),
+    Column("Débit", 135 * mm, "right"),
+    Column("Crédit", 162 * mm, "right"),
+    Column("Solde", 190 * mm, "right"),
+)
+
+
+def _company_settings(db: Database) -> dict[str, str]:
+    rows = db.query("SELECT key, value FROM settings WHERE key IN ('company_name', 'company_logo_path');")
+    return {r["key"]: r["value"] or "" for r in rows}
+
+
+def _draw_carry(c: canvas.Canvas, y: float, label: str, xs: Sequence[float], values: Sequence[str]) -> None:
+    c.setFont("Helvetica-Oblique", 9)
+    c.drawString(20 * mm, y, label)
+    for x, text in zip(xs, values):
+        c.drawRightString(x, y, text)
+    c.setFont("Helvetica", 10)
+
+
+def _stream_rows(
+    tpl: PageTemplate,
+    y: float,
+    rows: Iterable,
+    draw_row: Callable[[float, Any], Sequence[float]],
+    carry_xs: Sequence[float],
+    carry_text: Callable[[list[float]], Sequence[str]],
+) -> tuple[float, list[float]]:
+    # Rows are consumed one by one (typically straight from a cursor); each page
+    # ends with the running totals and the next one starts by carrying them over.
+    c = tpl.c
+    c.setFont("Helvetica", 10)
+    totals = [0.0] * len(carry_xs)
+    for row in rows:
+        if y - ROW_HEIGHT < tpl.bottom:
+            _draw_carry(c, y, "A reporter", carry_xs, carry_text(totals))
+            y = tpl.next_page()
+            _draw_carry(c, y, "Report", carry_xs, carry_text(totals))
+            y -= ROW_HEIGHT
+        for i, amount in enumerate(draw_row(y, row)):
+            totals[i] += amount
+        y -= ROW_HEIGHT
+    return y, totals
+
+
+@timed("pdf.document")
+def generate_document_pdf(db: Database, doc_id: int, out_path: Union[Path, BinaryIO], base_dir: Path) -> None:
+    # out_path may be a filesystem path or any writable binary stream (e.g. BytesIO)
     font_path = base_dir / "app" / "assets" / "fonts" / "NotoNaskhArabic-Regular.ttf"
     font_name = _ensure_font(font_path)
-    c = canvas.Canvas(str(out_path), pagesize=A4)
+    target = out_path if hasattr(out_path, "write") else str(out_path)
+    c = canvas.Canvas(target, pagesize=A4, pageCompression=1)
     width, height = A4
-
-    # Header
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(20 * mm, height - 20 * mm, "Gestion Commerciale")
+    company = _company_settings(db)
+    company_name = company.get("company_name") or "Gestion Commerciale"
 
     # Fetch document data
     doc = db.query("SELECT d.*, p.name_fr as partner_name_fr, p.name_ar as partner_name_ar FROM documents d LEFT JOIN partners p ON p.id=d.partner_id WHERE d.id=?", (doc_id,))
     if not doc:
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(20 * mm, height - 20 * mm, company_name)
         c.drawString(20 * mm, height - 30 * mm, f"Document ID {doc_id} introuvable")
         c.save()
         return
     d = doc[0]
-    c.setFont("Helvetica", 10)
-    c.drawString(20 * mm, height - 30 * mm, f"{d['kind'].upper()} N? {d['number']} - {d['date']}")
+    tpl = PageTemplate(
+        c,
+        company=company_name,
+        title=f"{d['kind'].upper()} N° {d['number']} - {d['date']}",
+        columns=LINE_COLUMNS,
+        logo=load_logo(company.get("company_logo_path")),
+    )
+    y = tpl.begin_page()
 
     # Partner
-    y = height - 40 * mm
     c.setFont(font_name, 12)
     c.drawRightString(width - 20 * mm, y, _shape_if_ar(d["partner_name_ar"]))
     c.setFont("Helvetica", 10)
@@ -66,23 +187,22 @@ def generate_document_pdf(db: Database, doc_id: int, out_path: Path, base_dir: P
     y -= 10 * mm
 
     # Lines
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(20 * mm, y, "D?signation")
-    c.drawRightString(150 * mm, y, "Qt?")
-    c.drawRightString(180 * mm, y, "PU HT")
-    y -= 6 * mm
-    c.setFont("Helvetica", 10)
-    lines = db.query("SELECT description, qty, unit_price FROM document_lines WHERE document_id=?;", (doc_id,))
-    for line in lines:
-        c.drawString(20 * mm, y, line["description"])
-        c.drawRightString(150 * mm, y, f"{line['qty']:.2f}")
-        c.drawRightString(180 * mm, y, f"{line['unit_price']:.2f}")
-        y -= 6 * mm
-        if y < 30 * mm:
-            c.showPage()
-            y = height - 20 * mm
-
-    # Totals
+    y = tpl.draw_columns(y)
+    desc_width = 85 * mm
+
+    def draw_line(y: float, line) -> tuple[float]:
+        amount = line["qty"] * line["unit_price"]
+        c.drawString(20 * mm, y, fit_text(line["description"], "Helvetica", 10, desc_width))
+        c.drawRightString(125 * mm, y, f"{line['qty']:.2f}")
+        c.drawRightString(155 * mm, y, f"{line['unit_price']:.2f}")
+        c.drawRightString(190 * mm, y, f"{amount:.2f}")
+        return (amount,)
+
+    lines = db.iter_query("SELECT description, qty, unit_price FROM document_lines WHERE document_id=? ORDER BY id;", (doc_id,))
+    y, _ = _stream_rows(tpl, y, lines, draw_line, (190 * mm,), lambda t: (f"{t[0]:.2f}",))
+
+    # Totals, kept together on one page
+    y = tpl.ensure_space(y, 28 * mm, repeat_columns=False)
     y -= 10 * mm
     c.setFont("Helvetica-Bold", 11)
     c.drawRightString(180 * mm, y, f"Total HT: {d['total_ht']:.2f}")
@@ -94,3 +214,105 @@ def generate_document_pdf(db: Database, doc_id: int, out_path: Path, base_dir: P
     c.showPage()
     c.save()
 
+
+@timed("pdf.statement")
+def generate_statement_pdf(
+    db: Database,
+    partner_id: int,
+    out_path: Union[Path, BinaryIO],
+    base_dir: Path,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> None:
+    # Customer statement: invoices (debit) and payments (credit) in date order,
+    # streamed from the cursor so very long histories stay cheap to render
+    font_path = base_dir / "app" / "assets" / "fonts" / "NotoNaskhArabic-Regular.ttf"
+    font_name = _ensure_font(font_path)
+    target = out_path if hasattr(out_path, "write") else str(out_path)
+    c = canvas.Canvas(target, pagesize=A4, pageCompression=1)
+    width, height = A4
+    company = _company_settings(db)
+    start = date_from or ""
+    end = date_to or "9999-12-31"
+
+    partner = db.query("SELECT name_fr, name_ar FROM partners WHERE id=?;", (partner_id,))
+    name_fr = partner[0]["name_fr"] if partner else f"#{partner_id}"
+    name_ar = partner[0]["name_ar"] if partner else ""
+    period = f"du {date_from or '...'} au {date_to or '...'}"
+    tpl = PageTemplate(
+        c,
+        company=company.get("company_name") or "Gestion Commerciale",
+        title=f"RELEVÉ DE COMPTE {period}",
+        columns=STATEMENT_COLUMNS,
+        logo=load_logo(company.get("company_logo_path")),
+    )
+    y = tpl.begin_page()
+    c.setFont(font_name, 12)
+    c.drawRightString(width - 20 * mm, y, _shape_if_ar(name_ar))
+    c.setFont("Helvetica", 10)
+    c.drawString(20 * mm, y, name_fr)
+    y -= 10 * mm
+
+    opening = db.scalar(
+        """
+        SELECT IFNULL((SELECT SUM(total_ttc) FROM documents WHERE partner_id=? AND kind='invoice' AND date < ?), 0)
+             - IFNULL((SELECT SUM(p.amount) FROM payments p JOIN documents d ON d.id=p.document_id
+                       WHERE d.partner_id=? AND d.kind='invoice' AND p.paid_at < ?), 0)
+        """,
+        (partner_id, start, partner_id, start),
+    ) or 0.0
+
+    y = tpl.draw_columns(y)
+    c.setFont("Helvetica-Oblique", 9)
+    c.drawString(20 * mm, y, "Solde d'ouverture")
+    c.drawRightString(190 * mm, y, f"{opening:.2f}")
+    y -= ROW_HEIGHT
+    balance = [opening]
+
+    def draw_entry(y: float, row) -> tuple[float, float]:
+        balance[0] += row["debit"] - row["credit"]
+        c.drawString(20 * mm, y, row["day"] or "")
+        c.drawString(42 * mm, y, fit_text(row["ref"] or "", "Helvetica", 10, 28 * mm))
+        c.drawString(72 * mm, y, "Facture" if row["entry"] == "invoice" else f"Règlement ({row['label']})")
+        if row["debit"]:
+            c.drawRightString(135 * mm, y, f"{row['debit']:.2f}")
+        if row["credit"]:
+            c.drawRightString(162 * mm, y, f"{row['credit']:.2f}")
+        c.drawRightString(190 * mm, y, f"{balance[0]:.2f}")
+        return row["debit"], row["credit"]
+
+    def carry(totals: list[float]) -> tuple[str, str, str]:
+        return f"{totals[0]:.2f}", f"{totals[1]:.2f}", f"{opening + totals[0] - totals[1]:.2f}"
+
+    entries = db.iter_query(
+        """
+        SELECT date AS day, 0 AS ord, id, 'invoice' AS entry, number AS ref, '' AS label, total_ttc AS debit, 0.0 AS credit
+        FROM documents
+        WHERE partner_id=? AND kind='invoice' AND date >= ? AND date <= ?
+        UNION ALL
+        SELECT p.paid_at, 1, p.id, 'payment', d.number, p.method, 0.0, p.amount
+        FROM payments p JOIN documents d ON d.id=p.document_id
+        WHERE d.partner_id=? AND d.kind='invoice' AND p.paid_at >= ? AND p.paid_at <= ?
+        ORDER BY day, ord, id
+        """,
+        (partner_id, start, end, partner_id, start, end),
+    )
+    y, totals = _stream_rows(tpl, y, entries, draw_entry, (135 * mm, 162 * mm, 190 * mm), carry)
+
+    # Closing summary
+    y = tpl.ensure_space(y, 16 * mm, repeat_columns=False)
+    y -= 4 * mm
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(20 * mm, y, "Totaux")
+    for x, text in zip((135 * mm, 162 * mm, 190 * mm), carry(totals)):
+        c.drawRightString(x, y, text)
+
+    c.showPage()
+    c.save()
+
+
+def render_document_pdf(db: Database, doc_id: int, base_dir: Path) -> bytes:
+    # Render into memory; used for previews so nothing touches the disk
+    buf = BytesIO()
+    generate_document_pdf(db, doc_id, buf, base_dir)
+    return buf.getvalue()
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Sequence
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+
+LOGO_MAX_PX = 400
+LOGO_BOX = (40 * mm, 18 * mm)
+
+
+@dataclass(frozen=True)
+class Column:
+    title: str
+    x: float
+    align: str = "left"
+
+
+@lru_cache(maxsize=8)
+def _decode_logo(path: str, mtime_ns: int, max_px: int) -> ImageReader:
+    # mtime_ns is only part of the cache key so a replaced file is decoded again
+    from PIL import Image
+
+    with Image.open(path) as im:
+        im.load()
+        mode = "RGBA" if im.mode in ("RGBA", "LA", "P") else "RGB"
+        img = im.convert(mode)
+    img.thumbnail((max_px, max_px))
+    return ImageReader(img)
+
+
+def load_logo(path: Optional[str], max_px: int = LOGO_MAX_PX) -> Optional[ImageReader]:
+    if not path:
+        return None
+    try:
+        st = Path(path).stat()
+        return _decode_logo(str(path), st.st_mtime_ns, max_px)
+    except Exception:
+        return None
+
+
+# Pages are composed from form XObjects emitted once per document: the company
+# header (name + logo), the document title and the column header are stored a
+# single time and referenced from every page.
+class PageTemplate:
+    HEADER_FORM = "tplHeader"
+    TITLE_FORM = "tplTitle"
+    COLUMNS_FORM = "tplColumns"
+
+    def __init__(
+        self,
+        c: canvas.Canvas,
+        company: str,
+        title: str,
+        columns: Sequence[Column],
+        logo: Optional[ImageReader] = None,
+        pagesize=A4,
+        margin: float = 20 * mm,
+    ) -> None:
+        self.c = c
+        self.company = company
+        self.title = title
+        self.columns = list(columns)
+        self.logo = logo
+        self.width, self.height = pagesize
+        self.margin = margin
+        self.bottom = 30 * mm
+        self.page_no = 0
+        self._header_height = self._define_forms()
+
+    def _define_forms(self) -> float:
+        c = self.c
+        top = self.height - self.margin
+        header_height = 8 * mm
+
+        c.beginForm(self.HEADER_FORM)
+        text_x = self.margin
+        if self.logo is not None:
+            iw, ih = self.logo.getSize()
+            box_w, box_h = LOGO_BOX
+            scale = min(box_w / iw, box_h / ih)
+            w, h = iw * scale, ih * scale
+            c.drawImage(self.logo, self.margin, top - h + 5 * mm, width=w, height=h, mask="auto")
+            text_x = self.margin + w + 4 * mm
+            header_height = max(header_height, h)
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(text_x, top, self.company)
+        c.endForm()
+
+        title_y = top - header_height - 2 * mm
+        c.beginForm(self.TITLE_FORM)
+        c.setFont("Helvetica", 10)
+        c.drawString(self.margin, title_y, self.title)
+        c.endForm()
+
+        # Drawn at the origin and translated to wherever the table starts
+        c.beginForm(self.COLUMNS_FORM)
+        c.setFont("Helvetica-Bold", 10)
+        for col in self.columns:
+            if col.align == "right":
+                c.drawRightString(col.x, 2 * mm, col.title)
+            else:
+                c.drawString(col.x, 2 * mm, col.title)
+        c.setLineWidth(0.5)
+        c.line(self.margin, 0.5 * mm, self.width - self.margin, 0.5 * mm)
+        c.endForm()
+
+        return title_y - 8 * mm
+
+    def begin_page(self) -> float:
+        self.page_no += 1
+        c = self.c
+        c.doForm(self.HEADER_FORM)
+        c.doForm(self.TITLE_FORM)
+        c.setFont("Helvetica", 8)
+        c.drawRightString(self.width - self.margin, 12 * mm, f"Page {self.page_no}")
+        return self._header_height
+
+    def draw_columns(self, y: float) -> float:
+        c = self.c
+        c.saveState()
+        c.translate(0, y - 2 * mm)
+        c.doForm(self.COLUMNS_FORM)
+        c.restoreState()
+        return y - 8 * mm
+
+    def next_page(self, repeat_columns: bool = True) -> float:
+        self.c.showPage()
+        y = self.begin_page()
+        if repeat_columns:
+            y = self.draw_columns(y)
+        return y
+
+    def ensure_space(self, y: float, needed: float, repeat_columns: bool = True) -> float:
+        if y - needed < self.bottom:
+            return self.next_page(repeat_columns)
+        return y
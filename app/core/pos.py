@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+from app.core.audit import audit
+from app.core.catalog import Catalog, CatalogEntry
+from app.core.db import Database
+from app.core.metrics import timed
+from app.core.numbering import next_number
+from app.core.rollups import apply_document
+from app.core.stock import post_documents
+
+# Counter sales are invoices paid on the spot
+POS_KIND = "invoice"
+PAYMENT_METHODS = ("cash", "card", "check")
+CASH_LABEL = "Vente comptoir"
+
+
+@dataclass(slots=True)
+class CartLine:
+    product_id: int
+    sku: str
+    description: str
+    qty: float
+    unit_price: float
+    vat_rate: float
+
+    @property
+    def total_ht(self) -> float:
+        return round(self.qty * self.unit_price, 2)
+
+    @property
+    def total_tva(self) -> float:
+        return round(self.qty * self.unit_price * self.vat_rate / 100.0, 2)
+
+    @property
+    def total_ttc(self) -> float:
+        return round(self.total_ht + self.total_tva, 2)
+
+
+class Cart:
+    # Held in memory until checkout; one line per product, scanning again adds quantity
+    def __init__(self) -> None:
+        self.lines: dict[int, CartLine] = {}
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def add(self, entry: CatalogEntry, qty: float = 1) -> CartLine:
+        line = self.lines.get(entry.id)
+        if line is None:
+            line = self.lines[entry.id] = CartLine(entry.id, entry.sku, entry.name, 0, entry.price_ht, entry.vat_rate)
+        line.qty += qty
+        if line.qty <= 0:
+            del self.lines[entry.id]
+        return line
+
+    def set_qty(self, product_id: int, qty: float) -> None:
+        if qty <= 0:
+            self.lines.pop(product_id, None)
+        elif product_id in self.lines:
+            self.lines[product_id].qty = qty
+
+    def remove(self, product_id: int) -> None:
+        self.lines.pop(product_id, None)
+
+    def clear(self) -> None:
+        self.lines.clear()
+
+    def totals(self) -> tuple[float, float, float]:
+        ht = round(sum(l.total_ht for l in self.lines.values()), 2)
+        tva = round(sum(l.total_tva for l in self.lines.values()), 2)
+        return ht, tva, round(ht + tva, 2)
+
+
+def parse_scan(text: str) -> tuple[float, str]:
+    # "3*CODE" scans three units
+    text = text.strip()
+    head, found, tail = text.partition("*")
+    if found and tail:
+        try:
+            return float(head.replace(",", ".")), tail.strip()
+        except ValueError:
+            pass
+    return 1.0, text
+
+
+@timed("pos.checkout")
+def checkout(
+    db: Database,
+    cart: Cart,
+    method: str = "cash",
+    partner_id: Optional[int] = None,
+    catalog: Optional[Catalog] = None,
+) -> dict:
+    # Document, lines, stock moves, payment and cash movement commit together
+    if not cart.lines:
+        raise ValueError("Empty cart")
+    if method not in PAYMENT_METHODS:
+        raise ValueError(f"Unknown payment method: {method}")
+    lines = list(cart.lines.values())
+    total_ht, total_tva, total_ttc = cart.totals()
+    today = date.today().isoformat()
+    with db.transaction():
+        number = next_number(db, POS_KIND)
+        cur = db.execute(
+            "INSERT INTO documents (kind, number, partner_id, date, total_ht, total_tva, total_ttc, status, notes) VALUES (?, ?, ?, ?, ?, ?, ?, 'validated', 'POS');",
+            (POS_KIND, number, partner_id, today, total_ht, total_tva, total_ttc),
+        )
+        doc_id = cur.lastrowid
+        db.executemany(
+            "INSERT INTO document_lines (document_id, product_id, description, qty, unit_price, vat_rate, total_ht, total_tva, total_ttc) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);",
+            [(doc_id, l.product_id, l.description, l.qty, l.unit_price, l.vat_rate, l.total_ht, l.total_tva, l.total_ttc) for l in lines],
+        )
+        # Counter sales hand the goods over: the invoice posts the stock moves itself
+        deltas = post_documents(db, [doc_id], movement="out")
+        db.execute("INSERT INTO payments (document_id, method, amount, paid_at) VALUES (?, ?, ?, ?);", (doc_id, method, total_ttc, today))
+        if method == "cash":
+            db.execute("INSERT INTO cash_register (movement, amount, label) VALUES ('in', ?, ?);", (total_ttc, CASH_LABEL))
+        apply_document(db, doc_id, 1)
+    if catalog is not None:
+        for product_id, delta in deltas.items():
+            catalog.adjust_stock(product_id, delta)
+    audit("create", "document", doc_id, {"number": number, "total_ttc": total_ttc, "method": method, "source": "pos"})
+    cart.clear()
+    return {"id": doc_id, "number": number, "total_ttc": total_ttc}
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import csv
+from itertools import islice
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Union
+
+from app.core.db import Database
+from app.core.metrics import inc, timed
+
+FIELDS = ("sku", "name_fr", "name_ar", "unit", "price_ht")
+BATCH_SIZE = 1000
+
+_SELECT = "SELECT sku, name_fr, name_ar, unit, price_ht FROM products ORDER BY id;"
+# Upsert on the SKU keeps product ids stable, so stock and document lines stay attached
+_UPSERT = """
+INSERT INTO products (sku, name_fr, name_ar, unit, price_ht) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(sku) DO UPDATE SET name_fr=excluded.name_fr, name_ar=excluded.name_ar, unit=excluded.unit, price_ht=excluded.price_ht;
+"""
+
+
+def _clean(sku: Any, name_fr: Any, name_ar: Any, unit: Any, price_ht: Any) -> tuple:
+    return (str(sku or ""), str(name_fr or ""), str(name_ar or ""), str(unit or "u"), float(price_ht or 0))
+
+
+def _write(db: Database, rows: Iterable[tuple]) -> int:
+    count = 0
+    it = iter(rows)
+    with db.transaction():
+        while True:
+            batch = list(islice(it, BATCH_SIZE))
+            if not batch:
+                break
+            db.executemany(_UPSERT, batch)
+            count += len(batch)
+    inc("products.imported_rows", count)
+    return count
+
+
+@timed("products.export_csv")
+def export_products_csv(db: Database, path: Union[str, Path]) -> int:
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for r in db.iter_query(_SELECT):
+            writer.writerow(tuple(r))
+            count += 1
+    inc("products.exported_rows", count)
+    return count
+
+
+@timed("products.export_xlsx")
+def export_products_xlsx(db: Database, path: Union[str, Path]) -> int:
+    from openpyxl import Workbook
+
+    # Write-only mode streams rows to disk instead of building the whole sheet in memory
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(FIELDS)
+    count = 0
+    for r in db.iter_query(_SELECT):
+        ws.append(tuple(r))
+        count += 1
+    wb.save(path)
+    inc("products.exported_rows", count)
+    return count
+
+
+@timed("products.import_csv")
+def import_products_csv(db: Database, path: Union[str, Path]) -> int:
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        return _write(db, (_clean(*(row.get(k) for k in FIELDS)) for row in reader))
+
+
+@timed("products.import_xlsx")
+def import_products_xlsx(db: Database, path: Union[str, Path]) -> int:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True)
+    try:
+        rows: Iterator[tuple] = wb.active.iter_rows(min_row=2, values_only=True)
+        return _write(db, (_clean(*(tuple(row) + (None,) * 5)[:5]) for row in rows if row and any(v is not None for v in row)))
+    finally:
+        wb.close()
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from datetime import date
+from typing import Optional, Union
+
+from app.core.db import Database
+from app.core.logger import get_logger
+
+
+# (label, first day, last day); None means open-ended
+AGING_BUCKETS = (
+    ("0-30", 0, 30),
+    ("31-60", 31, 60),
+    ("61-90", 61, 90),
+    ("90+", 91, None),
+)
+
+# Must imply the predicate of idx_documents_open_invoices so the partial index is used
+_OPEN_INVOICES = "kind = 'invoice' AND open_balance > 0 AND status NOT IN ('draft', 'cancelled')"
+
+
+def _bucket_sql() -> str:
+    cols = []
+    for i, (_, lo, hi) in enumerate(AGING_BUCKETS):
+        # Invoices dated after the reference date fall into the first bucket
+        if hi is None:
+            cond = f"age >= {lo}"
+        elif i == 0:
+            cond = f"age <= {hi}"
+        else:
+            cond = f"age BETWEEN {lo} AND {hi}"
+        cols.append(f"SUM(CASE WHEN {cond} THEN open_balance ELSE 0 END) AS b{i}")
+    return ", ".join(cols)
+
+
+def aging_report(db: Database, as_of: Optional[Union[date, str]] = None) -> list[dict]:
+    ref = as_of or date.today()
+    if isinstance(ref, date):
+        ref = ref.isoformat()
+    rows = db.query(
+        f"""
+        SELECT a.partner_id AS partner_id, IFNULL(p.name_fr, '-') AS partner, a.invoices AS invoices, a.total AS total, {", ".join(f"a.b{i} AS b{i}" for i in range(len(AGING_BUCKETS)))}
+        FROM (
+            SELECT partner_id, COUNT(*) AS invoices, SUM(open_balance) AS total, {_bucket_sql()}
+            FROM (
+                SELECT partner_id, open_balance, CAST(julianday(?) - julianday(date) AS INTEGER) AS age
+                FROM documents
+                WHERE {_OPEN_INVOICES}
+            )
+            GROUP BY partner_id
+        ) a
+        LEFT JOIN partners p ON p.id = a.partner_id
+        ORDER BY a.total DESC
+        """,
+        (ref,),
+    )
+    report = []
+    for r in rows:
+        item = {"partner_id": r["partner_id"], "partner": r["partner"], "invoices": r["invoices"], "total": r["total"]}
+        for i, (label, _, _) in enumerate(AGING_BUCKETS):
+            item[label] = r[f"b{i}"]
+        report.append(item)
+    return report
+
+
+def open_invoices(db: Database, partner_id: Optional[int] = None) -> list[dict]:
+    sql = f"SELECT id, number, date, partner_id, total_ttc, paid_total, open_balance FROM documents WHERE {_OPEN_INVOICES}"
+    params: list = []
+    if partner_id is not None:
+        sql += " AND partner_id = ?"
+        params.append(partner_id)
+    sql += " ORDER BY date, id;"
+    return [dict(r) for r in db.query(sql, params)]
+
+
+def partner_balance(db: Database, partner_id: int) -> float:
+    return db.scalar(f"SELECT IFNULL(SUM(open_balance), 0) FROM documents WHERE {_OPEN_INVOICES} AND partner_id = ?;", (partner_id,)) or 0.0
+
+
+def recompute_paid_totals(db: Database) -> None:
+    # Correction tool; the payments triggers normally keep paid_total current
+    with db.transaction():
+        db.execute("UPDATE documents SET paid_total = IFNULL((SELECT SUM(amount) FROM payments WHERE payments.document_id = documents.id), 0);")
+    get_logger(__name__).info("Document paid totals recomputed")
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Iterable, Optional, Union
+
+from app.core.audit import audit
+from app.core.db import Database
+from app.core.logger import get_logger, log_duration
+from app.core.metrics import timed
+from app.core.numbering import allocate_numbers
+from app.core.valuation import OPENING_REFERENCE
+
+# Velocity is the larger of the short and long window rates, so a product picking up
+# is seen quickly and a slow week does not hide a regular seller.
+SHORT_WINDOW = 30
+LONG_WINDOW = 90
+# settings key -> default
+SETTINGS = {"replenish_lead_days": "7", "replenish_safety_days": "3", "replenish_cover_days": "14"}
+
+
+@dataclass(slots=True)
+class Suggestion:
+    product_id: int
+    sku: str
+    name: str
+    supplier_id: Optional[int]
+    supplier: str
+    velocity: float
+    stock: float
+    on_order: float
+    reorder_point: float
+    qty: float
+    unit_cost: float
+    vat_rate: float
+
+
+_SUGGEST_SQL = f"""
+WITH sales AS (
+    SELECT m.product_id,
+           SUM(CASE WHEN m.created_at >= :short_from THEN m.qty ELSE 0 END) AS short_qty,
+           SUM(m.qty) AS long_qty
+    FROM stock_moves m
+    WHERE m.kind = 'out' AND m.created_at >= :long_from AND m.created_at < :until
+      AND m.reference <> '{OPENING_REFERENCE}'
+      AND NOT EXISTS (SELECT 1 FROM documents c WHERE c.number = m.reference AND c.status = 'cancelled')
+    GROUP BY m.product_id
+),
+on_order AS (
+    SELECT l.product_id, SUM(l.qty) AS qty
+    FROM document_lines l
+    JOIN documents d ON d.id = l.document_id
+    WHERE d.kind = 'purchase' AND d.status = 'draft' AND l.product_id IS NOT NULL
+    GROUP BY l.product_id
+),
+last_purchase AS (
+    SELECT l.product_id, d.partner_id, l.unit_price
+    FROM document_lines l
+    JOIN documents d ON d.id = l.document_id
+    WHERE l.id IN (
+        SELECT MAX(l2.id) FROM document_lines l2 JOIN documents d2 ON d2.id = l2.document_id
+        WHERE d2.kind = 'purchase' AND d2.status = 'validated' AND l2.product_id IS NOT NULL
+        GROUP BY l2.product_id
+    )
+)
+SELECT p.id, p.sku, p.name_fr, p.vat_rate, s.short_qty, s.long_qty,
+       IFNULL(st.qty, 0) AS stock, IFNULL(o.qty, 0) AS on_order,
+       lp.partner_id, IFNULL(pa.name_fr, '') AS supplier,
+       COALESCE(lp.unit_price, v.avg_cost, 0) AS unit_cost,
+       COALESCE(pa.lead_time_days, :lead_days) AS lead_days
+FROM sales s
+JOIN products p ON p.id = s.product_id
+LEFT JOIN stock st ON st.product_id = p.id
+LEFT JOIN on_order o ON o.product_id = p.id
+LEFT JOIN last_purchase lp ON lp.product_id = p.id
+LEFT JOIN partners pa ON pa.id = lp.partner_id
+LEFT JOIN stock_valuation v ON v.product_id = p.id
+WHERE s.long_qty > 0
+"""
+
+
+def _setting(db: Database, key: str) -> float:
+    value = db.scalar("SELECT value FROM settings WHERE key = ?;", (key,))
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float(SETTINGS[key])
+
+
+@timed("replenishment.suggest")
+def suggest(db: Database, as_of: Union[date, str, None] = None) -> list[Suggestion]:
+    # One set-based pass over the outgoing moves of the long window. A product is
+    # suggested when stock plus draft purchases falls to its reorder point
+    # (velocity x (lead time + safety days)); the quantity tops it up to cover the
+    # lead time, the safety days and the cover days.
+    day = date.fromisoformat(as_of) if isinstance(as_of, str) else (as_of or date.today())
+    safety = _setting(db, "replenish_safety_days")
+    cover = _setting(db, "replenish_cover_days")
+    params = {
+        "short_from": (day - timedelta(days=SHORT_WINDOW - 1)).isoformat(),
+        "long_from": (day - timedelta(days=LONG_WINDOW - 1)).isoformat(),
+        "until": (day + timedelta(days=1)).isoformat(),
+        "lead_days": _setting(db, "replenish_lead_days"),
+    }
+    result = []
+    for r in db.iter_query(_SUGGEST_SQL, params, size=2000):
+        velocity = max(r["short_qty"] / SHORT_WINDOW, r["long_qty"] / LONG_WINDOW)
+        available = r["stock"] + r["on_order"]
+        reorder_point = velocity * (r["lead_days"] + safety)
+        if available > reorder_point:
+            continue
+        qty = math.ceil(velocity * (r["lead_days"] + safety + cover) - available)
+        if qty <= 0:
+            continue
+        result.append(
+            Suggestion(
+                r["id"], r["sku"], r["name_fr"], r["partner_id"], r["supplier"], velocity, r["stock"], r["on_order"],
+                reorder_point, float(qty), round(r["unit_cost"], 2), r["vat_rate"],
+            )
+        )
+    result.sort(key=lambda s: (s.supplier, s.sku))
+    return result
+
+
+@timed("replenishment.orders")
+def create_purchase_orders(db: Database, suggestions: Iterable[Suggestion]) -> list[dict]:
+    # One draft purchase per supplier (products never bought go to a draft without
+    # supplier), all numbers in one block, everything in one transaction.
+    # Returns [{"id", "number", "supplier_id", "lines"}].
+    groups: dict[Optional[int], list[Suggestion]] = {}
+    for s in suggestions:
+        groups.setdefault(s.supplier_id, []).append(s)
+    if not groups:
+        return []
+    logger = get_logger(__name__)
+    today = date.today().isoformat()
+    suppliers = sorted(groups, key=lambda k: (k is None, k or 0))
+    with log_duration(logger, "Replenishment orders", suppliers=len(suppliers)), db.transaction():
+        numbers = allocate_numbers(db, "purchase", len(suppliers))
+        last_id = db.scalar("SELECT IFNULL(MAX(id), 0) FROM documents;")
+        db.executemany(
+            "INSERT INTO documents (kind, number, partner_id, date, status, notes) VALUES ('purchase', ?, ?, ?, 'draft', 'Réapprovisionnement');",
+            [(number, supplier_id, today) for number, supplier_id in zip(numbers, suppliers)],
+        )
+        ids = {r["number"]: r["id"] for r in db.query("SELECT id, number FROM documents WHERE id > ?;", (last_id,))}
+        lines = []
+        for number, supplier_id in zip(numbers, suppliers):
+            for s in groups[supplier_id]:
+                ht = round(s.qty * s.unit_cost, 2)
+                tva = round(ht * s.vat_rate / 100.0, 2)
+                lines.append((ids[number], s.product_id, f"{s.sku} {s.name}", s.qty, s.unit_cost, s.vat_rate, ht, tva, round(ht + tva, 2)))
+        db.executemany(
+            "INSERT INTO document_lines (document_id, product_id, description, qty, unit_price, vat_rate, total_ht, total_tva, total_ttc) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);",
+            lines,
+        )
+        db.execute(
+            """
+            UPDATE documents SET
+                total_ht = (SELECT round(SUM(total_ht), 2) FROM document_lines WHERE document_id = documents.id),
+                total_tva = (SELECT round(SUM(total_tva), 2) FROM document_lines WHERE document_id = documents.id)
+            WHERE id > ?;
+            """,
+            (last_id,),
+        )
+        db.execute("UPDATE documents SET total_ttc = round(total_ht + total_tva, 2) WHERE id > ?;", (last_id,))
+    created = [{"id": ids[n], "number": n, "supplier_id": sup, "lines": len(groups[sup])} for n, sup in zip(numbers, suppliers)]
+    for c in created:
+        audit("create", "document", c["id"], {"kind": "purchase", "number": c["number"], "source": "replenishment"})
+    logger.info(f"{len(created)} draft purchase orders, {len(lines)} lines")
+    return created
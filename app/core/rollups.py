@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+from calendar import monthrange
+from datetime import date, timedelta
+from typing import Optional, Union
+
+from app.core.db import Database
+from app.core.logger import get_logger, log_duration
+
+
+# Documents in these statuses never contribute to the rollups
+EXCLUDED_STATUSES = ("draft", "cancelled")
+DIMENSIONS = ("month", "partner", "product", "kind")
+
+# (table, period column, length of the date prefix)
+_PARTNER_TABLES = (("rollup_daily", "day", 10), ("rollup_monthly", "month", 7))
+_PRODUCT_TABLES = (("rollup_product_daily", "day", 10), ("rollup_product_monthly", "month", 7))
+
+_PARTNER_UPSERT = """
+INSERT INTO {table} ({period}, kind, partner_id, doc_count, total_ht, total_tva, total_ttc)
+SELECT substr(date, 1, {length}), kind, IFNULL(partner_id, 0), {select}
+FROM documents
+WHERE {where}
+{group}
+ON CONFLICT({period}, kind, partner_id) DO UPDATE SET
+    doc_count = doc_count + excluded.doc_count,
+    total_ht = total_ht + excluded.total_ht,
+    total_tva = total_tva + excluded.total_tva,
+    total_ttc = total_ttc + excluded.total_ttc;
+"""
+
+_PRODUCT_UPSERT = """
+INSERT INTO {table} ({period}, kind, product_id, line_count, qty, total_ht, total_ttc)
+SELECT substr(d.date, 1, {length}), d.kind, IFNULL(l.product_id, 0),
+       ? * COUNT(*), ? * SUM(l.qty), ? * SUM(l.qty * l.unit_price), ? * SUM(l.qty * l.unit_price * (1 + l.vat_rate / 100.0))
+FROM document_lines l
+JOIN documents d ON d.id = l.document_id
+WHERE {where}
+GROUP BY 1, 2, 3
+ON CONFLICT({period}, kind, product_id) DO UPDATE SET
+    line_count = line_count + excluded.line_count,
+    qty = qty + excluded.qty,
+    total_ht = total_ht + excluded.total_ht,
+    total_ttc = total_ttc + excluded.total_ttc;
+"""
+
+
+def apply_document(db: Database, doc_id: int, sign: int = 1) -> None:
+    # sign=1 when a document is validated, -1 when a validated document is cancelled
+    with db.transaction():
+        for table, period, length in _PARTNER_TABLES:
+            db.execute(
+                _PARTNER_UPSERT.format(table=table, period=period, length=length, select="?, ? * total_ht, ? * total_tva, ? * total_ttc", where="id = ?", group=""),
+                (sign, sign, sign, sign, doc_id),
+            )
+        for table, period, length in _PRODUCT_TABLES:
+            db.execute(
+                _PRODUCT_UPSERT.format(table=table, period=period, length=length, where="l.document_id = ?"),
+                (sign, sign, sign, sign, doc_id),
+            )
+
+
+def apply_documents(db: Database, doc_ids: list[int], sign: int = 1) -> None:
+    # Same as apply_document for many documents, a few hundred per statement
+    with db.transaction():
+        for i in range(0, len(doc_ids), 500):
+            chunk = doc_ids[i:i + 500]
+            marks = ", ".join("?" for _ in chunk)
+            for table, period, length in _PARTNER_TABLES:
+                db.execute(
+                    _PARTNER_UPSERT.format(
+                        table=table,
+                        period=period,
+                        length=length,
+                        select="? * COUNT(*), ? * SUM(total_ht), ? * SUM(total_tva), ? * SUM(total_ttc)",
+                        where=f"id IN ({marks})",
+                        group="GROUP BY 1, 2, 3",
+                    ),
+                    (sign, sign, sign, sign, *chunk),
+                )
+            for table, period, length in _PRODUCT_TABLES:
+                db.execute(
+                    _PRODUCT_UPSERT.format(table=table, period=period, length=length, where=f"l.document_id IN ({marks})"),
+                    (sign, sign, sign, sign, *chunk),
+                )
+
+
+def rebuild_rollups(db: Database) -> None:
+    logger = get_logger(__name__)
+    placeholders = ", ".join("?" for _ in EXCLUDED_STATUSES)
+    with log_duration(logger, "Sales rollups rebuild"), db.transaction():
+        for table, _, _ in _PARTNER_TABLES + _PRODUCT_TABLES:
+            db.execute(f"DELETE FROM {table};")
+        for table, period, length in _PARTNER_TABLES:
+            db.execute(
+                _PARTNER_UPSERT.format(
+                    table=table,
+                    period=period,
+                    length=length,
+                    select="COUNT(*), SUM(total_ht), SUM(total_tva), SUM(total_ttc)",
+                    where=f"status NOT IN ({placeholders})",
+                    group="GROUP BY 1, 2, 3",
+                ),
+                EXCLUDED_STATUSES,
+            )
+        for table, period, length in _PRODUCT_TABLES:
+            db.execute(
+                _PRODUCT_UPSERT.format(table=table, period=period, length=length, where=f"d.status NOT IN ({placeholders})"),
+                (1, 1, 1, 1, *EXCLUDED_STATUSES),
+            )
+
+
+def _as_date(value: Union[date, str]) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def _split_range(date_from: date, date_to: date) -> tuple[list[tuple[str, str]], Optional[tuple[str, str]]]:
+    # Whole months are read from the monthly tables, the partial months at
+    # either end of the range from the daily ones.
+    days: list[tuple[str, str]] = []
+    first_month = date_from.replace(day=1)
+    if date_from.day != 1:
+        end = min(date_to, date_from.replace(day=monthrange(date_from.year, date_from.month)[1]))
+        days.append((date_from.isoformat(), end.isoformat()))
+        first_month = end + timedelta(days=1)
+    last_day = monthrange(date_to.year, date_to.month)[1]
+    last_month = date_to.replace(day=1)
+    if date_to.day != last_day and date_to >= first_month:
+        days.append((max(first_month, date_to.replace(day=1)).isoformat(), date_to.isoformat()))
+        last_month = date_to.replace(day=1) - timedelta(days=1)
+    if first_month > date_to or first_month > last_month:
+        return days, None
+    return days, (first_month.strftime("%Y-%m"), last_month.strftime("%Y-%m"))
+
+
+def sales_summary(
+    db: Database,
+    date_from: Union[date, str],
+    date_to: Union[date, str],
+    dimension: str = "month",
+    kind: Optional[str] = "invoice",
+    limit: Optional[int] = None,
+) -> list[dict]:
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown dimension: {dimension}")
+    days, months = _split_range(_as_date(date_from), _as_date(date_to))
+    if dimension == "product":
+        daily, monthly, key_col, cnt, qty = "rollup_product_daily", "rollup_product_monthly", "product_id", "line_count", "qty"
+    else:
+        daily, monthly, key_col, cnt, qty = "rollup_daily", "rollup_monthly", "partner_id", "doc_count", "NULL"
+    kind_sql = " AND kind = ?" if kind else ""
+    parts: list[str] = []
+    params: list = []
+    for start, end in days:
+        parts.append(f"SELECT substr(day, 1, 7) AS month, kind, {key_col} AS key_id, {cnt} AS cnt, {qty} AS qty, total_ht, total_ttc FROM {daily} WHERE day BETWEEN ? AND ?{kind_sql}")
+        params.extend([start, end] + ([kind] if kind else []))
+    if months:
+        parts.append(f"SELECT month, kind, {key_col} AS key_id, {cnt} AS cnt, {qty} AS qty, total_ht, total_ttc FROM {monthly} WHERE month BETWEEN ? AND ?{kind_sql}")
+        params.extend([months[0], months[1]] + ([kind] if kind else []))
+    if not parts:
+        return []
+
+    group = {"month": "month", "kind": "kind", "partner": "key_id", "product": "key_id"}[dimension]
+    label = {
+        "month": "g.key",
+        "kind": "g.key",
+        "partner": "IFNULL(p.name_fr, '-')",
+        "product": "IFNULL(pr.sku || ' ' || pr.name_fr, '-')",
+    }[dimension]
+    joins = {
+        "partner": "LEFT JOIN partners p ON p.id = g.key",
+        "product": "LEFT JOIN products pr ON pr.id = g.key",
+    }.get(dimension, "")
+    order = "g.key" if dimension in ("month", "kind") else "g.total_ht DESC"
+    sql = f"""
+    SELECT g.key AS key, {label} AS label, g.cnt AS count, g.qty AS qty, g.total_ht AS total_ht, g.total_ttc AS total_ttc
+    FROM (
+        SELECT {group} AS key, SUM(cnt) AS cnt, SUM(qty) AS qty, SUM(total_ht) AS total_ht, SUM(total_ttc) AS total_ttc
+        FROM ({" UNION ALL ".join(parts)})
+        GROUP BY {group}
+    ) g
+    {joins}
+    ORDER BY {order}
+    """
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return [dict(r) for r in db.query(sql, params)]
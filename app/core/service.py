@@ -0,0 +1,445 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from app.core.logger import get_logger
+from app.core.metrics import REGISTRY
+
+DEFAULT_PORT = 8765
+DEFAULT_PAGE = 50
+MAX_PAGE = 500
+MAX_BODY = 16 * 1024 * 1024
+# A client transaction holds the writer; it is rolled back after this much inactivity
+TX_IDLE_TIMEOUT = 30.0
+
+_REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class ServiceError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def encode_value(value: Any) -> Any:
+    # JSON has no bytes type (password hashes, blobs)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"$b64": base64.b64encode(bytes(value)).decode("ascii")}
+    return value
+
+
+def decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and "$b64" in value:
+        return base64.b64decode(value["$b64"])
+    return value
+
+
+def _decode_params(params: Any) -> Any:
+    if isinstance(params, dict):
+        return {k: decode_value(v) for k, v in params.items()}
+    return [decode_value(v) for v in params or []]
+
+
+def _run_query(conn: sqlite3.Connection, sql: str, params: Any) -> dict:
+    cur = conn.execute(sql, _decode_params(params))
+    columns = [d[0] for d in cur.description or ()]
+    rows = [[encode_value(v) for v in row] for row in cur.fetchall()]
+    return {"columns": columns, "rows": rows}
+
+
+class ReadPool:
+    # Read-only connections, one per worker thread; WAL lets them read while the writer commits
+    def __init__(self, db_path: Path, size: int = 4) -> None:
+        self._uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+        self._local = threading.local()
+        self._conns: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(size, thread_name_prefix="service-reader")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Only used by this worker thread; closed from the caller's thread on shutdown
+            conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout = 5000;")
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    async def query(self, sql: str, params: Any = None) -> dict:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: _run_query(self._conn(), sql, params))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+
+
+class Writer:
+    # Single writer: one task drains the queue and runs every write on one connection,
+    # in one thread, so writes never contend for the SQLite lock within the service
+    def __init__(self, db_path: Path) -> None:
+        self._path = Path(db_path)
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="service-writer")
+        self._queue: Optional[asyncio.Queue] = None
+        self._transactions: dict[str, asyncio.Queue] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self.logger = get_logger(__name__)
+
+    def _open(self) -> None:
+        self._conn = sqlite3.connect(self._path)
+        self._conn.execute("PRAGMA foreign_keys = ON;")
+        self._conn.execute("PRAGMA journal_mode = WAL;")
+        self._conn.execute("PRAGMA busy_timeout = 5000;")
+
+    async def _call(self, fn: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        await self._call(self._open)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            await self.submit("stop", None)
+            await self._task
+        if self._conn is not None:
+            await self._call(self._conn.close)
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, op: str, payload: Any, tx: Optional[str] = None) -> Any:
+        if tx is None:
+            queue = self._queue
+        else:
+            queue = self._transactions.get(tx)
+            if queue is None:
+                raise ServiceError(409, "Unknown or expired transaction")
+        fut = asyncio.get_running_loop().create_future()
+        await queue.put((op, payload, fut))
+        return await fut
+
+    def _batch(self, statements: list, commit: bool) -> list[dict]:
+        results = []
+        try:
+            for sql, params in statements:
+                cur = self._conn.execute(sql, _decode_params(params))
+                results.append({"lastrowid": cur.lastrowid, "rowcount": cur.rowcount})
+            if commit:
+                self._conn.commit()
+        except BaseException:
+            if commit:
+                self._conn.rollback()
+            raise
+        return results
+
+    @staticmethod
+    async def _resolve(fut: asyncio.Future, work: Awaitable) -> None:
+        try:
+            result = await work
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+        else:
+            if not fut.done():
+                fut.set_result(result)
+
+    async def _run(self) -> None:
+        while True:
+            op, payload, fut = await self._queue.get()
+            if op == "stop":
+                fut.set_result(None)
+                return
+            if op == "begin":
+                await self._transaction(fut)
+            elif op == "query":
+                await self._resolve(fut, self._call(_run_query, self._conn, payload["sql"], payload.get("params")))
+            else:
+                start = time.perf_counter()
+                await self._resolve(fut, self._call(self._batch, payload, True))
+                REGISTRY.observe("service.write", (time.perf_counter() - start) * 1000)
+
+    async def _transaction(self, begin: asyncio.Future) -> None:
+        # The writer serves only this transaction until it commits, rolls back or times out;
+        # other writes wait in the main queue
+        try:
+            await self._call(self._conn.execute, "BEGIN IMMEDIATE;")
+        except Exception as e:
+            begin.set_exception(e)
+            return
+        tx = secrets.token_hex(8)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._transactions[tx] = queue
+        begin.set_result(tx)
+        start = time.perf_counter()
+        try:
+            while True:
+                try:
+                    op, payload, fut = await asyncio.wait_for(queue.get(), TX_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    self.logger.warning(f"Transaction {tx} idle for {TX_IDLE_TIMEOUT:.0f} s, rolled back")
+                    await self._call(self._conn.rollback)
+                    return
+                if op == "commit":
+                    await self._resolve(fut, self._call(self._commit))
+                    return
+                if op == "rollback":
+                    await self._resolve(fut, self._call(self._conn.rollback))
+                    return
+                if op == "query":
+                    await self._resolve(fut, self._call(_run_query, self._conn, payload["sql"], payload.get("params")))
+                else:
+                    await self._resolve(fut, self._call(self._batch, payload, False))
+        finally:
+            del self._transactions[tx]
+            while not queue.empty():
+                _, _, fut = queue.get_nowait()
+                fut.set_exception(ServiceError(409, "Transaction closed"))
+            REGISTRY.observe("service.transaction", (time.perf_counter() - start) * 1000)
+
+    def _commit(self) -> None:
+        try:
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            raise
+
+
+def _int_arg(query: dict, name: str, default: Optional[int] = None) -> Optional[int]:
+    value = query.get(name, [None])[0]
+    if value in (None, ""):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ServiceError(400, f"Invalid integer for {name}")
+
+
+class Service:
+    def __init__(self, db_path: Path, token: str, host: str = "127.0.0.1", port: int = DEFAULT_PORT, readers: int = 4) -> None:
+        if not token:
+            raise ValueError("A service token is required")
+        self.db_path = Path(db_path)
+        self.token = token
+        self.host = host
+        self.port = port
+        self.reads = ReadPool(self.db_path, readers)
+        self.writer = Writer(self.db_path)
+        self.logger = get_logger(__name__)
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._routes: dict[tuple[str, str], Callable] = {
+            ("GET", "health"): self._health,
+            ("GET", "products"): self._products,
+            ("GET", "partners"): self._partners,
+            ("GET", "documents"): self._documents,
+            ("GET", "stock"): self._stock,
+            ("GET", "payments"): self._payments,
+            ("POST", "payments"): self._create_payment,
+            ("POST", "sql/query"): self._sql_query,
+            ("POST", "sql/execute"): self._sql_execute,
+            ("POST", "tx/begin"): self._tx_begin,
+            ("POST", "tx/commit"): self._tx_commit,
+            ("POST", "tx/rollback"): self._tx_rollback,
+        }
+
+    async def start(self) -> None:
+        await self.writer.start()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.logger.info(f"Service listening on {self.host}:{self.port} ({self.db_path})")
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            await self.writer.stop()
+            self.reads.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Minimal HTTP/1.1 with keep-alive; clients are trusted terminals on the local network
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, _ = line.decode("latin-1").split(" ", 2)
+                headers: dict[str, str] = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY:
+                    status, payload = 413, {"error": "Request body too large"}
+                    await reader.readexactly(length)
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self._dispatch(method, target, headers, body)
+                data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, target: str, headers: dict, body: bytes) -> tuple[int, Any]:
+        start = time.perf_counter()
+        url = urlsplit(target)
+        parts = url.path.strip("/").split("/")
+        # /<resource>/<id> reads a single item
+        item_id = int(parts.pop()) if len(parts) == 2 and parts[1].isdigit() else None
+        route = self._routes.get((method, "/".join(parts)))
+        try:
+            if not secrets.compare_digest(headers.get("authorization", ""), f"Bearer {self.token}"):
+                raise ServiceError(401, "Invalid token")
+            if route is None:
+                raise ServiceError(404, f"No route for {method} {url.path}")
+            payload = json.loads(body) if body else {}
+            result = await route(payload=payload, query=parse_qs(url.query), item_id=item_id, tx=headers.get("x-transaction"))
+            status = 200
+        except ServiceError as e:
+            status, result = e.status, {"error": str(e)}
+        except sqlite3.IntegrityError as e:
+            status, result = 409, {"error": str(e), "type": "IntegrityError"}
+        except (sqlite3.Error, json.JSONDecodeError, KeyError, TypeError) as e:
+            status, result = 400, {"error": str(e), "type": type(e).__name__}
+        except Exception as e:
+            self.logger.exception(f"{method} {url.path} failed")
+            status, result = 500, {"error": str(e)}
+        REGISTRY.observe(f"service.{method.lower()}.{parts[0] or 'root'}", (time.perf_counter() - start) * 1000)
+        return status, result
+
+    async def _page(self, select: str, order_col: str, filters: list[tuple[str, list]], query: dict, item_id: Optional[int]) -> dict:
+        # Keyset pagination, newest first: ?limit=50&after=<last id of the previous page>
+        conditions = [cond for cond, _ in filters]
+        params = [value for _, values in filters for value in values]
+        if item_id is not None:
+            conditions.append(f"{order_col} = ?")
+            params.append(item_id)
+        after = _int_arg(query, "after")
+        if after is not None:
+            conditions.append(f"{order_col} < ?")
+            params.append(after)
+        limit = min(MAX_PAGE, max(1, _int_arg(query, "limit", DEFAULT_PAGE)))
+        sql = select + (" WHERE " + " AND ".join(conditions) if conditions else "") + f" ORDER BY {order_col} DESC LIMIT ?"
+        result = await self.reads.query(sql, params + [limit])
+        items = [dict(zip(result["columns"], row)) for row in result["rows"]]
+        if item_id is not None:
+            if not items:
+                raise ServiceError(404, "Not found")
+            return items[0]
+        return {"items": items, "next": items[-1]["id"] if len(items) == limit else None}
+
+    @staticmethod
+    def _filters(query: dict, columns: dict[str, str]) -> list[tuple[str, list]]:
+        return [(f"{column} = ?", [query[name][0]]) for name, column in columns.items() if query.get(name, [""])[0] != ""]
+
+    @staticmethod
+    def _like(query: dict, columns: tuple[str, ...]) -> list[tuple[str, list]]:
+        text = query.get("search", [""])[0].strip()
+        if not text:
+            return []
+        return [("(" + " OR ".join(f"{c} LIKE ?" for c in columns) + ")", [f"%{text}%"] * len(columns))]
+
+    async def _health(self, **kw) -> dict:
+        return {"status": "ok", "database": str(self.db_path)}
+
+    async def _products(self, query: dict, item_id: Optional[int], **kw) -> dict:
+        select = "SELECT p.id AS id, p.sku, p.name_fr, p.name_ar, p.unit, p.price_ht, p.vat_rate, IFNULL(s.qty, 0) AS stock FROM products p LEFT JOIN stock s ON s.product_id = p.id"
+        return await self._page(select, "p.id", self._like(query, ("p.sku", "p.name_fr", "p.name_ar")), query, item_id)
+
+    async def _partners(self, query: dict, item_id: Optional[int], **kw) -> dict:
+        select = "SELECT id, kind, name_fr, name_ar, phone, email, address, tax_id FROM partners"
+        filters = self._filters(query, {"kind": "kind"}) + self._like(query, ("name_fr", "name_ar", "phone", "email"))
+        return await self._page(select, "id", filters, query, item_id)
+
+    async def _documents(self, query: dict, item_id: Optional[int], **kw) -> dict:
+        select = "SELECT id, kind, number, partner_id, date, total_ht, total_tva, total_ttc, paid_total, open_balance, status FROM documents"
+        filters = self._filters(query, {"kind": "kind", "status": "status", "partner_id": "partner_id"})
+        if query.get("from"):
+            filters.append(("date >= ?", [query["from"][0]]))
+        if query.get("to"):
+            filters.append(("date <= ?", [query["to"][0]]))
+        result = await self._page(select, "id", filters, query, item_id)
+        if item_id is not None:
+            lines = await self.reads.query(
+                "SELECT id, product_id, description, qty, unit_price, vat_rate, total_ht, total_tva, total_ttc FROM document_lines WHERE document_id = ? ORDER BY id;", [item_id]
+            )
+            result["lines"] = [dict(zip(lines["columns"], row)) for row in lines["rows"]]
+        return result
+
+    async def _stock(self, query: dict, item_id: Optional[int], **kw) -> dict:
+        select = "SELECT p.id AS id, p.sku, p.name_fr, IFNULL(s.qty, 0) AS qty FROM products p LEFT JOIN stock s ON s.product_id = p.id"
+        return await self._page(select, "p.id", self._like(query, ("p.sku", "p.name_fr")), query, item_id)
+
+    async def _payments(self, query: dict, item_id: Optional[int], **kw) -> dict:
+        select = "SELECT id, document_id, method, amount, paid_at FROM payments"
+        return await self._page(select, "id", self._filters(query, {"document_id": "document_id"}), query, item_id)
+
+    async def _create_payment(self, payload: dict, tx: Optional[str], **kw) -> dict:
+        amount = float(payload["amount"])
+        if amount <= 0:
+            raise ServiceError(400, "Amount must be positive")
+        statement = [
+            "INSERT INTO payments (document_id, method, amount, paid_at) VALUES (?, ?, ?, IFNULL(?, date('now')));",
+            [payload.get("document_id"), payload.get("method", "cash"), amount, payload.get("paid_at")],
+        ]
+        result = await self.writer.submit("execute", [statement], tx)
+        return {"id": result[0]["lastrowid"]}
+
+    async def _sql_query(self, payload: dict, tx: Optional[str], **kw) -> dict:
+        if tx:
+            # Inside a transaction reads go to the writer so they see the pending changes
+            return await self.writer.submit("query", payload, tx)
+        return await self.reads.query(payload["sql"], payload.get("params"))
+
+    async def _sql_execute(self, payload: dict, tx: Optional[str], **kw) -> dict:
+        return {"results": await self.writer.submit("execute", payload["statements"], tx)}
+
+    async def _tx_begin(self, **kw) -> dict:
+        return {"tx": await self.writer.submit("begin", None)}
+
+    async def _tx_commit(self, tx: Optional[str], **kw) -> dict:
+        await self.writer.submit("commit", None, tx)
+        return {}
+
+    async def _tx_rollback(self, tx: Optional[str], **kw) -> dict:
+        await self.writer.submit("rollback", None, tx)
+        return {}
+
+
+def run_service(db_path: Path, token: str, host: str = "127.0.0.1", port: int = DEFAULT_PORT, readers: int = 4) -> None:
+    service = Service(db_path, token, host, port, readers)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -12,10 +12,18 @@ class AppSettings:
         defaults = {
             "vat_rate": "20.0",
             "currency": "EUR",
+            "company_name": "Gestion Commerciale",
             "company_logo_path": "",
             "invoice_seq": "INV-000000",
             "quote_seq": "QTE-000000",
             "delivery_seq": "BL-000000",
+            "purchase_seq": "PUR-000000",
+            "store_code": "",
+            "bcrypt_rounds": "12",
+            "allow_negative_stock": "1",
+            "replenish_lead_days": "7",
+            "replenish_safety_days": "3",
+            "replenish_cover_days": "14",
         }
         for key, value in defaults.items():
             self.db.execute(
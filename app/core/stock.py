@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+from typing import Iterable, Optional
+
+from app.core import valuation
+from app.core.db import Database
+from app.core.logger import get_logger
+from app.core.metrics import timed
+
+# Direction of the stock moves posted when a document of this kind is validated.
+# Invoices do not move stock (the delivery note did), except counter sales which
+# post explicitly with movement="out".
+STOCK_MOVEMENTS = {"delivery": "out", "purchase": "in"}
+
+_CHUNK = 500
+
+
+class StockError(ValueError):
+    def __init__(self, shortages: list[dict]) -> None:
+        self.shortages = shortages
+        detail = ", ".join(f"{s['sku']} ({s['available']:g} < {s['needed']:g})" for s in shortages[:5])
+        more = f" and {len(shortages) - 5} more" if len(shortages) > 5 else ""
+        super().__init__(f"Insufficient stock: {detail}{more}")
+
+
+def negative_stock_allowed(db: Database) -> bool:
+    return (db.scalar("SELECT value FROM settings WHERE key = 'allow_negative_stock';") or "1") != "0"
+
+
+def _marks(values: list) -> str:
+    return ", ".join("?" for _ in values)
+
+
+def check_available(db: Database, needed: dict[int, float]) -> None:
+    # Primary-key lookups on stock for the products going out; raises StockError
+    shortages = []
+    ids = sorted(needed)
+    for i in range(0, len(ids), _CHUNK):
+        chunk = ids[i:i + _CHUNK]
+        rows = db.query(
+            f"SELECT p.id, p.sku, IFNULL(s.qty, 0) AS qty FROM products p LEFT JOIN stock s ON s.product_id = p.id WHERE p.id IN ({_marks(chunk)});",
+            chunk,
+        )
+        for r in rows:
+            if r["qty"] < needed[r["id"]] - 1e-9:
+                shortages.append({"product_id": r["id"], "sku": r["sku"], "available": r["qty"], "needed": needed[r["id"]]})
+    if shortages:
+        raise StockError(shortages)
+
+
+@timed("stock.post")
+def post_documents(
+    db: Database,
+    doc_ids: Iterable[int],
+    movement: Optional[str] = None,
+    check: Optional[bool] = None,
+) -> dict[int, float]:
+    # Writes one stock move per document and product (lines of the same product are
+    # summed) and applies the per-product totals to stock with one INSERT ... SELECT per
+    # chunk, in the caller's transaction. movement defaults to STOCK_MOVEMENTS[kind];
+    # documents of other kinds are ignored. check defaults to the allow_negative_stock
+    # setting. Returns the stock delta per product.
+    doc_ids = sorted(set(doc_ids))
+    if check is None:
+        check = not negative_stock_allowed(db)
+    moves: list[tuple] = []
+    deltas: dict[int, float] = {}
+    signed_docs: dict[int, list[int]] = {1: [], -1: []}
+    with db.transaction():
+        for i in range(0, len(doc_ids), _CHUNK):
+            chunk = doc_ids[i:i + _CHUNK]
+            rows = db.query(
+                f"""
+                SELECT d.id, d.kind, d.number, l.product_id, SUM(l.qty) AS qty, SUM(l.qty * l.unit_price) AS amount
+                FROM documents d
+                JOIN document_lines l ON l.document_id = d.id
+                WHERE d.id IN ({_marks(chunk)}) AND l.product_id IS NOT NULL
+                GROUP BY d.id, l.product_id
+                ORDER BY d.id, l.product_id;
+                """,
+                chunk,
+            )
+            for r in rows:
+                kind = movement or STOCK_MOVEMENTS.get(r["kind"])
+                if kind is None or not r["qty"]:
+                    continue
+                sign = 1 if kind == "in" else -1
+                # Purchases bring their cost in; other receipts come in at the average cost
+                cost = r["amount"] / r["qty"] if r["kind"] == "purchase" and kind == "in" else None
+                moves.append((r["product_id"], r["qty"], kind, r["number"], cost))
+                deltas[r["product_id"]] = deltas.get(r["product_id"], 0.0) + sign * r["qty"]
+                if not signed_docs[sign] or signed_docs[sign][-1] != r["id"]:
+                    signed_docs[sign].append(r["id"])
+        if not moves:
+            return {}
+        if check:
+            check_available(db, {p: -d for p, d in deltas.items() if d < 0})
+        db.executemany("INSERT INTO stock_moves (product_id, qty, kind, reference, unit_cost) VALUES (?, ?, ?, ?, ?);", moves)
+        for sign, ids in signed_docs.items():
+            for i in range(0, len(ids), _CHUNK):
+                chunk = ids[i:i + _CHUNK]
+                db.execute(
+                    f"""
+                    INSERT INTO stock (product_id, qty)
+                    SELECT product_id, ? * SUM(qty) FROM document_lines
+                    WHERE document_id IN ({_marks(chunk)}) AND product_id IS NOT NULL
+                    GROUP BY product_id
+                    ON CONFLICT(product_id) DO UPDATE SET qty = qty + excluded.qty;
+                    """,
+                    (sign, *chunk),
+                )
+        valuation.apply_pending(db)
+    get_logger(__name__).debug(f"Posted {len(moves)} stock moves for {len(doc_ids)} documents")
+    return deltas
+
+
+@timed("stock.reverse")
+def reverse_document(db: Database, doc_id: int) -> dict[int, float]:
+    # Cancels what the ledger holds for the document number (whatever posted it) with
+    # opposite moves under the same reference, so its net movement becomes zero
+    with db.transaction():
+        number = db.scalar("SELECT number FROM documents WHERE id = ?;", (doc_id,))
+        rows = db.query(
+            """
+            SELECT product_id, SUM(CASE kind WHEN 'in' THEN qty ELSE -qty END) AS net,
+                   SUM(qty * unit_cost) / SUM(qty) AS unit_cost
+            FROM stock_moves WHERE reference = ?
+            GROUP BY product_id
+            HAVING net <> 0;
+            """,
+            (number,),
+        )
+        if not rows:
+            return {}
+        deltas = {r["product_id"]: -r["net"] for r in rows}
+        # Goods coming back re-enter at the cost they left at
+        db.executemany(
+            "INSERT INTO stock_moves (product_id, qty, kind, reference, unit_cost) VALUES (?, ?, ?, ?, ?);",
+            [(r["product_id"], abs(r["net"]), "out" if r["net"] > 0 else "in", number, r["unit_cost"]) for r in rows],
+        )
+        db.executemany(
+            "INSERT INTO stock (product_id, qty) VALUES (?, ?) ON CONFLICT(product_id) DO UPDATE SET qty = qty + excluded.qty;",
+            list(deltas.items()),
+        )
+        valuation.apply_pending(db)
+    return deltas
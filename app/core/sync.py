@@ -0,0 +1,401 @@
+from __future__ import annotations
+
+import gzip
+import json
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional, Union
+
+from app.core.db import Database
+from app.core.logger import get_logger, log_duration
+from app.core.metrics import timed
+from app.core.numbering import store_code, unscoped_numbers, validate_store_code
+from app.core.rollups import EXCLUDED_STATUSES, apply_document
+
+FORMAT = 1
+
+# Synced tables, parents first. Rows are identified across stores by their global
+# key (origin store, id in the origin database); references travel the same way.
+#   lww   - last writer wins on (version, changed_at, author); ties are logged
+#   owner - only the store that created the row may change it; other changes are rejected
+# cash_register and stock stay local to each store.
+TABLES: dict[str, dict[str, Any]] = {
+    "partners": {
+        "columns": ("kind", "name_fr", "name_ar", "phone", "email", "address", "tax_id", "created_at"),
+        "refs": {},
+        "rule": "lww",
+    },
+    "products": {
+        "columns": ("sku", "barcode", "name_fr", "name_ar", "unit", "price_ht", "vat_rate", "created_at"),
+        "refs": {},
+        "rule": "lww",
+        # A product created in both stores with the same SKU is the same product
+        "natural_key": "sku",
+    },
+    "documents": {
+        "columns": ("kind", "number", "partner_id", "date", "total_ht", "total_tva", "total_ttc", "status", "notes", "created_at", "source_id"),
+        "refs": {"partner_id": "partners", "source_id": "documents"},
+        "rule": "owner",
+    },
+    "document_lines": {
+        "columns": ("document_id", "product_id", "description", "qty", "unit_price", "vat_rate", "total_ht", "total_tva", "total_ttc"),
+        "refs": {"document_id": "documents", "product_id": "products"},
+        "required": ("document_id",),
+        "rule": "owner",
+    },
+    "payments": {
+        "columns": ("document_id", "method", "amount", "paid_at", "created_at"),
+        "refs": {"document_id": "documents"},
+        "rule": "owner",
+    },
+}
+
+_CHUNK = 500
+
+
+class SyncError(ValueError):
+    pass
+
+
+def _require_store(db: Database) -> str:
+    store = store_code(db)
+    if not store:
+        raise SyncError("Set the store code in the settings before syncing")
+    return store
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def _chunks(items: list, size: int = _CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _global_keys(db: Database, store: str, table: str, ids: set[int]) -> dict[int, tuple[str, int]]:
+    # Local id -> (origin, origin id); rows created here are (store, id)
+    keys = {i: (store, i) for i in ids}
+    for chunk in _chunks(sorted(ids)):
+        rows = db.query(
+            f"SELECT local_id, origin, origin_id FROM sync_map WHERE table_name = ? AND local_id IN ({', '.join('?' for _ in chunk)});",
+            (table, *chunk),
+        )
+        for r in rows:
+            keys[r["local_id"]] = (r["origin"], r["origin_id"])
+    return keys
+
+
+def _local_id(db: Database, store: str, table: str, origin: str, origin_id: int) -> Optional[int]:
+    if origin == store:
+        return origin_id
+    return db.scalar("SELECT local_id FROM sync_map WHERE table_name = ? AND origin = ? AND origin_id = ?;", (table, origin, origin_id))
+
+
+def _row_exists(db: Database, table: str, row_id: Optional[int]) -> bool:
+    return row_id is not None and db.scalar(f"SELECT 1 FROM {table} WHERE id = ?;", (row_id,)) is not None
+
+
+def _acknowledge(db: Database, peer: str, seq: int) -> None:
+    # The peer has applied our changes up to seq: the next export starts there
+    db.execute(
+        """
+        INSERT INTO sync_peers (store, sent_seq, last_sent_at) VALUES (?, ?, ?)
+        ON CONFLICT(store) DO UPDATE SET sent_seq = excluded.sent_seq, last_sent_at = excluded.last_sent_at;
+        """,
+        (peer, seq, _now()),
+    )
+
+
+@timed("sync.export")
+def export_changes(db: Database, peer: str, since: Optional[int] = None) -> dict:
+    # Latest state of every row changed since the peer last acknowledged (sent_seq),
+    # except rows whose last change came from the peer itself. Nothing is recorded
+    # here: a delta that is lost or fails to apply is sent again next time. The delta
+    # carries our own acknowledgement of what we received from the peer ("ack").
+    store = _require_store(db)
+    peer = validate_store_code(peer)
+    if not peer or peer == store:
+        raise SyncError(f"Invalid peer store code: {peer!r}")
+    unscoped = unscoped_numbers(db)
+    if unscoped:
+        # Another store may have issued the same number: the peer would reject these documents
+        raise SyncError(
+            f"{len(unscoped)} documents were numbered before the store code was set (e.g. {unscoped[0][1]})."
+            " Run 'python -m app sync renumber' to insert the store code into their numbers, then sync again."
+        )
+    if since is None:
+        since = db.scalar("SELECT sent_seq FROM sync_peers WHERE store = ?;", (peer,)) or 0
+    ack = db.scalar("SELECT received_seq FROM sync_peers WHERE store = ?;", (peer,)) or 0
+    to_seq = db.scalar("SELECT IFNULL(MAX(seq), 0) FROM change_log;")
+    latest = db.query(
+        """
+        SELECT c.seq, c.table_name, c.row_id, c.op, c.version, IFNULL(c.author, ?) AS author, c.changed_at
+        FROM change_log c
+        JOIN (SELECT MAX(seq) AS seq FROM change_log WHERE seq > ? AND seq <= ? GROUP BY table_name, row_id) m ON m.seq = c.seq
+        ORDER BY c.seq;
+        """,
+        (store, since, to_seq),
+    )
+    by_table: dict[str, list] = {}
+    for entry in latest:
+        if entry["author"] != peer and entry["table_name"] in TABLES:
+            by_table.setdefault(entry["table_name"], []).append(entry)
+
+    changes = []
+    for table, spec in TABLES.items():
+        entries = by_table.get(table, [])
+        if not entries:
+            continue
+        ids = {e["row_id"] for e in entries}
+        data: dict[int, sqlite3.Row] = {}
+        for chunk in _chunks(sorted(ids)):
+            for r in db.query(f"SELECT id, {', '.join(spec['columns'])} FROM {table} WHERE id IN ({', '.join('?' for _ in chunk)});", chunk):
+                data[r["id"]] = r
+        keys = _global_keys(db, store, table, ids)
+        ref_keys = {
+            col: _global_keys(db, store, parent, {r[col] for r in data.values() if r[col] is not None})
+            for col, parent in spec["refs"].items()
+        }
+        for e in entries:
+            row = data.get(e["row_id"])
+            origin, origin_id = keys[e["row_id"]]
+            change = {
+                "table": table,
+                "origin": origin,
+                "origin_id": origin_id,
+                "op": e["op"] if row is not None else "D",
+                "version": e["version"],
+                "author": e["author"],
+                "changed_at": e["changed_at"],
+            }
+            if row is not None:
+                values = {}
+                for col in spec["columns"]:
+                    value = row[col]
+                    if col in spec["refs"] and value is not None:
+                        value = list(ref_keys[col][value])
+                    values[col] = value
+                change["data"] = values
+            changes.append(change)
+
+    get_logger(__name__).info(f"Exported {len(changes)} changes for {peer} (seq {since}..{to_seq})")
+    return {"format": FORMAT, "store": store, "peer": peer, "from_seq": since, "to_seq": to_seq, "ack": ack, "changes": changes}
+
+
+class _Applier:
+    def __init__(self, db: Database, store: str) -> None:
+        self.db = db
+        self.store = store
+        self.stats = {"applied": 0, "skipped": 0, "conflicts": 0}
+        # Documents taken out of the rollups before being modified
+        self.touched: set[int] = set()
+
+    def conflict(self, change: dict, reason: str) -> None:
+        self.stats["conflicts"] += 1
+        self.db.execute(
+            "INSERT INTO sync_conflicts (table_name, origin, origin_id, author, version, reason, payload) VALUES (?, ?, ?, ?, ?, ?, ?);",
+            (change["table"], change["origin"], change["origin_id"], change["author"], change["version"], reason, json.dumps(change.get("data"))),
+        )
+
+    def touch(self, doc_id: Optional[int]) -> None:
+        if doc_id is None or doc_id in self.touched:
+            return
+        self.touched.add(doc_id)
+        status = self.db.scalar("SELECT status FROM documents WHERE id = ?;", (doc_id,))
+        if status is not None and status not in EXCLUDED_STATUSES:
+            apply_document(self.db, doc_id, -1)
+
+    def finish(self) -> None:
+        placeholders = ", ".join("?" for _ in EXCLUDED_STATUSES)
+        for doc_id in sorted(self.touched):
+            if self.db.scalar(f"SELECT 1 FROM documents WHERE id = ? AND status NOT IN ({placeholders});", (doc_id, *EXCLUDED_STATUSES)):
+                apply_document(self.db, doc_id, 1)
+
+    def accepts(self, change: dict, local_id: Optional[int]) -> bool:
+        spec = TABLES[change["table"]]
+        current = None
+        if local_id is not None:
+            current = self.db.query(
+                "SELECT version, IFNULL(author, ?) AS author, changed_at FROM row_versions WHERE table_name = ? AND row_id = ?;",
+                (self.store, change["table"], local_id),
+            )
+            current = current[0] if current else None
+        if spec["rule"] == "owner":
+            if change["author"] != change["origin"] and current is not None:
+                self.conflict(change, f"{change['author']} cannot change a row owned by {change['origin']}")
+                return False
+            # An unknown row is taken whoever relays it; the owner's version always wins afterwards
+            if current is not None and current["author"] == change["origin"] and change["version"] <= current["version"]:
+                self.stats["skipped"] += 1
+                return False
+            return True
+        if current is None:
+            return True
+        incoming = (change["version"], change["changed_at"], change["author"])
+        mine = (current["version"], current["changed_at"], current["author"])
+        if incoming == mine or change["version"] < current["version"]:
+            self.stats["skipped"] += 1
+            return False
+        if change["version"] == current["version"]:
+            # Edited on both sides since the last sync: both stores keep the same winner
+            self.conflict(change, f"concurrent update with {current['author']}, {'incoming' if incoming > mine else 'local'} version kept")
+            return incoming > mine
+        return True
+
+    def resolve_refs(self, change: dict) -> Optional[dict]:
+        spec = TABLES[change["table"]]
+        values = dict(change["data"])
+        for col, parent in spec["refs"].items():
+            key = values.get(col)
+            if key is None:
+                continue
+            local = _local_id(self.db, self.store, parent, key[0], key[1])
+            if local is not None and not _row_exists(self.db, parent, local):
+                local = None
+            if local is None and col in spec.get("required", ()):
+                self.conflict(change, f"unknown {parent} row {key[0]}:{key[1]}")
+                return None
+            values[col] = local
+        return values
+
+    def apply(self, change: dict) -> None:
+        table = change["table"]
+        spec = TABLES[table]
+        local_id = _local_id(self.db, self.store, table, change["origin"], change["origin_id"])
+        exists = _row_exists(self.db, table, local_id)
+        if change["op"] != "D" and not exists and spec.get("natural_key"):
+            key = spec["natural_key"]
+            local_id = self.db.scalar(f"SELECT id FROM {table} WHERE {key} = ?;", (change["data"][key],)) or local_id
+            exists = _row_exists(self.db, table, local_id)
+        if not self.accepts(change, local_id):
+            return
+        if change["op"] == "D":
+            if not exists:
+                self.stats["skipped"] += 1
+                return
+            self._before(table, local_id)
+            self.db.execute(f"DELETE FROM {table} WHERE id = ?;", (local_id,))
+        else:
+            values = self.resolve_refs(change)
+            if values is None:
+                return
+            if table == "document_lines":
+                self.touch(values["document_id"])
+            if exists:
+                self._before(table, local_id)
+                self.db.execute(f"UPDATE {table} SET {', '.join(f'{c} = ?' for c in values)} WHERE id = ?;", (*values.values(), local_id))
+            else:
+                cols = list(values)
+                params = list(values.values())
+                if change["origin"] == self.store:
+                    # One of our rows deleted here but changed since by a peer: restore it
+                    cols.insert(0, "id")
+                    params.insert(0, change["origin_id"])
+                cur = self.db.execute(f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)});", params)
+                local_id = cur.lastrowid
+                if table == "documents":
+                    # Not in the rollups yet; finish() adds it
+                    self.touched.add(local_id)
+            if change["origin"] != self.store:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO sync_map (table_name, origin, origin_id, local_id) VALUES (?, ?, ?, ?);",
+                    (table, change["origin"], change["origin_id"], local_id),
+                )
+        self.db.execute(
+            """
+            INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(table_name, row_id) DO UPDATE SET version = excluded.version, author = excluded.author, changed_at = excluded.changed_at;
+            """,
+            (table, local_id, change["version"], change["author"], change["changed_at"]),
+        )
+        # Logged with the author so the change can be relayed to other stores
+        self.db.execute(
+            "INSERT INTO change_log (table_name, row_id, op, version, author, changed_at) VALUES (?, ?, ?, ?, ?, ?);",
+            (table, local_id, change["op"], change["version"], change["author"], change["changed_at"]),
+        )
+        self.stats["applied"] += 1
+
+    def _before(self, table: str, local_id: int) -> None:
+        # Take the affected documents out of the rollups while they change
+        if table == "documents":
+            self.touch(local_id)
+        elif table == "document_lines":
+            self.touch(self.db.scalar("SELECT document_id FROM document_lines WHERE id = ?;", (local_id,)))
+
+
+@timed("sync.apply")
+def apply_changes(db: Database, batch: dict) -> dict:
+    store = _require_store(db)
+    if batch.get("format") != FORMAT:
+        raise SyncError(f"Unsupported delta format: {batch.get('format')}")
+    if batch["peer"] != store:
+        raise SyncError(f"Delta is for store {batch['peer']}, this is {store}")
+    changes = batch["changes"]
+    order = {t: i for i, t in enumerate(TABLES)}
+    # Parents before children for inserts/updates, children first for deletes
+    upserts = sorted((c for c in changes if c["op"] != "D"), key=lambda c: order[c["table"]])
+    deletes = sorted((c for c in changes if c["op"] == "D"), key=lambda c: -order[c["table"]])
+    applier = _Applier(db, store)
+    logger = get_logger(__name__)
+    with log_duration(logger, "Sync apply", source=batch["store"], changes=len(changes)), db.transaction():
+        db.execute("UPDATE cdc_state SET capture = 0 WHERE id = 1;")
+        try:
+            for change in upserts + deletes:
+                touched = set(applier.touched)
+                db.execute("SAVEPOINT sync_change;")
+                try:
+                    applier.apply(change)
+                except sqlite3.IntegrityError as e:
+                    # e.g. a document number already used here: undo this change only
+                    db.execute("ROLLBACK TO sync_change;")
+                    applier.touched = touched
+                    applier.conflict(change, str(e))
+                db.execute("RELEASE sync_change;")
+            applier.finish()
+        finally:
+            db.execute("UPDATE cdc_state SET capture = 1 WHERE id = 1;")
+        db.execute(
+            """
+            INSERT INTO sync_peers (store, received_seq, last_received_at) VALUES (?, ?, ?)
+            ON CONFLICT(store) DO UPDATE SET received_seq = MAX(received_seq, excluded.received_seq), last_received_at = excluded.last_received_at;
+            """,
+            (batch["store"], batch["to_seq"], _now()),
+        )
+        if "ack" in batch:
+            # The peer's own record wins, even when lower (a restored backup): resending is harmless
+            _acknowledge(db, batch["store"], batch["ack"])
+    if applier.stats["conflicts"]:
+        logger.warning(f"Sync from {batch['store']}: {applier.stats['conflicts']} conflicts recorded in sync_conflicts")
+    return applier.stats
+
+
+def write_delta(batch: dict, path: Union[str, Path]) -> Path:
+    path = Path(path)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(batch, f, ensure_ascii=False, separators=(",", ":"))
+    return path
+
+
+def read_delta(path: Union[str, Path]) -> dict:
+    with gzip.open(Path(path), "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _received(db: Database, peer: str) -> int:
+    return db.scalar("SELECT received_seq FROM sync_peers WHERE store = ?;", (peer,)) or 0
+
+
+def sync_with(db: Database, peer_db: Database) -> dict:
+    # Two-way exchange with another store database reachable as a file (local peer).
+    # Each side exports from what the other has recorded as applied, and the sender
+    # acknowledges once the receiver's transaction committed.
+    store, peer = _require_store(db), _require_store(peer_db)
+    batch = export_changes(db, peer, _received(peer_db, store))
+    pushed = apply_changes(peer_db, batch)
+    _acknowledge(db, peer, batch["to_seq"])
+    batch = export_changes(peer_db, store, _received(db, peer))
+    pulled = apply_changes(db, batch)
+    _acknowledge(peer_db, store, batch["to_seq"])
+    return {"pushed": pushed, "pulled": pulled}
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import csv
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Union
+
+from app.core.db import Database
+from app.core.logger import get_logger, log_duration
+from app.core.metrics import timed
+
+# Inventory valuation maintained from the stock_moves ledger, one move at a time in id
+# order: weighted average cost (WAC) and FIFO layers per product. Inbound moves carry
+# their unit cost (purchase price); moves without one come in at the current average.
+# Issues leave at the current average, which is written back to the move as its cost
+# of goods sold, and consume the oldest FIFO layers.
+# valuation_state.last_move_id is the last move applied: apply_pending() catches up
+# from there, rebuild() replays the whole ledger.
+
+METHODS = ("wac", "fifo")
+OPENING_REFERENCE = "OUVERTURE"
+_EPS = 1e-9
+_CHUNK = 500
+
+
+@dataclass(slots=True)
+class _Layer:
+    id: Optional[int]
+    move_id: int
+    qty: float
+    unit_cost: float
+    changed: bool = False
+
+
+@dataclass(slots=True)
+class _State:
+    qty: float = 0.0
+    avg_cost: float = 0.0
+    value: float = 0.0
+    # FIFO: quantity issued while no layer was left (negative stock), covered by the next receipt
+    backlog: float = 0.0
+    layers: deque = field(default_factory=deque)
+    dropped: list = field(default_factory=list)
+
+    def receive(self, move_id: int, qty: float, unit_cost: Optional[float]) -> None:
+        cost = self.avg_cost if unit_cost is None else unit_cost
+        new_qty = self.qty + qty
+        if self.qty <= _EPS:
+            self.avg_cost = cost
+            self.value = new_qty * cost
+        else:
+            self.value += qty * cost
+            self.avg_cost = self.value / new_qty if new_qty > _EPS else cost
+        self.qty = new_qty
+        covered = min(self.backlog, qty)
+        self.backlog -= covered
+        if qty - covered > _EPS:
+            self.layers.append(_Layer(None, move_id, qty - covered, cost))
+
+    def issue(self, qty: float) -> float:
+        cost = self.avg_cost
+        self.qty -= qty
+        self.value = self.qty * cost if self.qty <= _EPS else self.value - qty * cost
+        left = qty
+        while left > _EPS and self.layers:
+            layer = self.layers[0]
+            taken = min(layer.qty, left)
+            layer.qty -= taken
+            layer.changed = True
+            left -= taken
+            if layer.qty <= _EPS:
+                self.layers.popleft()
+                if layer.id is not None:
+                    self.dropped.append(layer.id)
+        if left > _EPS:
+            self.backlog += left
+        return cost
+
+    def apply(self, move_id: int, qty: float, kind: str, unit_cost: Optional[float]) -> Optional[float]:
+        # Returns the cost of an issue, to be written back to the move
+        signed = qty if kind == "in" else -qty
+        if signed >= 0:
+            self.receive(move_id, signed, unit_cost)
+            return None
+        return self.issue(-signed)
+
+    @property
+    def fifo_value(self) -> float:
+        return sum(l.qty * l.unit_cost for l in self.layers)
+
+
+def _marks(values: list) -> str:
+    return ", ".join("?" for _ in values)
+
+
+def _last_move_id(db: Database) -> int:
+    return db.scalar("SELECT last_move_id FROM valuation_state WHERE id = 1;") or 0
+
+
+def _load_states(db: Database, product_ids: list[int]) -> dict[int, _State]:
+    states = {p: _State() for p in product_ids}
+    for i in range(0, len(product_ids), _CHUNK):
+        chunk = product_ids[i:i + _CHUNK]
+        for r in db.query(f"SELECT product_id, qty, avg_cost, value, fifo_backlog FROM stock_valuation WHERE product_id IN ({_marks(chunk)});", chunk):
+            s = states[r["product_id"]]
+            s.qty, s.avg_cost, s.value, s.backlog = r["qty"], r["avg_cost"], r["value"], r["fifo_backlog"]
+        for r in db.query(f"SELECT id, product_id, move_id, qty_left, unit_cost FROM fifo_layers WHERE product_id IN ({_marks(chunk)}) ORDER BY product_id, id;", chunk):
+            states[r["product_id"]].layers.append(_Layer(r["id"], r["move_id"], r["qty_left"], r["unit_cost"]))
+    return states
+
+
+def _save_states(db: Database, states: dict[int, _State], costs: list[tuple[float, int]], last_move_id: int) -> None:
+    db.executemany(
+        """
+        INSERT INTO stock_valuation (product_id, qty, avg_cost, value, fifo_value, fifo_backlog) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(product_id) DO UPDATE SET qty = excluded.qty, avg_cost = excluded.avg_cost, value = excluded.value,
+            fifo_value = excluded.fifo_value, fifo_backlog = excluded.fifo_backlog;
+        """,
+        [(p, s.qty, s.avg_cost, s.value, s.fifo_value, s.backlog) for p, s in states.items()],
+    )
+    dropped = [(layer_id,) for s in states.values() for layer_id in s.dropped]
+    if dropped:
+        db.executemany("DELETE FROM fifo_layers WHERE id = ?;", dropped)
+    db.executemany(
+        "UPDATE fifo_layers SET qty_left = ? WHERE id = ?;",
+        [(l.qty, l.id) for s in states.values() for l in s.layers if l.id is not None and l.changed],
+    )
+    db.executemany(
+        "INSERT INTO fifo_layers (product_id, move_id, qty_left, unit_cost) VALUES (?, ?, ?, ?);",
+        [(p, l.move_id, l.qty, l.unit_cost) for p, s in states.items() for l in s.layers if l.id is None],
+    )
+    if costs:
+        db.executemany("UPDATE stock_moves SET unit_cost = ? WHERE id = ?;", costs)
+    db.execute(
+        "INSERT INTO valuation_state (id, last_move_id) VALUES (1, ?) ON CONFLICT(id) DO UPDATE SET last_move_id = excluded.last_move_id;",
+        (last_move_id,),
+    )
+
+
+@timed("valuation.apply")
+def apply_pending(db: Database) -> int:
+    # Values the moves posted since the last call; called by the stock engine in the
+    # transaction that wrote them. Returns the number of moves applied.
+    with db.transaction():
+        last = _last_move_id(db)
+        moves = db.query("SELECT id, product_id, qty, kind, unit_cost FROM stock_moves WHERE id > ? ORDER BY id;", (last,))
+        if not moves:
+            return 0
+        states = _load_states(db, sorted({m["product_id"] for m in moves}))
+        costs = []
+        for m in moves:
+            cost = states[m["product_id"]].apply(m["id"], m["qty"], m["kind"], m["unit_cost"])
+            if cost is not None:
+                costs.append((cost, m["id"]))
+        _save_states(db, states, costs, moves[-1]["id"])
+    return len(moves)
+
+
+def rebuild(db: Database) -> int:
+    # Full recompute from the ledger, for corrections (a purchase cost fixed after the
+    # fact, moves imported by hand). Returns the number of moves replayed.
+    logger = get_logger(__name__)
+    with log_duration(logger, "Inventory valuation rebuild"), db.transaction():
+        db.execute("DELETE FROM fifo_layers;")
+        db.execute("DELETE FROM stock_valuation;")
+        states: dict[int, _State] = {}
+        costs: list[tuple[float, int]] = []
+        count = last = 0
+        for m in db.iter_query("SELECT id, product_id, qty, kind, unit_cost FROM stock_moves ORDER BY id;", size=5000):
+            state = states.get(m["product_id"])
+            if state is None:
+                state = states[m["product_id"]] = _State()
+            cost = state.apply(m["id"], m["qty"], m["kind"], m["unit_cost"])
+            if cost is not None and (m["unit_cost"] is None or abs(cost - m["unit_cost"]) > _EPS):
+                costs.append((cost, m["id"]))
+            count, last = count + 1, m["id"]
+        _save_states(db, states, costs, last)
+    logger.info(f"Inventory valuation rebuilt from {count} moves")
+    return count
+
+
+def open_balances(db: Database) -> int:
+    # Brings the ledger in line with stock (quantities entered before stock moves were
+    # posted) with one OUVERTURE move per product, valued at the last purchase price
+    with db.transaction():
+        cur = db.execute(
+            f"""
+            INSERT INTO stock_moves (product_id, qty, kind, reference, unit_cost)
+            SELECT s.product_id, ABS(s.qty - IFNULL(m.net, 0)),
+                   CASE WHEN s.qty > IFNULL(m.net, 0) THEN 'in' ELSE 'out' END, ?, c.unit_price
+            FROM stock s
+            LEFT JOIN (
+                SELECT product_id, SUM(CASE kind WHEN 'in' THEN qty ELSE -qty END) AS net FROM stock_moves GROUP BY product_id
+            ) m ON m.product_id = s.product_id
+            LEFT JOIN (
+                SELECT product_id, unit_price FROM document_lines WHERE id IN (
+                    SELECT MAX(l.id) FROM document_lines l JOIN documents d ON d.id = l.document_id
+                    WHERE d.kind = 'purchase' AND d.status = 'validated' AND l.product_id IS NOT NULL
+                    GROUP BY l.product_id
+                )
+            ) c ON c.product_id = s.product_id
+            WHERE ABS(s.qty - IFNULL(m.net, 0)) > {_EPS}
+            ORDER BY s.product_id;
+            """,
+            (OPENING_REFERENCE,),
+        )
+    return cur.rowcount
+
+
+def valuation_totals(db: Database) -> dict:
+    row = db.query("SELECT COUNT(*) AS products, IFNULL(SUM(qty), 0) AS qty, IFNULL(SUM(value), 0) AS wac, IFNULL(SUM(fifo_value), 0) AS fifo FROM stock_valuation WHERE qty <> 0;")[0]
+    return dict(row)
+
+
+REPORT_FIELDS = ("product_id", "sku", "name_fr", "qty", "avg_cost", "value", "fifo_value")
+
+
+@timed("valuation.export_csv")
+def export_valuation_csv(db: Database, path: Union[str, Path]) -> int:
+    # Read from the maintained state: one indexed join, no ledger replay
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(REPORT_FIELDS)
+        for r in db.iter_query(
+            """
+            SELECT p.id, p.sku, p.name_fr, v.qty, round(v.avg_cost, 4), round(v.value, 2), round(v.fifo_value, 2)
+            FROM stock_valuation v
+            JOIN products p ON p.id = v.product_id
+            WHERE v.qty <> 0
+            ORDER BY p.sku;
+            """
+        ):
+            writer.writerow(tuple(r))
+            count += 1
+    return count
@@ -0,0 +1,4 @@
+-- Lookups used by document rendering and customer statements
+CREATE INDEX IF NOT EXISTS idx_document_lines_document ON document_lines(document_id);
+CREATE INDEX IF NOT EXISTS idx_documents_partner_kind_date ON documents(partner_id, kind, date);
+CREATE INDEX IF NOT EXISTS idx_payments_document ON payments(document_id, paid_at);
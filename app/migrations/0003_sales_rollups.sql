@@ -0,0 +1,45 @@
+-- Sales rollups, maintained when documents are validated (see app/core/rollups.py).
+-- partner_id/product_id use 0 for documents without partner and free-text lines.
+CREATE TABLE IF NOT EXISTS rollup_daily (
+    day TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    partner_id INTEGER NOT NULL DEFAULT 0,
+    doc_count INTEGER NOT NULL DEFAULT 0,
+    total_ht REAL NOT NULL DEFAULT 0,
+    total_tva REAL NOT NULL DEFAULT 0,
+    total_ttc REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, kind, partner_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_monthly (
+    month TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    partner_id INTEGER NOT NULL DEFAULT 0,
+    doc_count INTEGER NOT NULL DEFAULT 0,
+    total_ht REAL NOT NULL DEFAULT 0,
+    total_tva REAL NOT NULL DEFAULT 0,
+    total_ttc REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, kind, partner_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_product_daily (
+    day TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    product_id INTEGER NOT NULL DEFAULT 0,
+    line_count INTEGER NOT NULL DEFAULT 0,
+    qty REAL NOT NULL DEFAULT 0,
+    total_ht REAL NOT NULL DEFAULT 0,
+    total_ttc REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, kind, product_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_product_monthly (
+    month TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    product_id INTEGER NOT NULL DEFAULT 0,
+    line_count INTEGER NOT NULL DEFAULT 0,
+    qty REAL NOT NULL DEFAULT 0,
+    total_ht REAL NOT NULL DEFAULT 0,
+    total_ttc REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, kind, product_id)
+) WITHOUT ROWID;
@@ -0,0 +1,26 @@
+-- Amount paid per document, kept in sync with payments by triggers.
+-- open_balance is derived from it and indexed for open invoices only.
+ALTER TABLE documents ADD COLUMN paid_total REAL NOT NULL DEFAULT 0;
+ALTER TABLE documents ADD COLUMN open_balance REAL GENERATED ALWAYS AS (ROUND(total_ttc - paid_total, 2)) VIRTUAL;
+
+UPDATE documents SET paid_total = IFNULL((SELECT SUM(amount) FROM payments WHERE payments.document_id = documents.id), 0);
+
+CREATE INDEX IF NOT EXISTS idx_documents_open_invoices ON documents(partner_id, date) WHERE kind = 'invoice' AND open_balance > 0;
+
+CREATE TRIGGER IF NOT EXISTS trg_payments_paid_ai AFTER INSERT ON payments
+WHEN NEW.document_id IS NOT NULL
+BEGIN
+    UPDATE documents SET paid_total = paid_total + NEW.amount WHERE id = NEW.document_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_payments_paid_ad AFTER DELETE ON payments
+WHEN OLD.document_id IS NOT NULL
+BEGIN
+    UPDATE documents SET paid_total = paid_total - OLD.amount WHERE id = OLD.document_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_payments_paid_au AFTER UPDATE OF document_id, amount ON payments
+BEGIN
+    UPDATE documents SET paid_total = paid_total - OLD.amount WHERE id = OLD.document_id;
+    UPDATE documents SET paid_total = paid_total + NEW.amount WHERE id = NEW.document_id;
+END;
@@ -0,0 +1,55 @@
+-- Running balance on every cash movement, set on insert
+ALTER TABLE cash_register ADD COLUMN balance_after REAL;
+
+UPDATE cash_register SET balance_after = r.balance
+FROM (
+    SELECT id, SUM(CASE movement WHEN 'in' THEN amount ELSE -amount END) OVER (ORDER BY id) AS balance
+    FROM cash_register
+) r
+WHERE r.id = cash_register.id;
+
+CREATE TRIGGER IF NOT EXISTS trg_cash_register_balance AFTER INSERT ON cash_register
+BEGIN
+    UPDATE cash_register
+    SET balance_after = IFNULL((SELECT balance_after FROM cash_register WHERE id < NEW.id ORDER BY id DESC LIMIT 1), 0)
+                        + CASE NEW.movement WHEN 'in' THEN NEW.amount ELSE -NEW.amount END
+    WHERE id = NEW.id;
+END;
+
+-- Movements are append-only: corrections are posted as new movements
+CREATE TRIGGER IF NOT EXISTS trg_cash_register_no_update BEFORE UPDATE OF movement, amount ON cash_register
+BEGIN
+    SELECT RAISE(ABORT, 'cash movements cannot be modified');
+END;
+
+-- Daily "Z" closings freeze the totals of every movement up to last_movement_id
+CREATE TABLE IF NOT EXISTS cash_closings (
+    day TEXT PRIMARY KEY,
+    opening_balance REAL NOT NULL DEFAULT 0,
+    total_in REAL NOT NULL DEFAULT 0,
+    total_out REAL NOT NULL DEFAULT 0,
+    closing_balance REAL NOT NULL DEFAULT 0,
+    movement_count INTEGER NOT NULL DEFAULT 0,
+    last_movement_id INTEGER NOT NULL DEFAULT 0,
+    user_id INTEGER,
+    closed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS cash_closing_totals (
+    day TEXT NOT NULL,
+    movement TEXT NOT NULL,
+    label TEXT NOT NULL,
+    movement_count INTEGER NOT NULL DEFAULT 0,
+    total REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, movement, label),
+    FOREIGN KEY(day) REFERENCES cash_closings(day) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_cash_closings_last_movement ON cash_closings(last_movement_id);
+
+-- Open-period movements cannot be deleted; closed ones may be (archiving)
+CREATE TRIGGER IF NOT EXISTS trg_cash_register_no_delete BEFORE DELETE ON cash_register
+WHEN OLD.id > IFNULL((SELECT MAX(last_movement_id) FROM cash_closings), 0)
+BEGIN
+    SELECT RAISE(ABORT, 'open cash movements cannot be deleted');
+END;
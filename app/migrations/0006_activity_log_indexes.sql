@@ -0,0 +1,4 @@
+-- Time-range and entity lookups for the audit log
+CREATE INDEX IF NOT EXISTS idx_activity_log_created ON activity_log(created_at);
+CREATE INDEX IF NOT EXISTS idx_activity_log_entity ON activity_log(entity, entity_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_activity_log_user ON activity_log(user_id, created_at);
@@ -0,0 +1,213 @@
+-- Change data capture for store-to-store sync.
+-- Every insert/update/delete on a synced table bumps the row's version and
+-- appends a compact entry (table, row id, op, version) to change_log; the row
+-- data itself is read at export time. author is NULL for local changes and the
+-- store code for changes applied from a peer. Capture can be suspended through
+-- cdc_state (sync apply, archiving).
+CREATE TABLE IF NOT EXISTS cdc_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    capture INTEGER NOT NULL DEFAULT 1
+);
+INSERT OR IGNORE INTO cdc_state (id, capture) VALUES (1, 1);
+
+CREATE TABLE IF NOT EXISTS row_versions (
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    author TEXT,
+    changed_at TEXT NOT NULL,
+    PRIMARY KEY (table_name, row_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    op TEXT NOT NULL CHECK (op IN ('I', 'U', 'D')),
+    version INTEGER NOT NULL,
+    author TEXT,
+    changed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log(table_name, row_id);
+
+-- Rows received from other stores: global key (origin store, id there) -> local id
+CREATE TABLE IF NOT EXISTS sync_map (
+    table_name TEXT NOT NULL,
+    origin TEXT NOT NULL,
+    origin_id INTEGER NOT NULL,
+    local_id INTEGER NOT NULL,
+    PRIMARY KEY (table_name, origin, origin_id)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sync_map_local ON sync_map(table_name, local_id);
+
+CREATE TABLE IF NOT EXISTS sync_peers (
+    store TEXT PRIMARY KEY,
+    sent_seq INTEGER NOT NULL DEFAULT 0,
+    received_seq INTEGER NOT NULL DEFAULT 0,
+    last_sent_at TEXT,
+    last_received_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS sync_conflicts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    origin TEXT NOT NULL,
+    origin_id INTEGER NOT NULL,
+    author TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    reason TEXT NOT NULL,
+    payload TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- partners
+CREATE TRIGGER IF NOT EXISTS trg_cdc_partners_ai AFTER INSERT ON partners
+WHEN (SELECT capture FROM cdc_state WHERE id = 1) = 1
+BEGIN
+    INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES ('partners', NEW.id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT(table_name, row_id) DO UPDATE SET version = version + 1, author = NULL, changed_at = excluded.changed_at;
+    INSERT INTO change_log (table_name, row_id, op, version, author, changed_at)
+        SELECT 'partners', row_id, 'I', version, NULL, changed_at FROM row_versions WHERE table_name = 'partners' AND row_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cdc_partners_au AFTER UPDATE ON partners
+WHEN (SELECT capture FROM cdc_state WHERE id = 1) = 1
+BEGIN
+    INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES ('partners', NEW.id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT(table_name, row_id) DO UPDATE SET version = version + 1, author = NULL, changed_at = excluded.changed_at;
+    INSERT INTO change_log (table_name, row_id, op, version, author, changed_at)
+        SELECT 'partners', row_id, 'U', version, NULL, changed_at FROM row_versions WHERE table_name = 'partners' AND row_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cdc_partners_ad AFTER DELETE ON partners
+WHEN (SELECT capture FROM cdc_state WHERE id = 1) = 1
+BEGIN
+    INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES ('partners', OLD.id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT(table_name, row_id) DO UPDATE SET version = version + 1, author = NULL, changed_at = excluded.changed_at;
+    INSERT INTO change_log (table_name, row_id, op, version, author, changed_at)
+        SELECT 'partners', row_id, 'D', version, NULL, changed_at FROM row_versions WHERE table_name = 'partners' AND row_id = OLD.id;
+END;
+
+-- products
+CREATE TRIGGER IF NOT EXISTS trg_cdc_products_ai AFTER INSERT ON products
+WHEN (SELECT capture FROM cdc_state WHERE id = 1) = 1
+BEGIN
+    INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES ('products', NEW.id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT(table_name, row_id) DO UPDATE SET version = version + 1, author = NULL, changed_at = excluded.changed_at;
+    INSERT INTO change_log (table_name, row_id, op, version, author, changed_at)
+        SELECT 'products', row_id, 'I', version, NULL, changed_at FROM row_versions WHERE table_name = 'products' AND row_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cdc_products_au AFTER UPDATE ON products
+WHEN (SELECT capture FROM cdc_state WHERE id = 1) = 1
+BEGIN
+    INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES ('products', NEW.id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT(table_name, row_id) DO UPDATE SET version = version + 1, author = NULL, changed_at = excluded.changed_at;
+    INSERT INTO change_log (table_name, row_id, op, version, author, changed_at)
+        SELECT 'products', row_id, 'U', version, NULL, changed_at FROM row_versions WHERE table_name = 'products' AND row_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cdc_products_ad AFTER DELETE ON products
+WHEN (SELECT capture FROM cdc_state WHERE id = 1) = 1
+BEGIN
+    INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES ('products', OLD.id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT(table_name, row_id) DO UPDATE SET version = version + 1, author = NULL, changed_at = excluded.changed_at;
+    INSERT INTO change_log (table_name, row_id, op, version, author, changed_at)
+        SELECT 'products', row_id, 'D', version, NULL, changed_at FROM row_versions WHERE table_name = 'products' AND row_id = OLD.id;
+END;
+
+-- documents
+CREATE TRIGGER IF NOT EXISTS trg_cdc_documents_ai AFTER INSERT ON documents
+WHEN (SELECT capture FROM cdc_state WHERE id = 1) = 1
+BEGIN
+    INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES ('documents', NEW.id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT(table_name, row_id) DO UPDATE SET version = version + 1, author = NULL, changed_at = excluded.changed_at;
+    INSERT INTO change_log (table_name, row_id, op, version, author, changed_at)
+        SELECT 'documents', row_id, 'I', version, NULL, changed_at FROM row_versions WHERE table_name = 'documents' AND row_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cdc_documents_au AFTER UPDATE OF kind, number, partner_id, date, total_ht, total_tva, total_ttc, status, notes ON documents
+WHEN (SELECT capture FROM cdc_state WHERE id = 1) = 1
+BEGIN
+    INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES ('documents', NEW.id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT(table_name, row_id) DO UPDATE SET version = version + 1, author = NULL, changed_at = excluded.changed_at;
+    INSERT INTO change_log (table_name, row_id, op, version, author, changed_at)
+        SELECT 'documents', row_id, 'U', version, NULL, changed_at FROM row_versions WHERE table_name = 'documents' AND row_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cdc_documents_ad AFTER DELETE ON documents
+WHEN (SELECT capture FROM cdc_state WHERE id = 1) = 1
+BEGIN
+    INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES ('documents', OLD.id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT(table_name, row_id) DO UPDATE SET version = version + 1, author = NULL, changed_at = excluded.changed_at;
+    INSERT INTO change_log (table_name, row_id, op, version, author, changed_at)
+        SELECT 'documents', row_id, 'D', version, NULL, changed_at FROM row_versions WHERE table_name = 'documents' AND row_id = OLD.id;
+END;
+
+-- document_lines
+CREATE TRIGGER IF NOT EXISTS trg_cdc_document_lines_ai AFTER INSERT ON document_lines
+WHEN (SELECT capture FROM cdc_state WHERE id = 1) = 1
+BEGIN
+    INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES ('document_lines', NEW.id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT(table_name, row_id) DO UPDATE SET version = version + 1, author = NULL, changed_at = excluded.changed_at;
+    INSERT INTO change_log (table_name, row_id, op, version, author, changed_at)
+        SELECT 'document_lines', row_id, 'I', version, NULL, changed_at FROM row_versions WHERE table_name = 'document_lines' AND row_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cdc_document_lines_au AFTER UPDATE ON document_lines
+WHEN (SELECT capture FROM cdc_state WHERE id = 1) = 1
+BEGIN
+    INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES ('document_lines', NEW.id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT(table_name, row_id) DO UPDATE SET version = version + 1, author = NULL, changed_at = excluded.changed_at;
+    INSERT INTO change_log (table_name, row_id, op, version, author, changed_at)
+        SELECT 'document_lines', row_id, 'U', version, NULL, changed_at FROM row_versions WHERE table_name = 'document_lines' AND row_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cdc_document_lines_ad AFTER DELETE ON document_lines
+WHEN (SELECT capture FROM cdc_state WHERE id = 1) = 1
+BEGIN
+    INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES ('document_lines', OLD.id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT(table_name, row_id) DO UPDATE SET version = version + 1, author = NULL, changed_at = excluded.changed_at;
+    INSERT INTO change_log (table_name, row_id, op, version, author, changed_at)
+        SELECT 'document_lines', row_id, 'D', version, NULL, changed_at FROM row_versions WHERE table_name = 'document_lines' AND row_id = OLD.id;
+END;
+
+-- payments
+CREATE TRIGGER IF NOT EXISTS trg_cdc_payments_ai AFTER INSERT ON payments
+WHEN (SELECT capture FROM cdc_state WHERE id = 1) = 1
+BEGIN
+    INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES ('payments', NEW.id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT(table_name, row_id) DO UPDATE SET version = version + 1, author = NULL, changed_at = excluded.changed_at;
+    INSERT INTO change_log (table_name, row_id, op, version, author, changed_at)
+        SELECT 'payments', row_id, 'I', version, NULL, changed_at FROM row_versions WHERE table_name = 'payments' AND row_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cdc_payments_au AFTER UPDATE OF document_id, method, amount, paid_at ON payments
+WHEN (SELECT capture FROM cdc_state WHERE id = 1) = 1
+BEGIN
+    INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES ('payments', NEW.id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT(table_name, row_id) DO UPDATE SET version = version + 1, author = NULL, changed_at = excluded.changed_at;
+    INSERT INTO change_log (table_name, row_id, op, version, author, changed_at)
+        SELECT 'payments', row_id, 'U', version, NULL, changed_at FROM row_versions WHERE table_name = 'payments' AND row_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cdc_payments_ad AFTER DELETE ON payments
+WHEN (SELECT capture FROM cdc_state WHERE id = 1) = 1
+BEGIN
+    INSERT INTO row_versions (table_name, row_id, version, author, changed_at) VALUES ('payments', OLD.id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT(table_name, row_id) DO UPDATE SET version = version + 1, author = NULL, changed_at = excluded.changed_at;
+    INSERT INTO change_log (table_name, row_id, op, version, author, changed_at)
+        SELECT 'payments', row_id, 'D', version, NULL, changed_at FROM row_versions WHERE table_name = 'payments' AND row_id = OLD.id;
+END;
+
+-- Existing rows become the initial snapshot
+INSERT OR IGNORE INTO row_versions (table_name, row_id, version, author, changed_at) SELECT 'partners', id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now') FROM partners;
+INSERT OR IGNORE INTO row_versions (table_name, row_id, version, author, changed_at) SELECT 'products', id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now') FROM products;
+INSERT OR IGNORE INTO row_versions (table_name, row_id, version, author, changed_at) SELECT 'documents', id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now') FROM documents;
+INSERT OR IGNORE INTO row_versions (table_name, row_id, version, author, changed_at) SELECT 'document_lines', id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now') FROM document_lines;
+INSERT OR IGNORE INTO row_versions (table_name, row_id, version, author, changed_at) SELECT 'payments', id, 1, NULL, strftime('%Y-%m-%d %H:%M:%f', 'now') FROM payments;
+INSERT INTO change_log (table_name, row_id, op, version, author, changed_at) SELECT table_name, row_id, 'I', version, NULL, changed_at FROM row_versions WHERE table_name = 'partners';
+INSERT INTO change_log (table_name, row_id, op, version, author, changed_at) SELECT table_name, row_id, 'I', version, NULL, changed_at FROM row_versions WHERE table_name = 'products';
+INSERT INTO change_log (table_name, row_id, op, version, author, changed_at) SELECT table_name, row_id, 'I', version, NULL, changed_at FROM row_versions WHERE table_name = 'documents';
+INSERT INTO change_log (table_name, row_id, op, version, author, changed_at) SELECT table_name, row_id, 'I', version, NULL, changed_at FROM row_versions WHERE table_name = 'document_lines';
+INSERT INTO change_log (table_name, row_id, op, version, author, changed_at) SELECT table_name, row_id, 'I', version, NULL, changed_at FROM row_versions WHERE table_name = 'payments';
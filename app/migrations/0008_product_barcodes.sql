@@ -0,0 +1,4 @@
+-- Barcodes scanned at the point of sale; optional and unique when set
+ALTER TABLE products ADD COLUMN barcode TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_products_barcode ON products(barcode) WHERE barcode IS NOT NULL AND barcode <> '';
@@ -0,0 +1,4 @@
+-- A document converted from another (quote -> delivery -> invoice) points back to it
+ALTER TABLE documents ADD COLUMN source_id INTEGER REFERENCES documents(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_documents_source ON documents(source_id) WHERE source_id IS NOT NULL;
@@ -0,0 +1,2 @@
+-- Documents post their stock moves under their number; cancelling one reverses them
+CREATE INDEX IF NOT EXISTS idx_stock_moves_reference ON stock_moves(reference);
@@ -0,0 +1,173 @@
+# Purchase costs on stock moves and the maintained inventory valuation (WAC and FIFO).
+# Self-contained on purpose: the valuation rules below are those of this version, so
+# later changes to app.core.valuation do not change what this migration does.
+from collections import deque
+
+OPENING_REFERENCE = "OUVERTURE"
+_EPS = 1e-9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stock_valuation (
+    product_id INTEGER PRIMARY KEY,
+    qty REAL NOT NULL DEFAULT 0,
+    avg_cost REAL NOT NULL DEFAULT 0,
+    value REAL NOT NULL DEFAULT 0,
+    fifo_value REAL NOT NULL DEFAULT 0,
+    fifo_backlog REAL NOT NULL DEFAULT 0,
+    FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS fifo_layers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id INTEGER NOT NULL,
+    move_id INTEGER NOT NULL,
+    qty_left REAL NOT NULL,
+    unit_cost REAL NOT NULL,
+    FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_fifo_layers_product ON fifo_layers(product_id, id);
+
+CREATE TABLE IF NOT EXISTS valuation_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_move_id INTEGER NOT NULL
+);
+"""
+
+# Ledger net quantity and last validated purchase price per product, computed once
+# per run (a resumed run recomputes them: a product's net only changes through its
+# own opening move, written in the chunk that covers it)
+OPENING_SOURCES = """
+DROP TABLE IF EXISTS temp.opening_net;
+CREATE TEMP TABLE opening_net AS
+SELECT product_id, SUM(CASE kind WHEN 'in' THEN qty ELSE -qty END) AS net FROM stock_moves GROUP BY product_id;
+CREATE UNIQUE INDEX temp.idx_opening_net ON opening_net(product_id);
+
+DROP TABLE IF EXISTS temp.opening_cost;
+CREATE TEMP TABLE opening_cost AS
+SELECT product_id, unit_price FROM document_lines WHERE id IN (
+    SELECT MAX(l.id) FROM document_lines l JOIN documents d ON d.id = l.document_id
+    WHERE d.kind = 'purchase' AND d.status = 'validated' AND l.product_id IS NOT NULL
+    GROUP BY l.product_id
+);
+CREATE UNIQUE INDEX temp.idx_opening_cost ON opening_cost(product_id);
+"""
+
+
+def _marks(values: list) -> str:
+    return ", ".join("?" for _ in values)
+
+
+def _open_balances(db, product_ids: list[int]) -> None:
+    # One OUVERTURE move per product whose stock differs from its ledger
+    db.execute(
+        f"""
+        INSERT INTO stock_moves (product_id, qty, kind, reference, unit_cost)
+        SELECT s.product_id, ABS(s.qty - IFNULL(m.net, 0)),
+               CASE WHEN s.qty > IFNULL(m.net, 0) THEN 'in' ELSE 'out' END, ?, c.unit_price
+        FROM stock s
+        LEFT JOIN temp.opening_net m ON m.product_id = s.product_id
+        LEFT JOIN temp.opening_cost c ON c.product_id = s.product_id
+        WHERE s.product_id IN ({_marks(product_ids)}) AND ABS(s.qty - IFNULL(m.net, 0)) > {_EPS}
+        ORDER BY s.product_id;
+        """,
+        (OPENING_REFERENCE, *product_ids),
+    )
+
+
+class _State:
+    # Weighted average cost and FIFO layers of one product. Layers are
+    # [id, move_id, qty_left, unit_cost, changed]; id is None until saved.
+    def __init__(self, qty=0.0, avg_cost=0.0, value=0.0, backlog=0.0):
+        self.qty, self.avg_cost, self.value, self.backlog = qty, avg_cost, value, backlog
+        self.layers = deque()
+        self.dropped = []
+
+    def receive(self, move_id, qty, unit_cost):
+        cost = self.avg_cost if unit_cost is None else unit_cost
+        new_qty = self.qty + qty
+        if self.qty <= _EPS:
+            self.avg_cost = cost
+            self.value = new_qty * cost
+        else:
+            self.value += qty * cost
+            self.avg_cost = self.value / new_qty if new_qty > _EPS else cost
+        self.qty = new_qty
+        covered = min(self.backlog, qty)
+        self.backlog -= covered
+        if qty - covered > _EPS:
+            self.layers.append([None, move_id, qty - covered, cost, False])
+
+    def issue(self, qty):
+        cost = self.avg_cost
+        self.qty -= qty
+        self.value = self.qty * cost if self.qty <= _EPS else self.value - qty * cost
+        left = qty
+        while left > _EPS and self.layers:
+            layer = self.layers[0]
+            taken = min(layer[2], left)
+            layer[2] -= taken
+            layer[4] = True
+            left -= taken
+            if layer[2] <= _EPS:
+                self.layers.popleft()
+                if layer[0] is not None:
+                    self.dropped.append(layer[0])
+        if left > _EPS:
+            self.backlog += left
+        return cost
+
+
+def _value_moves(db, move_ids: list[int]) -> None:
+    # Replays a chunk of the ledger on top of the state saved by the previous chunks
+    moves = db.query(f"SELECT id, product_id, qty, kind, unit_cost FROM stock_moves WHERE id IN ({_marks(move_ids)}) ORDER BY id;", move_ids)
+    products = sorted({m["product_id"] for m in moves})
+    states = {p: _State() for p in products}
+    for r in db.query(f"SELECT product_id, qty, avg_cost, value, fifo_backlog FROM stock_valuation WHERE product_id IN ({_marks(products)});", products):
+        states[r["product_id"]] = _State(r["qty"], r["avg_cost"], r["value"], r["fifo_backlog"])
+    for r in db.query(f"SELECT id, product_id, move_id, qty_left, unit_cost FROM fifo_layers WHERE product_id IN ({_marks(products)}) ORDER BY product_id, id;", products):
+        states[r["product_id"]].layers.append([r["id"], r["move_id"], r["qty_left"], r["unit_cost"], False])
+    costs = []
+    for m in moves:
+        state = states[m["product_id"]]
+        if m["kind"] == "in":
+            state.receive(m["id"], m["qty"], m["unit_cost"])
+            continue
+        # Issues leave at the average cost, written back to the move
+        cost = state.issue(m["qty"])
+        if m["unit_cost"] is None or abs(cost - m["unit_cost"]) > _EPS:
+            costs.append((cost, m["id"]))
+    db.executemany(
+        """
+        INSERT INTO stock_valuation (product_id, qty, avg_cost, value, fifo_value, fifo_backlog) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(product_id) DO UPDATE SET qty = excluded.qty, avg_cost = excluded.avg_cost, value = excluded.value,
+            fifo_value = excluded.fifo_value, fifo_backlog = excluded.fifo_backlog;
+        """,
+        [(p, s.qty, s.avg_cost, s.value, sum(l[2] * l[3] for l in s.layers), s.backlog) for p, s in states.items()],
+    )
+    db.executemany("DELETE FROM fifo_layers WHERE id = ?;", [(i,) for s in states.values() for i in s.dropped])
+    db.executemany("UPDATE fifo_layers SET qty_left = ? WHERE id = ?;", [(l[2], l[0]) for s in states.values() for l in s.layers if l[0] is not None and l[4]])
+    db.executemany(
+        "INSERT INTO fifo_layers (product_id, move_id, qty_left, unit_cost) VALUES (?, ?, ?, ?);",
+        [(p, l[1], l[2], l[3]) for p, s in states.items() for l in s.layers if l[0] is None],
+    )
+    db.executemany("UPDATE stock_moves SET unit_cost = ? WHERE id = ?;", costs)
+    db.execute(
+        "INSERT INTO valuation_state (id, last_move_id) VALUES (1, ?) ON CONFLICT(id) DO UPDATE SET last_move_id = excluded.last_move_id;",
+        (moves[-1]["id"],),
+    )
+
+
+def upgrade(ctx) -> None:
+    # Every step can run again after an interruption: the DDL is idempotent and both
+    # backfills commit each chunk with their position. The valuation tables start
+    # empty, and what a chunk saves is exactly the state at its recorded position.
+    columns = {r["name"] for r in ctx.db.query("PRAGMA table_info(stock_moves);")}
+    if "unit_cost" not in columns:
+        ctx.execute_script("ALTER TABLE stock_moves ADD COLUMN unit_cost REAL;")
+    ctx.execute_script(SCHEMA)
+    ctx.execute_script(OPENING_SOURCES)
+    ctx.backfill("opening", "products", _open_balances)
+    ctx.execute_script("DROP TABLE IF EXISTS temp.opening_net; DROP TABLE IF EXISTS temp.opening_cost;")
+    opened = ctx.db.scalar("SELECT COUNT(*) FROM stock_moves WHERE reference = ?;", (OPENING_REFERENCE,))
+    ctx.logger.info(f"{opened} opening stock moves")
+    ctx.backfill("valuation", "stock_moves", _value_moves, chunk_size=5000)
@@ -0,0 +1,5 @@
+-- Supplier lead time for reorder points (NULL: the replenish_lead_days setting)
+ALTER TABLE partners ADD COLUMN lead_time_days INTEGER;
+
+-- Sales velocity reads the outgoing moves of a date window
+CREATE INDEX IF NOT EXISTS idx_stock_moves_out_date ON stock_moves(created_at, product_id) WHERE kind = 'out';
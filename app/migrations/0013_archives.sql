@@ -0,0 +1,10 @@
+-- Closed fiscal years moved to archive/app-<year>.db (see app.core.archive)
+CREATE TABLE IF NOT EXISTS archives (
+    year INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    documents INTEGER NOT NULL DEFAULT 0,
+    document_lines INTEGER NOT NULL DEFAULT 0,
+    payments INTEGER NOT NULL DEFAULT 0,
+    cash_register INTEGER NOT NULL DEFAULT 0,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,4 @@
+-- sync_peers.sent_seq used to advance when a delta was built, before the peer had
+-- applied it: it now only moves on the peer's acknowledgement. Start over so the
+-- changes lost that way are offered again (re-applying a change is a no-op).
+UPDATE sync_peers SET sent_seq = 0;
@@ -0,0 +1,30 @@
+-- Closings cover a created_at range [period_start, period_end) instead of every
+-- movement up to last_movement_id: ids only follow created_at when movements are
+-- entered in order, and one dated back would pull later days into an earlier closing.
+ALTER TABLE cash_closings ADD COLUMN period_start TEXT;
+ALTER TABLE cash_closings ADD COLUMN period_end TEXT;
+
+-- Existing closings end with their day, or when they were made if that was earlier
+-- (movements posted after a same-day closing went to the next one)
+UPDATE cash_closings SET period_end = MIN(datetime(day, '+1 day', 'utc'), IFNULL(closed_at, datetime(day, '+1 day', 'utc')));
+UPDATE cash_closings SET period_start = p.previous
+FROM (SELECT day, LAG(period_end) OVER (ORDER BY day) AS previous FROM cash_closings) p
+WHERE p.day = cash_closings.day;
+
+CREATE INDEX IF NOT EXISTS idx_cash_closings_period_end ON cash_closings(period_end);
+CREATE INDEX IF NOT EXISTS idx_cash_register_created ON cash_register(created_at);
+
+-- A closed period is frozen: no movement can be dated into it
+CREATE TRIGGER IF NOT EXISTS trg_cash_register_closed_period BEFORE INSERT ON cash_register
+WHEN NEW.created_at < (SELECT MAX(period_end) FROM cash_closings)
+BEGIN
+    SELECT RAISE(ABORT, 'cash movements cannot be dated in a closed period');
+END;
+
+-- Open-period movements cannot be deleted; closed ones may be (archiving)
+DROP TRIGGER IF EXISTS trg_cash_register_no_delete;
+CREATE TRIGGER IF NOT EXISTS trg_cash_register_no_delete BEFORE DELETE ON cash_register
+WHEN OLD.created_at >= IFNULL((SELECT MAX(period_end) FROM cash_closings), '')
+BEGIN
+    SELECT RAISE(ABORT, 'open cash movements cannot be deleted');
+END;
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from PySide6.QtCore import QDate, Slot
+from PySide6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QComboBox, QDateEdit, QAbstractItemView
+
+from app.core.audit import audited_entities, get_audit, query_activity
+from app.core.db import Database
+
+
+class AuditDialog(QDialog):
+    PAGE_SIZE = 200
+
+    def __init__(self, db: Database, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._oldest_id: int | None = None
+        self.setWindowTitle(self.tr("Journal d'activité"))
+        self.resize(900, 600)
+        self._build_ui()
+        self._load()
+
+    def _build_ui(self) -> None:
+        layout = QVBoxLayout(self)
+        top = QHBoxLayout()
+        today = QDate.currentDate()
+        self.fromEdit = QDateEdit(today.addDays(-30), self)
+        self.fromEdit.setCalendarPopup(True)
+        self.toEdit = QDateEdit(today, self)
+        self.toEdit.setCalendarPopup(True)
+        self.entityCombo = QComboBox(self)
+        self.entityCombo.addItem(self.tr("Toutes les entités"), None)
+        self.refreshBtn = QPushButton(self.tr("Actualiser"))
+        for w in [self.fromEdit, self.toEdit, self.entityCombo, self.refreshBtn]:
+            top.addWidget(w)
+        layout.addLayout(top)
+
+        self.table = QTableWidget(self)
+        self.table.setColumnCount(6)
+        self.table.setHorizontalHeaderLabels([self.tr("Date"), self.tr("Utilisateur"), self.tr("Action"), self.tr("Entité"), self.tr("ID"), self.tr("Détails")])
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        self.moreBtn = QPushButton(self.tr("Charger plus"))
+        layout.addWidget(self.moreBtn)
+
+        self.refreshBtn.clicked.connect(self._load)
+        self.moreBtn.clicked.connect(self._load_more)
+        self.entityCombo.currentIndexChanged.connect(self._load)
+
+    def _filters(self) -> dict:
+        return {
+            "start": self.fromEdit.date().toString("yyyy-MM-dd"),
+            "end": self.toEdit.date().addDays(1).toString("yyyy-MM-dd"),
+            "entity": self.entityCombo.currentData(),
+        }
+
+    def _load(self) -> None:
+        # Pending entries are still queued in the writer; make them visible first
+        audit = get_audit()
+        if audit is not None:
+            audit.flush()
+        if self.entityCombo.count() == 1:
+            for entity in audited_entities(self.db):
+                self.entityCombo.addItem(entity, entity)
+        self._oldest_id = None
+        self.table.setRowCount(0)
+        self._load_more()
+
+    @Slot()
+    def _load_more(self) -> None:
+        rows = query_activity(self.db, before_id=self._oldest_id, limit=self.PAGE_SIZE, **self._filters())
+        start = self.table.rowCount()
+        self.table.setRowCount(start + len(rows))
+        for r, row in enumerate(rows, start=start):
+            self.table.setItem(r, 0, QTableWidgetItem(row["created_at"] or ""))
+            self.table.setItem(r, 1, QTableWidgetItem(row["username"]))
+            self.table.setItem(r, 2, QTableWidgetItem(row["action"]))
+            self.table.setItem(r, 3, QTableWidgetItem(row["entity"] or ""))
+            self.table.setItem(r, 4, QTableWidgetItem("" if row["entity_id"] is None else str(row["entity_id"])))
+            self.table.setItem(r, 5, QTableWidgetItem(row["details"] or ""))
+        if rows:
+            self._oldest_id = rows[-1]["id"]
+        self.moreBtn.setEnabled(len(rows) == self.PAGE_SIZE)
+        self.table.resizeColumnsToContents()
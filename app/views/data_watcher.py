@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from typing import Callable, Iterable, Optional
+
+from PySide6.QtCore import QEvent, QObject, QTimer, Signal, Slot
+from PySide6.QtWidgets import QTableWidget, QWidget
+
+from app.core.changes import change_bus
+from app.core.db import Database
+
+
+# Above this many changed rows a list is reloaded rather than patched
+PATCH_LIMIT = 500
+
+
+class DataWatcher(QObject):
+    # Subscribes a view to the change bus for the tables it shows. Events are merged and
+    # delivered once control is back in the event loop, and held while the view is
+    # hidden: a view refreshes once per batch of writes, and only when on screen.
+    changed = Signal(object)
+
+    def __init__(self, db: Database, tables: Iterable[str], view: QWidget):
+        super().__init__(view)
+        self.view = view
+        self._pending: dict[str, Optional[frozenset[int]]] = {}
+        self._flushTimer = QTimer(self)
+        self._flushTimer.setSingleShot(True)
+        self._flushTimer.setInterval(0)
+        self._flushTimer.timeout.connect(self._flush)
+        unsubscribe = change_bus(db).subscribe(tables, self._on_changes)
+        view.destroyed.connect(lambda *_: unsubscribe())
+        view.installEventFilter(self)
+
+    def _on_changes(self, changes: dict) -> None:
+        for table, ids in changes.items():
+            if table not in self._pending:
+                self._pending[table] = ids
+            elif self._pending[table] is not None:
+                self._pending[table] = None if ids is None else self._pending[table] | ids
+        if self.view.isVisible():
+            self._flushTimer.start()
+
+    def eventFilter(self, watched, event) -> bool:
+        if event.type() == QEvent.Show and self._pending:
+            self._flushTimer.start()
+        return False
+
+    @Slot()
+    def _flush(self) -> None:
+        if not self._pending or not self.view.isVisible():
+            return
+        changes, self._pending = self._pending, {}
+        self.changed.emit(changes)
+
+
+class ChangePoller(QObject):
+    # Feeds the bus with what other processes commit (service, second instance, sync)
+    LOCAL_MS = 1000
+    REMOTE_MS = 3000
+
+    def __init__(self, db: Database, parent=None):
+        super().__init__(parent)
+        self.bus = change_bus(db)
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.LOCAL_MS if db.path is not None else self.REMOTE_MS)
+        self.timer.timeout.connect(self._poll)
+        self.timer.start()
+
+    @Slot()
+    def _poll(self) -> None:
+        if not self.bus.db.in_transaction:
+            self.bus.poll()
+
+
+def patch_rows(table: QTableWidget, ids: Iterable[int], rows: list, fill: Callable[[int, object], None]) -> None:
+    # Applies a change to a list ordered by id descending (the id in column 0): `rows`
+    # are the changed ids still matching the list, re-read; the other ids are removed
+    shown = {int(table.item(r, 0).text()): r for r in range(table.rowCount())}
+    found = {row[0]: row for row in rows}
+    for r in sorted((shown[i] for i in ids if i in shown and i not in found), reverse=True):
+        table.removeRow(r)
+    if len(found) < len(ids):
+        shown = {int(table.item(r, 0).text()): r for r in range(table.rowCount())}
+    order = sorted(shown, reverse=True)
+    for row_id, row in sorted(found.items(), reverse=True):
+        r = shown.get(row_id)
+        if r is None:
+            # First row with a smaller id; rows inserted above shift the ones below
+            r = next((shown[i] for i in order if i < row_id), table.rowCount())
+            table.insertRow(r)
+            shown = {i: (s + 1 if s >= r else s) for i, s in shown.items()}
+            shown[row_id] = r
+        fill(r, row)
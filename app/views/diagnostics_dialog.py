@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from PySide6.QtCore import Slot
+from PySide6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QFileDialog, QMessageBox, QLabel, QAbstractItemView
+
+from app.core.metrics import PERCENTILES, REGISTRY
+
+
+class DiagnosticsDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(self.tr("Diagnostic des performances"))
+        self.resize(900, 600)
+        self._build_ui()
+        self._load()
+
+    def _build_ui(self) -> None:
+        layout = QVBoxLayout(self)
+        self.infoLabel = QLabel(self)
+        layout.addWidget(self.infoLabel)
+
+        self.timingsTable = QTableWidget(self)
+        headers = [self.tr("Opération"), self.tr("Nombre")] + [f"p{p} (ms)" for p in PERCENTILES] + [self.tr("Max (ms)")]
+        self.timingsTable.setColumnCount(len(headers))
+        self.timingsTable.setHorizontalHeaderLabels(headers)
+        self.timingsTable.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.timingsTable.setSortingEnabled(True)
+        layout.addWidget(self.timingsTable, 3)
+
+        self.valuesTable = QTableWidget(self)
+        self.valuesTable.setColumnCount(2)
+        self.valuesTable.setHorizontalHeaderLabels([self.tr("Indicateur"), self.tr("Valeur")])
+        self.valuesTable.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self.valuesTable, 2)
+
+        bottom = QHBoxLayout()
+        self.refreshBtn = QPushButton(self.tr("Actualiser"))
+        self.resetBtn = QPushButton(self.tr("Réinitialiser"))
+        self.exportBtn = QPushButton(self.tr("Exporter"))
+        for w in [self.refreshBtn, self.resetBtn, self.exportBtn]:
+            bottom.addWidget(w)
+        layout.addLayout(bottom)
+
+        self.refreshBtn.clicked.connect(self._load)
+        self.resetBtn.clicked.connect(self._reset)
+        self.exportBtn.clicked.connect(self._export)
+
+    def _load(self) -> None:
+        snap = REGISTRY.snapshot()
+        self.infoLabel.setText(self.tr("Depuis {uptime} s - PID {pid}").format(uptime=snap["uptime_s"], pid=snap["pid"]))
+        timings = snap["timings_ms"]
+        self.timingsTable.setSortingEnabled(False)
+        self.timingsTable.setRowCount(len(timings))
+        for r, (name, t) in enumerate(timings.items()):
+            values = [t["count"]] + [t[f"p{p}"] for p in PERCENTILES] + [t["max"]]
+            self.timingsTable.setItem(r, 0, QTableWidgetItem(name))
+            for c, value in enumerate(values, start=1):
+                item = QTableWidgetItem()
+                # Numeric data so the columns sort by value
+                item.setData(0, value if c == 1 else round(value, 2))
+                self.timingsTable.setItem(r, c, item)
+        self.timingsTable.setSortingEnabled(True)
+        self.timingsTable.resizeColumnsToContents()
+
+        values = [(f"counter: {k}", v) for k, v in snap["counters"].items()] + [(f"gauge: {k}", v) for k, v in snap["gauges"].items()]
+        self.valuesTable.setRowCount(len(values))
+        for r, (name, value) in enumerate(values):
+            self.valuesTable.setItem(r, 0, QTableWidgetItem(name))
+            self.valuesTable.setItem(r, 1, QTableWidgetItem(f"{value:g}" if isinstance(value, (int, float)) else str(value)))
+        self.valuesTable.resizeColumnsToContents()
+
+    @Slot()
+    def _reset(self) -> None:
+        REGISTRY.reset()
+        self._load()
+
+    @Slot()
+    def _export(self) -> None:
+        name = f"diagnostic-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        path, _ = QFileDialog.getSaveFileName(self, self.tr("Exporter le diagnostic"), name, self.tr("JSON (*.json)"))
+        if not path:
+            return
+        try:
+            REGISTRY.export(path)
+        except OSError as e:
+            QMessageBox.critical(self, self.tr("Erreur"), str(e))
+            return
+        QMessageBox.information(self, self.tr("Succès"), self.tr("Diagnostic exporté"))
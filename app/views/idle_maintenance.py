@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import time
+
+from PySide6.QtCore import QEvent, QObject, QTimer, Slot
+from PySide6.QtWidgets import QApplication
+
+from app.core.db import Database
+from app.core.logger import get_logger
+from app.core.maintenance import due_tasks, run_maintenance
+
+
+class IdleMaintenance(QObject):
+    # Runs the due maintenance tasks on the GUI connection once nobody has touched the
+    # keyboard or mouse for IDLE_SECONDS, a short budget at a time so a user coming
+    # back waits at most BUDGET_SECONDS. An interrupted task is due again at the next
+    # idle tick; quick_check, which starts over each time, only runs here on small files.
+    IDLE_SECONDS = 300
+    CHECK_MS = 60_000
+    BUDGET_SECONDS = 1.0
+    _INPUT_EVENTS = {QEvent.KeyPress, QEvent.MouseButtonPress, QEvent.MouseMove, QEvent.Wheel}
+
+    def __init__(self, db: Database, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.logger = get_logger(__name__)
+        self._last_input = time.monotonic()
+        QApplication.instance().installEventFilter(self)
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.CHECK_MS)
+        self.timer.timeout.connect(self._tick)
+        self.timer.start()
+
+    def eventFilter(self, watched, event) -> bool:
+        if event.type() in self._INPUT_EVENTS:
+            self._last_input = time.monotonic()
+        return False
+
+    @Slot()
+    def _tick(self) -> None:
+        if time.monotonic() - self._last_input < self.IDLE_SECONDS or self.db.in_transaction:
+            return
+        try:
+            tasks = due_tasks(self.db, idle=True)
+            if tasks:
+                run_maintenance(self.db, self.BUDGET_SECONDS, tasks)
+        except Exception as e:
+            # Never disturb the user for housekeeping; try again at the next tick
+            self.logger.warning(f"Idle maintenance failed: {e}")
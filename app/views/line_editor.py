@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+from PySide6.QtCore import QStringListModel, Qt, Slot
+from PySide6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QLabel, QCompleter, QMessageBox, QAbstractItemView
+
+from app.core.catalog import shared_catalog
+from app.core.db import Database
+from app.core.documents import line_totals, save_lines
+
+
+class LineEditorDialog(QDialog):
+    # Lines of a draft document. The product field completes on SKU and French/Arabic
+    # names from the shared in-memory catalog; nothing is written until "Enregistrer".
+    COLUMNS = ("sku", "description", "qty", "unit_price", "vat_rate", "total_ttc")
+    EDITABLE = (1, 2, 3, 4)
+
+    def __init__(self, db: Database, doc_id: int, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.doc_id = doc_id
+        self.catalog = shared_catalog(db)
+        self.lines: list[dict] = []
+        self._matches: dict[str, int] = {}
+        number = db.scalar("SELECT number FROM documents WHERE id=?;", (doc_id,))
+        self.setWindowTitle(self.tr("Lignes du document {number}").format(number=number))
+        self.resize(900, 500)
+        self._build_ui()
+        self._load()
+
+    def _build_ui(self) -> None:
+        layout = QVBoxLayout(self)
+        top = QHBoxLayout()
+        self.productEdit = QLineEdit(self)
+        self.productEdit.setPlaceholderText(self.tr("Produit : SKU, code-barres ou nom..."))
+        self.model = QStringListModel(self)
+        self.completer = QCompleter(self.model, self)
+        # The catalog already filtered and ordered the list
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.completer.setMaxVisibleItems(15)
+        self.completer.setWidget(self.productEdit)
+        self.freeBtn = QPushButton(self.tr("Ligne libre"))
+        self.removeBtn = QPushButton(self.tr("Retirer"))
+        top.addWidget(self.productEdit, 1)
+        top.addWidget(self.freeBtn)
+        top.addWidget(self.removeBtn)
+        layout.addLayout(top)
+
+        self.table = QTableWidget(self)
+        self.table.setColumnCount(len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels([self.tr("SKU"), self.tr("Désignation"), self.tr("Qté"), self.tr("PU HT"), self.tr("TVA %"), self.tr("Total TTC")])
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.DoubleClicked | QAbstractItemView.EditKeyPressed | QAbstractItemView.AnyKeyPressed)
+        layout.addWidget(self.table)
+
+        bottom = QHBoxLayout()
+        self.totalLabel = QLabel(self)
+        self.saveBtn = QPushButton(self.tr("Enregistrer"))
+        self.cancelBtn = QPushButton(self.tr("Annuler"))
+        bottom.addWidget(self.totalLabel, 1)
+        bottom.addWidget(self.saveBtn)
+        bottom.addWidget(self.cancelBtn)
+        layout.addLayout(bottom)
+
+        self.productEdit.textEdited.connect(self._complete)
+        self.productEdit.returnPressed.connect(self._add_typed)
+        self.completer.activated[str].connect(self._add_completion)
+        self.freeBtn.clicked.connect(self._add_free)
+        self.removeBtn.clicked.connect(self._remove)
+        self.table.itemChanged.connect(self._on_item_changed)
+        self.saveBtn.clicked.connect(self._save)
+        self.cancelBtn.clicked.connect(self.reject)
+
+    def _load(self) -> None:
+        # The catalog is normally built in the background at startup
+        self.catalog.ensure_loaded()
+        self.catalog.refresh()
+        rows = self.db.query(
+            """
+            SELECT l.product_id, IFNULL(p.sku, '') AS sku, l.description, l.qty, l.unit_price, l.vat_rate
+            FROM document_lines l
+            LEFT JOIN products p ON p.id = l.product_id
+            WHERE l.document_id = ?
+            ORDER BY l.id
+            """,
+            (self.doc_id,),
+        )
+        self.lines = [dict(r) for r in rows]
+        self._show()
+
+    def _show(self) -> None:
+        self.table.blockSignals(True)
+        self.table.setRowCount(len(self.lines))
+        for r, line in enumerate(self.lines):
+            ttc = line_totals(line["qty"], line["unit_price"], line["vat_rate"])[2]
+            values = [line["sku"], line["description"], f"{line['qty']:g}", f"{line['unit_price']:.2f}", f"{line['vat_rate']:g}", f"{ttc:.2f}"]
+            for c, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if c not in self.EDITABLE:
+                    item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+                if c >= 2:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(r, c, item)
+        self.table.blockSignals(False)
+        self.table.resizeColumnsToContents()
+        totals = [line_totals(l["qty"], l["unit_price"], l["vat_rate"]) for l in self.lines]
+        ht = sum(t[0] for t in totals)
+        tva = sum(t[1] for t in totals)
+        self.totalLabel.setText(self.tr("Total HT {ht:.2f}  TVA {tva:.2f}  TTC {ttc:.2f}").format(ht=ht, tva=tva, ttc=ht + tva))
+
+    @Slot(str)
+    def _complete(self, text: str) -> None:
+        entries = self.catalog.search(text, 20)
+        self._matches = {f"{e.sku}  {e.name}  ({e.price_ht:.2f})": e.id for e in entries}
+        self.model.setStringList(list(self._matches))
+        if entries:
+            self.completer.complete()
+        else:
+            self.completer.popup().hide()
+
+    @Slot(str)
+    def _add_completion(self, label: str) -> None:
+        product_id = self._matches.get(label)
+        if product_id is not None:
+            self._add_product(product_id)
+
+    @Slot()
+    def _add_typed(self) -> None:
+        # Enter without picking: exact barcode/SKU, else the first completion
+        text = self.productEdit.text()
+        if not text.strip():
+            return
+        entry = self.catalog.lookup(text)
+        if entry is None:
+            found = self.catalog.search(text, 1)
+            entry = found[0] if found else None
+        if entry is None:
+            QMessageBox.information(self, self.tr("Information"), self.tr("Aucun produit ne correspond"))
+            return
+        self._add_product(entry.id)
+
+    def _add_product(self, product_id: int) -> None:
+        entry = self.catalog.get(product_id)
+        if entry is None:
+            return
+        for line in self.lines:
+            if line["product_id"] == entry.id:
+                line["qty"] += 1
+                break
+        else:
+            self.lines.append({"product_id": entry.id, "sku": entry.sku, "description": entry.name, "qty": 1.0, "unit_price": entry.price_ht, "vat_rate": entry.vat_rate})
+        self.productEdit.clear()
+        self.completer.popup().hide()
+        self._show()
+
+    @Slot()
+    def _add_free(self) -> None:
+        self.lines.append({"product_id": None, "sku": "", "description": self.tr("Ligne libre"), "qty": 1.0, "unit_price": 0.0, "vat_rate": 20.0})
+        self._show()
+        self.table.editItem(self.table.item(len(self.lines) - 1, 1))
+
+    @Slot()
+    def _remove(self) -> None:
+        indexes = self.table.selectionModel().selectedRows()
+        if not indexes:
+            return
+        del self.lines[indexes[0].row()]
+        self._show()
+
+    @Slot(QTableWidgetItem)
+    def _on_item_changed(self, item: QTableWidgetItem) -> None:
+        line = self.lines[item.row()]
+        key = self.COLUMNS[item.column()]
+        text = item.text().strip()
+        if key == "description":
+            line[key] = text
+        else:
+            try:
+                line[key] = float(text.replace(",", "."))
+            except ValueError:
+                pass
+        self._show()
+
+    @Slot()
+    def _save(self) -> None:
+        try:
+            save_lines(self.db, self.doc_id, [l for l in self.lines if l["qty"]])
+        except ValueError as e:
+            QMessageBox.warning(self, self.tr("Erreur"), str(e))
+            return
+        self.accept()
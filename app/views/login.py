@@ -4,20 +4,38 @@ from pathlib import Path
 from typing import Optional
 
 from PySide6 import QtUiTools
-from PySide6.QtCore import QFile, QIODevice, Slot
-from PySide6.QtWidgets import QDialog, QMessageBox
+from PySide6.QtCore import QFile, QIODevice, QObject, QRunnable, QThreadPool, Signal, Slot
+from PySide6.QtWidgets import QDialog, QMessageBox, QProgressBar
 
-from app.core.auth import authenticate
+from app.core.audit import audit, set_audit_user
+from app.core.auth import LoginThrottled, complete_login, find_login, password_rounds, verify_and_rehash
 from app.core.db import Database
 from app.core.i18n import I18n
 
 
+class _VerifyTask(QObject, QRunnable):
+    # bcrypt runs here, off the GUI thread; the result comes back as a queued signal
+    finished = Signal(bool, object)
+
+    def __init__(self, password: str, hashed: bytes, rounds: int) -> None:
+        QObject.__init__(self)
+        QRunnable.__init__(self)
+        self.setAutoDelete(False)
+        self._args = (password, hashed, rounds)
+
+    def run(self) -> None:
+        valid, new_hash = verify_and_rehash(*self._args)
+        self.finished.emit(valid, new_hash)
+
+
 class LoginDialog(QDialog):
     def __init__(self, db: Database, i18n: I18n, signals, parent=None):
         super().__init__(parent)
         self.db = db
         self.i18n = i18n
         self._user: Optional[dict] = None
+        self._pending: Optional[dict] = None
+        self._task: Optional[_VerifyTask] = None
         self._load_ui()
         self._wire()
         signals.languageChanged.connect(self._applyTranslations)
@@ -42,6 +60,13 @@ class LoginDialog(QDialog):
         self.loginButton = getattr(dialog, "loginButton", self.loginButton)
         self.cancelButton = getattr(dialog, "cancelButton", self.cancelButton)
         self.langCombo = getattr(dialog, "langCombo", self.langCombo)
+        # Busy indicator while the password is checked
+        self.progress = QProgressBar(self)
+        self.progress.setRange(0, 0)
+        self.progress.setTextVisible(False)
+        self.progress.setMaximumHeight(6)
+        self.progress.hide()
+        self.layout().addWidget(self.progress)
         self.setFixedSize(dialog.size())
 
     def _wire(self) -> None:
@@ -60,13 +85,51 @@ class LoginDialog(QDialog):
     def _on_login(self) -> None:
         username = self.findChild(type(self), "usernameEdit") or self.usernameEdit
         password = self.findChild(type(self), "passwordEdit") or self.passwordEdit
-        user = authenticate(self.db, username.text(), password.text())
+        if self._task is not None:
+            return
+        try:
+            login = find_login(self.db, username.text())
+        except LoginThrottled as e:
+            audit("login_throttled", "user", details={"username": username.text()})
+            QMessageBox.warning(self, self.tr("Erreur"), self.tr("Trop de tentatives. Réessayez dans %n seconde(s).", "", int(e.retry_after) + 1))
+            return
+        self._pending = login
+        self._set_busy(True)
+        self._task = _VerifyTask(password.text(), login["password_hash"], password_rounds(self.db))
+        self._task.finished.connect(self._on_verified)
+        QThreadPool.globalInstance().start(self._task)
+
+    def _set_busy(self, busy: bool) -> None:
+        for widget in (self.usernameEdit, self.passwordEdit, self.loginButton, self.langCombo):
+            widget.setEnabled(not busy)
+        self.loginButton.setText(self.tr("Vérification...") if busy else self.tr("Se connecter"))
+        self.progress.setVisible(busy)
+
+    def _failed(self, username: str) -> None:
+        audit("login_failed", "user", details={"username": username})
+        QMessageBox.warning(self, self.tr("Erreur"), self.tr("Identifiants invalides"))
+
+    @Slot(bool, object)
+    def _on_verified(self, valid: bool, new_hash: Optional[bytes]) -> None:
+        login, self._pending, self._task = self._pending, None, None
+        self._set_busy(False)
+        user = complete_login(self.db, login, valid, new_hash)
         if not user:
-            QMessageBox.warning(self, self.tr("Erreur"), self.tr("Identifiants invalides"))
+            self._failed(login["username"])
+            self.passwordEdit.clear()
+            self.passwordEdit.setFocus()
             return
+        set_audit_user(user["id"])
+        audit("login", "user", user["id"])
         self._user = user
         self.accept()
 
+    def reject(self) -> None:
+        # Closing during a check: ignore the result (the task stays referenced until it ends)
+        if self._task is not None:
+            self._task.finished.disconnect(self._on_verified)
+        super().reject()
+
     def get_authenticated_user(self) -> Optional[dict]:
         return self._user
 
@@ -1,26 +1,36 @@
 from __future__ import annotations
 
+import sqlite3
 from pathlib import Path
 
 from PySide6 import QtUiTools
 from PySide6.QtCore import QFile, QIODevice, Slot, QDate
-from PySide6.QtGui import QAction
+from PySide6.QtGui import QAction, QKeySequence, QShortcut
 from PySide6.QtWidgets import QMainWindow, QFileDialog, QMessageBox
 
 from app.core.db import Database
 from app.core.i18n import I18n
 from app.core.settings import AppSettings
 from app.core.logger import get_logger
+from app.core.metrics import register_database_gauges
 
 from app.views.modules.customers import CustomersView
+from app.views.modules.dashboard import DashboardView
 from app.views.modules.products import ProductsView
 from app.views.modules.sales import SalesView
 from app.views.modules.stock import StockView
 from app.views.modules.purchases import PurchasesView
 from app.views.modules.payments import PaymentsView
+from app.views.modules.receivables import ReceivablesView
 from app.views.modules.cash import CashView
+from app.views.modules.pos import PosView
+from app.core.catalog import shared_catalog
 from app.views.modules.suppliers import SuppliersView
 from app.views.settings_dialog import SettingsDialog
+from app.views.audit_dialog import AuditDialog
+from app.views.diagnostics_dialog import DiagnosticsDialog
+from app.views.data_watcher import ChangePoller
+from app.views.idle_maintenance import IdleMaintenance
 
 
 class MainWindow(QMainWindow):
@@ -60,6 +70,7 @@ class MainWindow(QMainWindow):
         self.actionLangFr: QAction = window.findChild(QAction, "actionLangFr")
         self.actionLangAr: QAction = window.findChild(QAction, "actionLangAr")
         self.actionAbout: QAction = window.findChild(QAction, "actionAbout")
+        self.actionAuditLog: QAction = window.findChild(QAction, "actionAuditLog")
         self.setWindowTitle(window.windowTitle())
 
     def _wire(self) -> None:
@@ -70,11 +81,24 @@ class MainWindow(QMainWindow):
         self.actionBackup.triggered.connect(self._backup)
         self.actionRestore.triggered.connect(self._restore)
         self.actionSettings.triggered.connect(self._open_settings)
+        self.actionAuditLog.triggered.connect(self._open_audit_log)
         self.navTree.itemClicked.connect(self._on_nav_clicked)
+        # Support-only panel, deliberately kept out of the menus
+        self.diagnosticsShortcut = QShortcut(QKeySequence("Ctrl+Shift+Alt+D"), self)
+        self.diagnosticsShortcut.activated.connect(self._open_diagnostics)
+        register_database_gauges(self.db)
+        # Product search index for the line editors and the point of sale, built off the GUI thread
+        shared_catalog(self.db).start_background_load()
+        # Views and the catalog follow the change bus; the poller brings in other processes' commits
+        shared_catalog(self.db).follow_changes()
+        self.changePoller = ChangePoller(self.db, self)
+        # Checkpoint, statistics, free pages and integrity while nobody is working
+        self.idleMaintenance = IdleMaintenance(self.db, self) if self.db.path is not None else None
 
     def _setup_modules(self) -> None:
         # Add module pages
         self.modules = {
+            "Tableau de bord": DashboardView(self.db, self),
             "Clients": CustomersView(self.db, self),
             "Fournisseurs": SuppliersView(self.db, self),
             "Produits": ProductsView(self.db, self),
@@ -84,7 +108,9 @@ class MainWindow(QMainWindow):
             "Factures": SalesView(self.db, self, kind="invoice"),
             "Achats": PurchasesView(self.db, self),
             "Paiements": PaymentsView(self.db, self),
+            "Balance âgée": ReceivablesView(self.db, self),
             "Caisse": CashView(self.db, self),
+            "Point de vente": PosView(self.db, self),
         }
         for name, widget in self.modules.items():
             self.stack.addWidget(widget)
@@ -93,25 +119,43 @@ class MainWindow(QMainWindow):
     def _about(self) -> None:
         QMessageBox.information(self, self.tr("? propos"), self.tr("Gestion Commerciale\nVersion 0.1.0"))
 
+    def _require_local_db(self) -> bool:
+        if self.db.path is None:
+            QMessageBox.information(self, self.tr("Information"), self.tr("Opération disponible uniquement sur le poste serveur"))
+            return False
+        return True
+
     @Slot()
     def _backup(self) -> None:
+        if not self._require_local_db():
+            return
         path, _ = QFileDialog.getSaveFileName(self, self.tr("Choisir le fichier de sauvegarde"), f"backup-{QDate.currentDate().toString('yyyyMMdd')}.db", self.tr("SQLite (*.db)"))
         if not path:
             return
         try:
-            src = self.db.path
-            Path(path).write_bytes(Path(src).read_bytes())
+            # Online backup: consistent even with WAL content not yet checkpointed
+            dst = sqlite3.connect(path)
+            try:
+                self.db.conn.backup(dst)
+            finally:
+                dst.close()
             QMessageBox.information(self, self.tr("Succ?s"), self.tr("Sauvegarde termin?e"))
         except Exception as e:
             QMessageBox.critical(self, self.tr("Erreur"), str(e))
 
     @Slot()
     def _restore(self) -> None:
+        if not self._require_local_db():
+            return
         path, _ = QFileDialog.getOpenFileName(self, self.tr("S?lectionner la sauvegarde"), "", self.tr("SQLite (*.db)"))
         if not path:
             return
         try:
-            Path(self.db.path).write_bytes(Path(path).read_bytes())
+            src = sqlite3.connect(path)
+            try:
+                src.backup(self.db.conn)
+            finally:
+                src.close()
             QMessageBox.information(self, self.tr("Succ?s"), self.tr("Restauration termin?e. Red?marrez l'application."))
         except Exception as e:
             QMessageBox.critical(self, self.tr("Erreur"), str(e))
@@ -121,6 +165,16 @@ class MainWindow(QMainWindow):
         dlg = SettingsDialog(self.db, self.settings, self)
         dlg.exec()
 
+    @Slot()
+    def _open_audit_log(self) -> None:
+        dlg = AuditDialog(self.db, self)
+        dlg.exec()
+
+    @Slot()
+    def _open_diagnostics(self) -> None:
+        dlg = DiagnosticsDialog(self)
+        dlg.exec()
+
     @Slot()
     def _on_nav_clicked(self, item, column) -> None:
         name = item.text(0)
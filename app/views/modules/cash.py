@@ -1,52 +1,120 @@
 from __future__ import annotations
 
 from PySide6.QtCore import Slot
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QLabel, QMessageBox, QAbstractItemView
 
+from app.core.audit import audit
 from app.core.db import Database
+from app.core.metrics import timed
+from app.core.cash import close_day, current_balance, last_closing, movements_page, open_movements
+from app.views.data_watcher import DataWatcher
 
 
 class CashView(QWidget):
+    PAGE_SIZE = 100
+
     def __init__(self, db: Database, parent=None):
         super().__init__(parent)
         self.db = db
+        self._oldest_id: int | None = None
         self._build_ui()
         self._load()
+        self.watcher = DataWatcher(db, ("cash_register", "cash_closings"), self)
+        self.watcher.changed.connect(self._on_data_changed)
 
     def _build_ui(self) -> None:
         layout = QVBoxLayout(self)
         top = QHBoxLayout()
         self.addInBtn = QPushButton(self.tr("Entr?e"))
         self.addOutBtn = QPushButton(self.tr("Sortie"))
+        self.closeDayBtn = QPushButton(self.tr("Clôture Z"))
         self.refreshBtn = QPushButton(self.tr("Actualiser"))
         top.addWidget(self.addInBtn)
         top.addWidget(self.addOutBtn)
+        top.addWidget(self.closeDayBtn)
         top.addWidget(self.refreshBtn)
         layout.addLayout(top)
 
+        self.balanceLabel = QLabel(self)
+        layout.addWidget(self.balanceLabel)
+
         self.table = QTableWidget(self)
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels([self.tr("ID"), self.tr("Mouvement"), self.tr("Montant"), self.tr("Libell?")])
+        self.table.setColumnCount(6)
+        self.table.setHorizontalHeaderLabels([self.tr("ID"), self.tr("Mouvement"), self.tr("Montant"), self.tr("Libell?"), self.tr("Solde"), self.tr("Date")])
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         layout.addWidget(self.table)
 
+        self.moreBtn = QPushButton(self.tr("Mouvements plus anciens"))
+        layout.addWidget(self.moreBtn)
+
         self.addInBtn.clicked.connect(lambda: self._add("in"))
         self.addOutBtn.clicked.connect(lambda: self._add("out"))
+        self.closeDayBtn.clicked.connect(self._close_day)
         self.refreshBtn.clicked.connect(self._load)
+        self.moreBtn.clicked.connect(self._load_more)
 
     def _load(self) -> None:
-        rows = self.db.query("SELECT id, movement, amount, label FROM cash_register ORDER BY id DESC;")
-        self.table.setRowCount(len(rows))
-        for r, row in enumerate(rows):
+        with timed("view.cash.load"):
+            # Only the movements of the open period are shown up front; history is paged on demand
+            rows = open_movements(self.db, self.PAGE_SIZE)
+            self._oldest_id = None
+            self.table.setRowCount(0)
+            self._append(rows)
+            last = last_closing(self.db)
+            if last:
+                closing = self.tr("Dernière clôture : {day} ({balance:.2f})").format(day=last["day"], balance=last["closing_balance"])
+            else:
+                closing = self.tr("Aucune clôture")
+            self.balanceLabel.setText(self.tr("Solde actuel : {balance:.2f}").format(balance=current_balance(self.db)) + " - " + closing)
+            if not rows and last:
+                self._oldest_id = last["last_movement_id"] + 1
+            self.moreBtn.setEnabled(True)
+
+    @Slot(object)
+    def _on_data_changed(self, changes: dict) -> None:
+        # The balance and the last closing change with any movement
+        self._load()
+
+    def _append(self, rows: list[dict]) -> None:
+        start = self.table.rowCount()
+        self.table.setRowCount(start + len(rows))
+        for r, row in enumerate(rows, start=start):
             self.table.setItem(r, 0, QTableWidgetItem(str(row["id"])))
             self.table.setItem(r, 1, QTableWidgetItem(row["movement"]))
             self.table.setItem(r, 2, QTableWidgetItem(f"{row['amount']:.2f}"))
             self.table.setItem(r, 3, QTableWidgetItem(row["label"]))
+            self.table.setItem(r, 4, QTableWidgetItem(f"{row['balance_after'] or 0:.2f}"))
+            self.table.setItem(r, 5, QTableWidgetItem(row["created_at"] or ""))
+        if rows:
+            self._oldest_id = rows[-1]["id"]
         self.table.resizeColumnsToContents()
 
+    @Slot()
+    def _load_more(self) -> None:
+        rows = movements_page(self.db, self._oldest_id, self.PAGE_SIZE)
+        self._append(rows)
+        if len(rows) < self.PAGE_SIZE:
+            self.moreBtn.setEnabled(False)
+
+    @Slot()
+    def _close_day(self) -> None:
+        if QMessageBox.question(self, self.tr("Confirmer"), self.tr("Clôturer la caisse pour aujourd'hui ?")) != QMessageBox.Yes:
+            return
+        try:
+            closing = close_day(self.db)
+        except ValueError as e:
+            QMessageBox.warning(self, self.tr("Erreur"), str(e))
+            return
+        QMessageBox.information(
+            self,
+            self.tr("Clôture Z"),
+            self.tr("Entrées : {i:.2f}\nSorties : {o:.2f}\nSolde : {b:.2f}").format(i=closing["total_in"], o=closing["total_out"], b=closing["closing_balance"]),
+        )
+
     @Slot()
     def _add(self, movement: str) -> None:
         amount = 10.0 if movement == "in" else -5.0
         label = "Encaissement" if movement == "in" else "D?caissement"
-        self.db.execute("INSERT INTO cash_register (movement, amount, label) VALUES (?, ?, ?);", (movement, abs(amount), label))
-        self._load()
-
+        cur = self.db.execute("INSERT INTO cash_register (movement, amount, label) VALUES (?, ?, ?);", (movement, abs(amount), label))
+        audit("create", "cash_register", cur.lastrowid, {"movement": movement, "amount": abs(amount)})
@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+from pathlib import Path
+
 from PySide6.QtCore import Qt, Slot
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QSpinBox, QMessageBox
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QSpinBox, QMessageBox, QFileDialog, QAbstractItemView
 
+from app.core.audit import audit
 from app.core.db import Database
+from app.core.metrics import timed
+from app.core.pdf import generate_statement_pdf
+from app.views.data_watcher import DataWatcher
 
 
 class CustomersView(QWidget):
@@ -14,6 +20,8 @@ class CustomersView(QWidget):
         self._page_size = 20
         self._build_ui()
         self._load()
+        self.watcher = DataWatcher(db, ("partners",), self)
+        self.watcher.changed.connect(self._on_data_changed)
 
     def _build_ui(self) -> None:
         layout = QVBoxLayout(self)
@@ -23,17 +31,19 @@ class CustomersView(QWidget):
         self.addBtn = QPushButton(self.tr("Ajouter"))
         self.editBtn = QPushButton(self.tr("Modifier"))
         self.delBtn = QPushButton(self.tr("Supprimer"))
+        self.statementBtn = QPushButton(self.tr("Relevé"))
         top.addWidget(self.searchEdit)
         top.addWidget(self.addBtn)
         top.addWidget(self.editBtn)
         top.addWidget(self.delBtn)
+        top.addWidget(self.statementBtn)
         layout.addLayout(top)
 
         self.table = QTableWidget(self)
         self.table.setColumnCount(5)
         self.table.setHorizontalHeaderLabels([self.tr("ID"), self.tr("Nom (FR)"), self.tr("Nom (AR)"), self.tr("T?l?phone"), self.tr("Email")])
-        self.table.setSelectionBehavior(self.table.SelectRows)
-        self.table.setEditTriggers(self.table.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         layout.addWidget(self.table)
 
         bottom = QHBoxLayout()
@@ -56,6 +66,7 @@ class CustomersView(QWidget):
         self.addBtn.clicked.connect(self._add)
         self.editBtn.clicked.connect(self._edit)
         self.delBtn.clicked.connect(self._delete)
+        self.statementBtn.clicked.connect(self._export_statement)
 
     def _query(self):
         base = "SELECT id, name_fr, name_ar, phone, email FROM partners WHERE kind='client'"
@@ -70,16 +81,22 @@ class CustomersView(QWidget):
         return base, params
 
     def _load(self) -> None:
-        sql, params = self._query()
-        rows = self.db.query(sql, params)
-        self.table.setRowCount(len(rows))
-        for r, row in enumerate(rows):
-            self.table.setItem(r, 0, QTableWidgetItem(str(row["id"])))
-            self.table.setItem(r, 1, QTableWidgetItem(row["name_fr"]))
-            self.table.setItem(r, 2, QTableWidgetItem(row["name_ar"]))
-            self.table.setItem(r, 3, QTableWidgetItem(row["phone"]))
-            self.table.setItem(r, 4, QTableWidgetItem(row["email"]))
-        self.table.resizeColumnsToContents()
+        with timed("view.customers.load"):
+            sql, params = self._query()
+            rows = self.db.query(sql, params)
+            self.table.setRowCount(len(rows))
+            for r, row in enumerate(rows):
+                self.table.setItem(r, 0, QTableWidgetItem(str(row["id"])))
+                self.table.setItem(r, 1, QTableWidgetItem(row["name_fr"]))
+                self.table.setItem(r, 2, QTableWidgetItem(row["name_ar"]))
+                self.table.setItem(r, 3, QTableWidgetItem(row["phone"]))
+                self.table.setItem(r, 4, QTableWidgetItem(row["email"]))
+            self.table.resizeColumnsToContents()
+
+    @Slot(object)
+    def _on_data_changed(self, changes: dict) -> None:
+        # Reloads the current page: the list is filtered and paged
+        self._load()
 
     @Slot()
     def _on_page_change(self, val: int) -> None:
@@ -100,8 +117,8 @@ class CustomersView(QWidget):
     @Slot()
     def _add(self) -> None:
         name_fr, name_ar = "Client", "????"
-        self.db.execute("INSERT INTO partners (kind, name_fr, name_ar) VALUES ('client', ?, ?);", (name_fr, name_ar))
-        self._load()
+        cur = self.db.execute("INSERT INTO partners (kind, name_fr, name_ar) VALUES ('client', ?, ?);", (name_fr, name_ar))
+        audit("create", "partner", cur.lastrowid)
 
     @Slot()
     def _edit(self) -> None:
@@ -109,7 +126,7 @@ class CustomersView(QWidget):
         if not cid:
             return
         self.db.execute("UPDATE partners SET name_fr=name_fr||' *' WHERE id=?;", (cid,))
-        self._load()
+        audit("update", "partner", cid)
 
     @Slot()
     def _delete(self) -> None:
@@ -119,5 +136,17 @@ class CustomersView(QWidget):
         if QMessageBox.question(self, self.tr("Confirmer"), self.tr("Supprimer ce client ?")) != QMessageBox.Yes:
             return
         self.db.execute("DELETE FROM partners WHERE id=?;", (cid,))
-        self._load()
+        audit("delete", "partner", cid)
+
 
+    @Slot()
+    def _export_statement(self) -> None:
+        cid = self._current_id()
+        if not cid:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, self.tr("Exporter le relevé"), f"releve-{cid}.pdf", self.tr("PDF (*.pdf)"))
+        if not path:
+            return
+        base_dir = Path(__file__).resolve().parents[3]
+        generate_statement_pdf(self.db, cid, Path(path), base_dir)
+        QMessageBox.information(self, self.tr("Succès"), self.tr("Relevé généré"))
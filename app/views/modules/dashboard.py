@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from PySide6.QtCore import QDate, Slot
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QComboBox, QDateEdit, QLabel, QAbstractItemView, QMessageBox
+
+from app.core.db import Database
+from app.core.metrics import timed
+from app.core.rollups import rebuild_rollups, sales_summary
+from app.views.data_watcher import DataWatcher
+
+
+class DashboardView(QWidget):
+    def __init__(self, db: Database, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._build_ui()
+        self._load()
+        self.watcher = DataWatcher(db, ("documents", "rollup_daily", "rollup_monthly", "rollup_product_daily", "rollup_product_monthly"), self)
+        self.watcher.changed.connect(self._on_data_changed)
+
+    def _build_ui(self) -> None:
+        layout = QVBoxLayout(self)
+        top = QHBoxLayout()
+        today = QDate.currentDate()
+        self.fromEdit = QDateEdit(QDate(today.year(), 1, 1), self)
+        self.fromEdit.setCalendarPopup(True)
+        self.toEdit = QDateEdit(today, self)
+        self.toEdit.setCalendarPopup(True)
+        self.kindCombo = QComboBox(self)
+        for label, kind in [(self.tr("Factures"), "invoice"), (self.tr("BL"), "delivery"), (self.tr("Devis"), "quote"), (self.tr("Achats"), "purchase")]:
+            self.kindCombo.addItem(label, kind)
+        self.groupCombo = QComboBox(self)
+        for label, dim in [(self.tr("Par mois"), "month"), (self.tr("Par client"), "partner"), (self.tr("Par produit"), "product"), (self.tr("Par type"), "kind")]:
+            self.groupCombo.addItem(label, dim)
+        self.refreshBtn = QPushButton(self.tr("Actualiser"))
+        self.rebuildBtn = QPushButton(self.tr("Reconstruire"))
+        for w in [self.fromEdit, self.toEdit, self.kindCombo, self.groupCombo, self.refreshBtn, self.rebuildBtn]:
+            top.addWidget(w)
+        layout.addLayout(top)
+
+        self.summaryLabel = QLabel(self)
+        layout.addWidget(self.summaryLabel)
+
+        self.table = QTableWidget(self)
+        self.table.setColumnCount(4)
+        self.table.setHorizontalHeaderLabels([self.tr("Période / Tiers"), self.tr("Nombre"), self.tr("Total HT"), self.tr("Total TTC")])
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        self.refreshBtn.clicked.connect(self._load)
+        self.rebuildBtn.clicked.connect(self._rebuild)
+        self.kindCombo.currentIndexChanged.connect(self._load)
+        self.groupCombo.currentIndexChanged.connect(self._load)
+        self.fromEdit.dateChanged.connect(self._load)
+        self.toEdit.dateChanged.connect(self._load)
+
+    def _load(self) -> None:
+        with timed("view.dashboard.load"):
+            dimension = self.groupCombo.currentData()
+            # Grouping by type compares all kinds over the range
+            kind = None if dimension == "kind" else self.kindCombo.currentData()
+            date_from = self.fromEdit.date().toPython()
+            date_to = self.toEdit.date().toPython()
+            rows = sales_summary(self.db, date_from, date_to, dimension, kind) if date_from <= date_to else []
+            self.table.setRowCount(len(rows))
+            for r, row in enumerate(rows):
+                count = row["qty"] if dimension == "product" else row["count"]
+                self.table.setItem(r, 0, QTableWidgetItem(str(row["label"])))
+                self.table.setItem(r, 1, QTableWidgetItem(f"{count or 0:g}"))
+                self.table.setItem(r, 2, QTableWidgetItem(f"{row['total_ht'] or 0:.2f}"))
+                self.table.setItem(r, 3, QTableWidgetItem(f"{row['total_ttc'] or 0:.2f}"))
+            self.table.resizeColumnsToContents()
+            total_ht = sum(r["total_ht"] or 0 for r in rows)
+            total_ttc = sum(r["total_ttc"] or 0 for r in rows)
+            self.summaryLabel.setText(self.tr("Total HT : {ht:.2f} - Total TTC : {ttc:.2f}").format(ht=total_ht, ttc=total_ttc))
+
+    @Slot(object)
+    def _on_data_changed(self, changes: dict) -> None:
+        # Totals are recomputed from the rollups for the selected range
+        self._load()
+
+    @Slot()
+    def _rebuild(self) -> None:
+        if QMessageBox.question(self, self.tr("Confirmer"), self.tr("Recalculer toutes les statistiques ?")) != QMessageBox.Yes:
+            return
+        rebuild_rollups(self.db)
@@ -2,9 +2,13 @@ from __future__ import annotations
 
 from datetime import date
 from PySide6.QtCore import Slot
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QComboBox, QAbstractItemView, QMessageBox
 
+from app.core.audit import audit
 from app.core.db import Database
+from app.core.metrics import timed
+from app.core.receivables import open_invoices
+from app.views.data_watcher import PATCH_LIMIT, DataWatcher, patch_rows
 
 
 class PaymentsView(QWidget):
@@ -13,36 +17,104 @@ class PaymentsView(QWidget):
         self.db = db
         self._build_ui()
         self._load()
+        self.watcher = DataWatcher(db, ("payments", "documents"), self)
+        self.watcher.changed.connect(self._on_data_changed)
 
     def _build_ui(self) -> None:
         layout = QVBoxLayout(self)
         top = QHBoxLayout()
+        self.invoiceCombo = QComboBox(self)
         self.addBtn = QPushButton(self.tr("Ajouter paiement"))
+        self.delBtn = QPushButton(self.tr("Supprimer"))
         self.refreshBtn = QPushButton(self.tr("Actualiser"))
+        top.addWidget(self.invoiceCombo)
         top.addWidget(self.addBtn)
+        top.addWidget(self.delBtn)
         top.addWidget(self.refreshBtn)
         layout.addLayout(top)
 
         self.table = QTableWidget(self)
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels([self.tr("ID"), self.tr("Document ID"), self.tr("Montant"), self.tr("Date")])
+        self.table.setColumnCount(5)
+        self.table.setHorizontalHeaderLabels([self.tr("ID"), self.tr("Document"), self.tr("Montant"), self.tr("Date"), self.tr("Reste dû")])
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         layout.addWidget(self.table)
 
         self.addBtn.clicked.connect(self._add)
+        self.delBtn.clicked.connect(self._delete)
         self.refreshBtn.clicked.connect(self._load)
 
+    _SELECT = """
+        SELECT pay.id, pay.document_id, d.number, d.open_balance, pay.amount, pay.paid_at
+        FROM payments pay
+        LEFT JOIN documents d ON d.id=pay.document_id
+        {where}
+        ORDER BY pay.id DESC
+        """
+
     def _load(self) -> None:
-        rows = self.db.query("SELECT id, document_id, amount, paid_at FROM payments ORDER BY id DESC;")
-        self.table.setRowCount(len(rows))
-        for r, row in enumerate(rows):
-            self.table.setItem(r, 0, QTableWidgetItem(str(row["id"])))
-            self.table.setItem(r, 1, QTableWidgetItem(str(row["document_id"] or "")))
-            self.table.setItem(r, 2, QTableWidgetItem(f"{row['amount']:.2f}"))
-            self.table.setItem(r, 3, QTableWidgetItem(row["paid_at"]))
-        self.table.resizeColumnsToContents()
+        with timed("view.payments.load"):
+            rows = self.db.query(self._SELECT.format(where=""))
+            self.table.setRowCount(len(rows))
+            for r, row in enumerate(rows):
+                self._fill_row(r, row)
+            self.table.resizeColumnsToContents()
+            self._load_invoices()
+
+    def _fill_row(self, r: int, row) -> None:
+        self.table.setItem(r, 0, QTableWidgetItem(str(row["id"])))
+        self.table.setItem(r, 1, QTableWidgetItem(row["number"] or ""))
+        self.table.setItem(r, 2, QTableWidgetItem(f"{row['amount']:.2f}"))
+        self.table.setItem(r, 3, QTableWidgetItem(row["paid_at"]))
+        self.table.setItem(r, 4, QTableWidgetItem("" if row["open_balance"] is None else f"{row['open_balance']:.2f}"))
+
+    @Slot(object)
+    def _on_data_changed(self, changes: dict) -> None:
+        # The changed payments, and every payment of the invoices whose balance moved
+        pays, docs = changes.get("payments", frozenset()), changes.get("documents", frozenset())
+        if pays is None or docs is None or len(pays) + len(docs) > PATCH_LIMIT:
+            self._load()
+            return
+        pay_marks, doc_marks = ", ".join("?" for _ in pays), ", ".join("?" for _ in docs)
+        rows = self.db.query(
+            self._SELECT.format(
+                where=f"WHERE pay.id IN ({pay_marks}) OR pay.document_id IN ({doc_marks}) OR pay.document_id IN (SELECT document_id FROM payments WHERE id IN ({pay_marks}))"
+            ),
+            (*pays, *docs, *pays),
+        )
+        patch_rows(self.table, set(pays) | {r["id"] for r in rows}, rows, self._fill_row)
+        self._load_invoices()
+
+    def _load_invoices(self) -> None:
+        current = self.invoiceCombo.currentData()
+        self.invoiceCombo.blockSignals(True)
+        self.invoiceCombo.clear()
+        self.invoiceCombo.addItem(self.tr("Sans facture"), None)
+        for inv in open_invoices(self.db):
+            self.invoiceCombo.addItem(f"{inv['number']} ({inv['open_balance']:.2f})", inv["id"])
+        idx = self.invoiceCombo.findData(current)
+        self.invoiceCombo.setCurrentIndex(max(idx, 0))
+        self.invoiceCombo.blockSignals(False)
+
+    def _current_id(self) -> int | None:
+        indexes = self.table.selectionModel().selectedRows()
+        if not indexes:
+            return None
+        return int(self.table.item(indexes[0].row(), 0).text())
 
     @Slot()
     def _add(self) -> None:
-        self.db.execute("INSERT INTO payments (document_id, method, amount, paid_at) VALUES (NULL, 'cash', 10.0, ?);", (date.today().isoformat(),))
-        self._load()
+        doc_id = self.invoiceCombo.currentData()
+        cur = self.db.execute("INSERT INTO payments (document_id, method, amount, paid_at) VALUES (?, 'cash', 10.0, ?);", (doc_id, date.today().isoformat()))
+        audit("create", "payment", cur.lastrowid, {"document_id": doc_id, "amount": 10.0})
+
+    @Slot()
+    def _delete(self) -> None:
+        pid = self._current_id()
+        if not pid:
+            return
+        if QMessageBox.question(self, self.tr("Confirmer"), self.tr("Supprimer ce paiement ?")) != QMessageBox.Yes:
+            return
+        self.db.execute("DELETE FROM payments WHERE id=?;", (pid,))
+        audit("delete", "payment", pid)
 
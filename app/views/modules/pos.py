@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import time
+
+from PySide6.QtCore import Qt, Slot
+from PySide6.QtGui import QFont
+from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QLabel, QComboBox, QMessageBox, QAbstractItemView
+
+from app.core.catalog import shared_catalog
+from app.core.db import Database
+from app.core.metrics import REGISTRY
+from app.core.pos import Cart, checkout, parse_scan
+
+
+class PosView(QWidget):
+    # Counter sale: scan, pay, next customer. Lookups hit the in-memory catalog only.
+
+    def __init__(self, db: Database, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.catalog = shared_catalog(db)
+        self.cart = Cart()
+        self._build_ui()
+
+    def _build_ui(self) -> None:
+        layout = QVBoxLayout(self)
+        top = QHBoxLayout()
+        self.scanEdit = QLineEdit(self)
+        self.scanEdit.setPlaceholderText(self.tr("Scanner ou saisir un code (3*CODE pour 3 unités)"))
+        self.removeBtn = QPushButton(self.tr("Retirer la ligne"))
+        self.clearBtn = QPushButton(self.tr("Vider"))
+        top.addWidget(self.scanEdit, 1)
+        top.addWidget(self.removeBtn)
+        top.addWidget(self.clearBtn)
+        layout.addLayout(top)
+
+        self.messageLabel = QLabel(self)
+        layout.addWidget(self.messageLabel)
+
+        self.table = QTableWidget(self)
+        self.table.setColumnCount(6)
+        self.table.setHorizontalHeaderLabels([self.tr("SKU"), self.tr("Désignation"), self.tr("Qté"), self.tr("PU HT"), self.tr("TVA %"), self.tr("Total TTC")])
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        bottom = QHBoxLayout()
+        self.totalLabel = QLabel(self)
+        font = QFont(self.totalLabel.font())
+        font.setPointSize(font.pointSize() * 2)
+        font.setBold(True)
+        self.totalLabel.setFont(font)
+        self.methodCombo = QComboBox(self)
+        self.methodCombo.addItem(self.tr("Espèces"), "cash")
+        self.methodCombo.addItem(self.tr("Carte"), "card")
+        self.methodCombo.addItem(self.tr("Chèque"), "check")
+        self.payBtn = QPushButton(self.tr("Encaisser"))
+        bottom.addWidget(self.totalLabel, 1)
+        bottom.addWidget(self.methodCombo)
+        bottom.addWidget(self.payBtn)
+        layout.addLayout(bottom)
+
+        self.scanEdit.returnPressed.connect(self._scan)
+        self.removeBtn.clicked.connect(self._remove)
+        self.clearBtn.clicked.connect(self._clear)
+        self.payBtn.clicked.connect(self._pay)
+        self._show_cart()
+
+    def showEvent(self, event) -> None:
+        super().showEvent(event)
+        # The catalog is loaded on first use; the change bus keeps it current afterwards
+        self._refresh_catalog()
+        self.scanEdit.setFocus()
+
+    @Slot()
+    def _refresh_catalog(self) -> None:
+        self.catalog.refresh()
+
+    @Slot()
+    def _scan(self) -> None:
+        start = time.perf_counter()
+        text = self.scanEdit.text()
+        self.scanEdit.clear()
+        if not text.strip():
+            return
+        self.catalog.ensure_loaded()
+        qty, code = parse_scan(text)
+        entry = self.catalog.lookup(code)
+        if entry is None:
+            self.messageLabel.setText(self.tr("Code inconnu : {code}").format(code=code))
+            QApplication.beep()
+            return
+        line = self.cart.add(entry, qty)
+        message = f"{entry.sku} - {entry.name}"
+        if entry.stock - line.qty < 0:
+            message += "  " + self.tr("(stock insuffisant : {qty:g})").format(qty=entry.stock)
+        self.messageLabel.setText(message)
+        self._show_cart(entry.id)
+        REGISTRY.observe("pos.scan", (time.perf_counter() - start) * 1000)
+
+    def _show_cart(self, current_id: int | None = None) -> None:
+        lines = list(self.cart.lines.values())
+        self.table.setRowCount(len(lines))
+        for r, line in enumerate(lines):
+            values = [line.sku, line.description, f"{line.qty:g}", f"{line.unit_price:.2f}", f"{line.vat_rate:g}", f"{line.total_ttc:.2f}"]
+            for c, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if c >= 2:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(r, c, item)
+            self.table.item(r, 0).setData(Qt.UserRole, line.product_id)
+            if line.product_id == current_id:
+                self.table.selectRow(r)
+        _, _, ttc = self.cart.totals()
+        self.totalLabel.setText(self.tr("Total : {total:.2f}").format(total=ttc))
+        self.payBtn.setEnabled(bool(lines))
+
+    @Slot()
+    def _remove(self) -> None:
+        indexes = self.table.selectionModel().selectedRows()
+        if not indexes:
+            return
+        self.cart.remove(self.table.item(indexes[0].row(), 0).data(Qt.UserRole))
+        self._show_cart()
+        self.scanEdit.setFocus()
+
+    @Slot()
+    def _clear(self) -> None:
+        if self.cart.lines and QMessageBox.question(self, self.tr("Confirmer"), self.tr("Abandonner la vente en cours ?")) != QMessageBox.Yes:
+            return
+        self.cart.clear()
+        self.messageLabel.clear()
+        self._show_cart()
+        self.scanEdit.setFocus()
+
+    @Slot()
+    def _pay(self) -> None:
+        if not self.cart.lines:
+            return
+        try:
+            sale = checkout(self.db, self.cart, self.methodCombo.currentData(), catalog=self.catalog)
+        except Exception as e:
+            QMessageBox.critical(self, self.tr("Erreur"), str(e))
+            return
+        self.messageLabel.setText(self.tr("Vente {number} enregistrée : {total:.2f}").format(number=sale["number"], total=sale["total_ttc"]))
+        self.methodCombo.setCurrentIndex(0)
+        self._show_cart()
+        self.scanEdit.setFocus()
@@ -1,12 +1,13 @@
 from __future__ import annotations
 
 from PySide6.QtCore import Slot
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QSpinBox, QMessageBox, QFileDialog
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QSpinBox, QMessageBox, QFileDialog, QAbstractItemView
 
+from app.core.audit import audit
 from app.core.db import Database
-from openpyxl import Workbook, load_workbook
-import csv
-from pathlib import Path
+from app.core.metrics import timed
+from app.views.data_watcher import DataWatcher
+from app.core.products_io import export_products_csv, export_products_xlsx, import_products_csv, import_products_xlsx
 
 
 class ProductsView(QWidget):
@@ -17,6 +18,8 @@ class ProductsView(QWidget):
         self._page_size = 20
         self._build_ui()
         self._load()
+        self.watcher = DataWatcher(db, ("products",), self)
+        self.watcher.changed.connect(self._on_data_changed)
 
     def _build_ui(self) -> None:
         layout = QVBoxLayout(self)
@@ -37,8 +40,8 @@ class ProductsView(QWidget):
         self.table = QTableWidget(self)
         self.table.setColumnCount(6)
         self.table.setHorizontalHeaderLabels([self.tr("ID"), self.tr("SKU"), self.tr("Nom (FR)"), self.tr("Nom (AR)"), self.tr("Unit"), self.tr("Prix HT")])
-        self.table.setSelectionBehavior(self.table.SelectRows)
-        self.table.setEditTriggers(self.table.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         layout.addWidget(self.table)
 
         bottom = QHBoxLayout()
@@ -72,24 +75,30 @@ class ProductsView(QWidget):
         q = self.searchEdit.text().strip()
         if q:
             base += " WHERE (sku LIKE ? OR name_fr LIKE ? OR name_ar LIKE ?)"
-            like = f\"%{q}%\"
+            like = f"%{q}%"
             params.extend([like, like, like])
         base += " ORDER BY id DESC LIMIT ? OFFSET ?"
         params.extend([self._page_size, (self._page - 1) * self._page_size])
         return base, params
 
     def _load(self) -> None:
-        sql, params = self._query()
-        rows = self.db.query(sql, params)
-        self.table.setRowCount(len(rows))
-        for r, row in enumerate(rows):
-            self.table.setItem(r, 0, QTableWidgetItem(str(row["id"])))
-            self.table.setItem(r, 1, QTableWidgetItem(row["sku"]))
-            self.table.setItem(r, 2, QTableWidgetItem(row["name_fr"]))
-            self.table.setItem(r, 3, QTableWidgetItem(row["name_ar"]))
-            self.table.setItem(r, 4, QTableWidgetItem(row["unit"]))
-            self.table.setItem(r, 5, QTableWidgetItem(str(row["price_ht"])))
-        self.table.resizeColumnsToContents()
+        with timed("view.products.load"):
+            sql, params = self._query()
+            rows = self.db.query(sql, params)
+            self.table.setRowCount(len(rows))
+            for r, row in enumerate(rows):
+                self.table.setItem(r, 0, QTableWidgetItem(str(row["id"])))
+                self.table.setItem(r, 1, QTableWidgetItem(row["sku"]))
+                self.table.setItem(r, 2, QTableWidgetItem(row["name_fr"]))
+                self.table.setItem(r, 3, QTableWidgetItem(row["name_ar"]))
+                self.table.setItem(r, 4, QTableWidgetItem(row["unit"]))
+                self.table.setItem(r, 5, QTableWidgetItem(str(row["price_ht"])))
+            self.table.resizeColumnsToContents()
+
+    @Slot(object)
+    def _on_data_changed(self, changes: dict) -> None:
+        # Reloads the current page: the list is filtered and paged
+        self._load()
 
     @Slot()
     def _on_page_change(self, val: int) -> None:
@@ -109,8 +118,8 @@ class ProductsView(QWidget):
 
     @Slot()
     def _add(self) -> None:
-        self.db.execute("INSERT INTO products (sku, name_fr, name_ar, unit, price_ht) VALUES (?, ?, ?, ?, ?);", ("SKU", "Produit", "????", "u", 100.0))
-        self._load()
+        cur = self.db.execute("INSERT INTO products (sku, name_fr, name_ar, unit, price_ht) VALUES (?, ?, ?, ?, ?);", ("SKU", "Produit", "????", "u", 100.0))
+        audit("create", "product", cur.lastrowid)
 
     @Slot()
     def _edit(self) -> None:
@@ -118,7 +127,7 @@ class ProductsView(QWidget):
         if not pid:
             return
         self.db.execute("UPDATE products SET name_fr=name_fr||' *' WHERE id=?;", (pid,))
-        self._load()
+        audit("update", "product", pid)
 
     @Slot()
     def _delete(self) -> None:
@@ -128,63 +137,36 @@ class ProductsView(QWidget):
         if QMessageBox.question(self, self.tr("Confirmer"), self.tr("Supprimer ce produit ?")) != QMessageBox.Yes:
             return
         self.db.execute("DELETE FROM products WHERE id=?;", (pid,))
-        self._load()
+        audit("delete", "product", pid)
 
     @Slot()
     def _export_csv(self) -> None:
         path, _ = QFileDialog.getSaveFileName(self, self.tr("Exporter CSV"), "produits.csv", self.tr("CSV (*.csv)"))
         if not path:
             return
-        rows = self.db.query("SELECT sku, name_fr, name_ar, unit, price_ht FROM products ORDER BY id;")
-        with open(path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(["sku", "name_fr", "name_ar", "unit", "price_ht"])
-            for r in rows:
-                writer.writerow([r["sku"], r["name_fr"], r["name_ar"], r["unit"], r["price_ht"]])
+        count = export_products_csv(self.db, path)
+        audit("export", "product", details={"format": "csv", "rows": count, "path": path})
 
     @Slot()
     def _export_xlsx(self) -> None:
         path, _ = QFileDialog.getSaveFileName(self, self.tr("Exporter Excel"), "produits.xlsx", self.tr("Excel (*.xlsx)"))
         if not path:
             return
-        wb = Workbook()
-        ws = wb.active
-        ws.append(["sku", "name_fr", "name_ar", "unit", "price_ht"])
-        rows = self.db.query("SELECT sku, name_fr, name_ar, unit, price_ht FROM products ORDER BY id;")
-        for r in rows:
-            ws.append([r["sku"], r["name_fr"], r["name_ar"], r["unit"], r["price_ht"]])
-        wb.save(path)
+        count = export_products_xlsx(self.db, path)
+        audit("export", "product", details={"format": "xlsx", "rows": count, "path": path})
 
     @Slot()
     def _import_csv(self) -> None:
         path, _ = QFileDialog.getOpenFileName(self, self.tr("Importer CSV"), "", self.tr("CSV (*.csv)"))
         if not path:
             return
-        with open(path, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                self.db.execute(
-                    "INSERT OR REPLACE INTO products (sku, name_fr, name_ar, unit, price_ht) VALUES (?, ?, ?, ?, ?);",
-                    (row.get("sku",""), row.get("name_fr",""), row.get("name_ar",""), row.get("unit","u"), float(row.get("price_ht", "0") or 0)),
-                )
-        self._load()
+        count = import_products_csv(self.db, path)
+        audit("import", "product", details={"format": "csv", "rows": count, "path": path})
 
     @Slot()
     def _import_xlsx(self) -> None:
         path, _ = QFileDialog.getOpenFileName(self, self.tr("Importer Excel"), "", self.tr("Excel (*.xlsx)"))
         if not path:
             return
-        wb = load_workbook(path)
-        ws = wb.active
-        first = True
-        for row in ws.iter_rows(values_only=True):
-            if first:
-                first = False
-                continue
-            sku, name_fr, name_ar, unit, price_ht = row
-            self.db.execute(
-                "INSERT OR REPLACE INTO products (sku, name_fr, name_ar, unit, price_ht) VALUES (?, ?, ?, ?, ?);",
-                (sku or "", name_fr or "", name_ar or "", unit or "u", float(price_ht or 0)),
-            )
-        self._load()
-
+        count = import_products_xlsx(self.db, path)
+        audit("import", "product", details={"format": "xlsx", "rows": count, "path": path})
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
-from datetime import date
 from PySide6.QtCore import Slot
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QAbstractItemView, QMessageBox
 
+from app.core.catalog import shared_catalog
 from app.core.db import Database
+from app.core.metrics import timed
+from app.core.documents import cancel_document, create_draft, validate_document
+from app.views.data_watcher import PATCH_LIMIT, DataWatcher, patch_rows
+from app.views.line_editor import LineEditorDialog
 
 
 class PurchasesView(QWidget):
@@ -13,56 +17,112 @@ class PurchasesView(QWidget):
         self.db = db
         self._build_ui()
         self._load()
+        self.watcher = DataWatcher(db, ("documents",), self)
+        self.watcher.changed.connect(self._on_data_changed)
 
     def _build_ui(self) -> None:
         layout = QVBoxLayout(self)
         top = QHBoxLayout()
         self.addBtn = QPushButton(self.tr("Nouvel achat"))
+        self.validateBtn = QPushButton(self.tr("Valider"))
+        self.cancelDocBtn = QPushButton(self.tr("Annuler le document"))
         self.refreshBtn = QPushButton(self.tr("Actualiser"))
+        self.linesBtn = QPushButton(self.tr("Lignes"))
         top.addWidget(self.addBtn)
+        top.addWidget(self.linesBtn)
+        top.addWidget(self.validateBtn)
+        top.addWidget(self.cancelDocBtn)
         top.addWidget(self.refreshBtn)
         layout.addLayout(top)
 
         self.table = QTableWidget(self)
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels([self.tr("ID"), self.tr("Num?ro"), self.tr("Date"), self.tr("Total TTC")])
+        self.table.setColumnCount(5)
+        self.table.setHorizontalHeaderLabels([self.tr("ID"), self.tr("Num?ro"), self.tr("Date"), self.tr("Total TTC"), self.tr("Statut")])
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         layout.addWidget(self.table)
 
         self.addBtn.clicked.connect(self._add)
+        self.linesBtn.clicked.connect(self._edit_lines)
+        self.table.doubleClicked.connect(self._edit_lines)
+        self.validateBtn.clicked.connect(self._validate)
+        self.cancelDocBtn.clicked.connect(self._cancel)
         self.refreshBtn.clicked.connect(self._load)
 
+    _SELECT = "SELECT id, number, date, total_ttc, status FROM documents WHERE kind='purchase' {where} ORDER BY id DESC;"
+
     def _load(self) -> None:
-        rows = self.db.query("SELECT id, number, date, total_ttc FROM documents WHERE kind='purchase' ORDER BY id DESC;")
-        self.table.setRowCount(len(rows))
-        for r, row in enumerate(rows):
-            self.table.setItem(r, 0, QTableWidgetItem(str(row["id"])))
-            self.table.setItem(r, 1, QTableWidgetItem(row["number"]))
-            self.table.setItem(r, 2, QTableWidgetItem(row["date"]))
-            self.table.setItem(r, 3, QTableWidgetItem(f"{row['total_ttc']:.2f}"))
-        self.table.resizeColumnsToContents()
+        with timed("view.purchases.load"):
+            rows = self.db.query(self._SELECT.format(where=""))
+            self.table.setRowCount(len(rows))
+            for r, row in enumerate(rows):
+                self._fill_row(r, row)
+            self.table.resizeColumnsToContents()
+
+    def _fill_row(self, r: int, row) -> None:
+        self.table.setItem(r, 0, QTableWidgetItem(str(row["id"])))
+        self.table.setItem(r, 1, QTableWidgetItem(row["number"]))
+        self.table.setItem(r, 2, QTableWidgetItem(row["date"]))
+        self.table.setItem(r, 3, QTableWidgetItem(f"{row['total_ttc']:.2f}"))
+        self.table.setItem(r, 4, QTableWidgetItem(row["status"]))
+
+    @Slot(object)
+    def _on_data_changed(self, changes: dict) -> None:
+        ids = changes["documents"]
+        if ids is None or len(ids) > PATCH_LIMIT:
+            self._load()
+            return
+        rows = self.db.query(self._SELECT.format(where=f"AND id IN ({', '.join('?' for _ in ids)})"), tuple(ids))
+        patch_rows(self.table, ids, rows, self._fill_row)
+
+    def _current_id(self) -> int | None:
+        indexes = self.table.selectionModel().selectedRows()
+        if not indexes:
+            return None
+        return int(self.table.item(indexes[0].row(), 0).text())
+
+    @Slot()
+    def _validate(self) -> None:
+        doc_id = self._current_id()
+        if not doc_id:
+            return
+        try:
+            validated = validate_document(self.db, doc_id, shared_catalog(self.db))
+        except ValueError as e:
+            QMessageBox.warning(self, self.tr("Erreur"), str(e))
+            return
+        if not validated:
+            QMessageBox.warning(self, self.tr("Erreur"), self.tr("Seuls les brouillons peuvent être validés"))
+
+    @Slot()
+    def _cancel(self) -> None:
+        doc_id = self._current_id()
+        if not doc_id:
+            return
+        if QMessageBox.question(self, self.tr("Confirmer"), self.tr("Annuler ce document ? Ses mouvements de stock seront contrepassés.")) != QMessageBox.Yes:
+            return
+        try:
+            cancelled = cancel_document(self.db, doc_id, shared_catalog(self.db))
+        except ValueError as e:
+            QMessageBox.warning(self, self.tr("Erreur"), str(e))
+            return
+        if not cancelled:
+            QMessageBox.warning(self, self.tr("Erreur"), self.tr("Ce document est déjà annulé"))
 
     @Slot()
     def _add(self) -> None:
-        # minimal purchase document
-        last = self.db.query("SELECT number FROM documents WHERE kind='purchase' ORDER BY id DESC LIMIT 1;")
-        if not last:
-            number = "PUR-000001"
-        else:
-            l = last[0]["number"]
-            try:
-                n = int(l.split("-")[-1]) + 1
-            except Exception:
-                n = 1
-            number = f"PUR-{n:06d}"
-        self.db.execute("INSERT INTO documents (kind, number, date, status) VALUES ('purchase', ?, ?, 'draft');", (number, date.today().isoformat()))
-        doc_id = self.db.scalar("SELECT last_insert_rowid();")
-        self.db.execute("INSERT INTO document_lines (document_id, description, qty, unit_price) VALUES (?, 'Achat', 1, 50.0);", (doc_id,))
-        self.db.execute("""
-        UPDATE documents SET 
-            total_ht=(SELECT SUM(qty*unit_price) FROM document_lines WHERE document_id=?),
-            total_tva=ROUND((SELECT SUM(qty*unit_price*0.2) FROM document_lines WHERE document_id=?),2),
-            total_ttc=ROUND((SELECT SUM(qty*unit_price*1.2) FROM document_lines WHERE document_id=?),2)
-        WHERE id=?;
-        """, (doc_id, doc_id, doc_id, doc_id))
-        self._load()
+        doc_id, _ = create_draft(self.db, "purchase")
+        self._open_lines(doc_id)
+
+    @Slot()
+    def _edit_lines(self) -> None:
+        doc_id = self._current_id()
+        if doc_id:
+            self._open_lines(doc_id)
+
+    def _open_lines(self, doc_id: int) -> None:
+        if self.db.scalar("SELECT status FROM documents WHERE id=?;", (doc_id,)) != "draft":
+            QMessageBox.information(self, self.tr("Information"), self.tr("Seuls les brouillons peuvent être modifiés"))
+            return
+        LineEditorDialog(self.db, doc_id, self).exec()
 
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from PySide6.QtCore import QDate
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QDateEdit, QLabel, QAbstractItemView
+
+from app.core.db import Database
+from app.core.metrics import timed
+from app.core.receivables import AGING_BUCKETS, aging_report
+from app.views.data_watcher import DataWatcher
+
+
+class ReceivablesView(QWidget):
+    def __init__(self, db: Database, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._build_ui()
+        self._load()
+        self.watcher = DataWatcher(db, ("documents", "payments"), self)
+        self.watcher.changed.connect(lambda _changes: self._load())
+
+    def _build_ui(self) -> None:
+        layout = QVBoxLayout(self)
+        top = QHBoxLayout()
+        self.asOfEdit = QDateEdit(QDate.currentDate(), self)
+        self.asOfEdit.setCalendarPopup(True)
+        self.refreshBtn = QPushButton(self.tr("Actualiser"))
+        top.addWidget(QLabel(self.tr("Au")))
+        top.addWidget(self.asOfEdit)
+        top.addWidget(self.refreshBtn)
+        top.addStretch(1)
+        layout.addLayout(top)
+
+        self.table = QTableWidget(self)
+        headers = [self.tr("Client"), self.tr("Factures")] + [self.tr("{label} j").format(label=b[0]) for b in AGING_BUCKETS] + [self.tr("Total dû")]
+        self.table.setColumnCount(len(headers))
+        self.table.setHorizontalHeaderLabels(headers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        self.totalLabel = QLabel(self)
+        layout.addWidget(self.totalLabel)
+
+        self.refreshBtn.clicked.connect(self._load)
+        self.asOfEdit.dateChanged.connect(self._load)
+
+    def _load(self) -> None:
+        with timed("view.receivables.load"):
+            rows = aging_report(self.db, self.asOfEdit.date().toPython())
+            self.table.setRowCount(len(rows))
+            for r, row in enumerate(rows):
+                self.table.setItem(r, 0, QTableWidgetItem(row["partner"]))
+                self.table.setItem(r, 1, QTableWidgetItem(str(row["invoices"])))
+                for c, (label, _, _) in enumerate(AGING_BUCKETS, start=2):
+                    self.table.setItem(r, c, QTableWidgetItem(f"{row[label] or 0:.2f}"))
+                self.table.setItem(r, len(AGING_BUCKETS) + 2, QTableWidgetItem(f"{row['total'] or 0:.2f}"))
+            self.table.resizeColumnsToContents()
+            self.totalLabel.setText(self.tr("Encours total : {total:.2f}").format(total=sum(r["total"] or 0 for r in rows)))
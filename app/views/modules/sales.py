@@ -1,15 +1,21 @@
 from __future__ import annotations
 
-from datetime import date
 from pathlib import Path
 
-from PySide6.QtCore import Slot
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QFileDialog, QMessageBox
+from PySide6.QtCore import QBuffer, QByteArray, QIODevice, Slot
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QCheckBox, QTableWidget, QTableWidgetItem, QFileDialog, QMessageBox, QAbstractItemView
 from PySide6.QtPdfWidgets import QPdfView
 from PySide6.QtPdf import QPdfDocument
 
+from app.core import archive
+from app.core.audit import audit
 from app.core.db import Database
-from app.core.pdf import generate_document_pdf
+from app.core.metrics import timed
+from app.core.catalog import shared_catalog
+from app.core.documents import cancel_document, CONVERSIONS, convert_documents, create_draft, validate_document
+from app.views.data_watcher import PATCH_LIMIT, DataWatcher, patch_rows
+from app.views.line_editor import LineEditorDialog
+from app.core.pdf import generate_document_pdf, render_document_pdf
 
 
 class SalesView(QWidget):
@@ -19,51 +25,110 @@ class SalesView(QWidget):
         self.kind = kind
         self._build_ui()
         self._load()
+        self.watcher = DataWatcher(db, ("documents", "partners"), self)
+        self.watcher.changed.connect(self._on_data_changed)
 
     def _build_ui(self) -> None:
         layout = QVBoxLayout(self)
         top = QHBoxLayout()
         self.addBtn = QPushButton(self.tr("Nouveau"))
+        self.validateBtn = QPushButton(self.tr("Valider"))
+        self.cancelDocBtn = QPushButton(self.tr("Annuler le document"))
         self.genPdfBtn = QPushButton(self.tr("PDF"))
         self.previewBtn = QPushButton(self.tr("Aper?u"))
+        self.linesBtn = QPushButton(self.tr("Lignes"))
         top.addWidget(self.addBtn)
+        top.addWidget(self.linesBtn)
+        top.addWidget(self.validateBtn)
+        top.addWidget(self.cancelDocBtn)
         top.addWidget(self.genPdfBtn)
         top.addWidget(self.previewBtn)
+        # Conversions work on every selected row
+        self.convertBtns = {}
+        labels = {"delivery": self.tr("Créer le BL"), "invoice": self.tr("Facturer")}
+        for target in CONVERSIONS.get(self.kind, ()):
+            btn = self.convertBtns[target] = QPushButton(labels[target])
+            btn.clicked.connect(lambda _=False, t=target: self._convert(t))
+            top.addWidget(btn)
+        top.addStretch(1)
+        # Closed years moved to archive files are only read when asked for
+        self.historyCheck = QCheckBox(self.tr("Inclure les archives"))
+        self.historyCheck.setEnabled(self.db.path is not None and bool(archive.archived_years(self.db)))
+        self.historyCheck.toggled.connect(self._toggle_history)
+        top.addWidget(self.historyCheck)
         layout.addLayout(top)
 
         self.table = QTableWidget(self)
         self.table.setColumnCount(6)
         self.table.setHorizontalHeaderLabels([self.tr("ID"), self.tr("Num?ro"), self.tr("Date"), self.tr("Client"), self.tr("Total TTC"), self.tr("Statut")])
-        self.table.setSelectionBehavior(self.table.SelectRows)
-        self.table.setEditTriggers(self.table.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         layout.addWidget(self.table)
 
         self.pdfDoc = QPdfDocument(self)
+        # QPdfDocument reads lazily from the device, keep the buffer alive while it is loaded
+        self._previewBuffer: QBuffer | None = None
         self.pdfView = QPdfView(self)
         self.pdfView.setDocument(self.pdfDoc)
         layout.addWidget(self.pdfView)
 
         self.addBtn.clicked.connect(self._add)
+        self.linesBtn.clicked.connect(self._edit_lines)
+        self.table.doubleClicked.connect(self._edit_lines)
+        self.validateBtn.clicked.connect(self._validate)
+        self.cancelDocBtn.clicked.connect(self._cancel)
         self.genPdfBtn.clicked.connect(self._export_pdf)
         self.previewBtn.clicked.connect(self._preview_pdf)
 
-    def _load(self) -> None:
-        rows = self.db.query("""
+    _SELECT = """
         SELECT d.id, d.number, d.date, d.total_ttc, d.status, IFNULL(p.name_fr,'') as partner
-        FROM documents d
+        FROM {table} d
         LEFT JOIN partners p ON p.id=d.partner_id
-        WHERE d.kind=?
+        WHERE d.kind=? {where}
         ORDER BY d.id DESC
-        """, (self.kind,))
-        self.table.setRowCount(len(rows))
-        for r, row in enumerate(rows):
-            self.table.setItem(r, 0, QTableWidgetItem(str(row["id"])))
-            self.table.setItem(r, 1, QTableWidgetItem(row["number"]))
-            self.table.setItem(r, 2, QTableWidgetItem(row["date"]))
-            self.table.setItem(r, 3, QTableWidgetItem(row["partner"]))
-            self.table.setItem(r, 4, QTableWidgetItem(f"{row['total_ttc']:.2f}"))
-            self.table.setItem(r, 5, QTableWidgetItem(row["status"]))
-        self.table.resizeColumnsToContents()
+        """
+
+    def _load(self) -> None:
+        with timed("view.sales.load"):
+            if self.historyCheck.isChecked():
+                with archive.history(self.db):
+                    rows = self.db.query(self._SELECT.format(table="all_documents", where=""), (self.kind,))
+            else:
+                rows = self.db.query(self._SELECT.format(table="documents", where=""), (self.kind,))
+            self.table.setRowCount(len(rows))
+            for r, row in enumerate(rows):
+                self._fill_row(r, row)
+            self.table.resizeColumnsToContents()
+
+    def _fill_row(self, r: int, row) -> None:
+        self.table.setItem(r, 0, QTableWidgetItem(str(row["id"])))
+        self.table.setItem(r, 1, QTableWidgetItem(row["number"]))
+        self.table.setItem(r, 2, QTableWidgetItem(row["date"]))
+        self.table.setItem(r, 3, QTableWidgetItem(row["partner"]))
+        self.table.setItem(r, 4, QTableWidgetItem(f"{row['total_ttc']:.2f}"))
+        self.table.setItem(r, 5, QTableWidgetItem(row["status"]))
+
+    @Slot(object)
+    def _on_data_changed(self, changes: dict) -> None:
+        # Only the documents that changed, or those of a renamed customer, are re-read
+        docs, partners = changes.get("documents", frozenset()), changes.get("partners", frozenset())
+        if docs is None or partners is None or len(docs) + len(partners) > PATCH_LIMIT or self.historyCheck.isChecked():
+            self._load()
+            return
+        if docs:
+            rows = self.db.query(self._SELECT.format(table="documents", where=f"AND d.id IN ({', '.join('?' for _ in docs)})"), (self.kind, *docs))
+            patch_rows(self.table, docs, rows, self._fill_row)
+        if partners:
+            rows = self.db.query(self._SELECT.format(table="documents", where=f"AND d.partner_id IN ({', '.join('?' for _ in partners)})"), (self.kind, *partners))
+            patch_rows(self.table, [r["id"] for r in rows], rows, self._fill_row)
+
+    @Slot(bool)
+    def _toggle_history(self, checked: bool) -> None:
+        # Archived documents are read-only: they are no longer in the working tables
+        for btn in (self.addBtn, self.linesBtn, self.validateBtn, self.cancelDocBtn, self.genPdfBtn, self.previewBtn, *self.convertBtns.values()):
+            btn.setEnabled(not checked)
+        self._load()
 
     def _current_id(self) -> int | None:
         indexes = self.table.selectionModel().selectedRows()
@@ -71,42 +136,77 @@ class SalesView(QWidget):
             return None
         return int(self.table.item(indexes[0].row(), 0).text())
 
-    def _next_number(self) -> str:
-        prefix = {
-            "invoice": "INV-",
-            "quote": "QTE-",
-            "delivery": "BL-",
-        }.get(self.kind, "DOC-")
-        last = self.db.query("SELECT number FROM documents WHERE kind=? ORDER BY id DESC LIMIT 1;", (self.kind,))
-        if not last:
-            return f"{prefix}000001"
-        l = last[0]["number"]
-        try:
-            n = int(l.split("-")[-1]) + 1
-        except Exception:
-            n = 1
-        return f"{prefix}{n:06d}"
+    def _selected_ids(self) -> list[int]:
+        return [int(self.table.item(i.row(), 0).text()) for i in self.table.selectionModel().selectedRows()]
 
     @Slot()
     def _add(self) -> None:
-        number = self._next_number()
-        self.db.execute("INSERT INTO documents (kind, number, date, status) VALUES (?, ?, ?, 'draft');", (self.kind, number, date.today().isoformat()))
-        doc_id = self.db.scalar("SELECT last_insert_rowid();")
-        # Minimal line
-        self.db.execute("INSERT INTO document_lines (document_id, description, qty, unit_price) VALUES (?, ?, 1, 100.0);", (doc_id, f"Ligne {number}"))
-        # Totals
-        self.db.execute("""
-        UPDATE documents SET 
-            total_ht=(SELECT SUM(qty*unit_price) FROM document_lines WHERE document_id=?),
-            total_tva=ROUND((SELECT SUM(qty*unit_price*0.2) FROM document_lines WHERE document_id=?),2),
-            total_ttc=ROUND((SELECT SUM(qty*unit_price*1.2) FROM document_lines WHERE document_id=?),2)
-        WHERE id=?;
-        """, (doc_id, doc_id, doc_id, doc_id))
-        self._load()
+        doc_id, _ = create_draft(self.db, self.kind)
+        self._open_lines(doc_id)
+
+    @Slot()
+    def _edit_lines(self) -> None:
+        doc_id = self._current_id()
+        if doc_id:
+            self._open_lines(doc_id)
+
+    def _open_lines(self, doc_id: int) -> None:
+        if self.db.scalar("SELECT status FROM documents WHERE id=?;", (doc_id,)) != "draft":
+            QMessageBox.information(self, self.tr("Information"), self.tr("Seuls les brouillons peuvent être modifiés"))
+            return
+        LineEditorDialog(self.db, doc_id, self).exec()
+
+    @Slot()
+    def _validate(self) -> None:
+        doc_id = self._current_id()
+        if not doc_id:
+            return
+        try:
+            validated = validate_document(self.db, doc_id, shared_catalog(self.db))
+        except ValueError as e:
+            QMessageBox.warning(self, self.tr("Erreur"), str(e))
+            return
+        if not validated:
+            QMessageBox.warning(self, self.tr("Erreur"), self.tr("Seuls les brouillons peuvent être validés"))
+
+    @Slot()
+    def _cancel(self) -> None:
+        doc_id = self._current_id()
+        if not doc_id:
+            return
+        if QMessageBox.question(self, self.tr("Confirmer"), self.tr("Annuler ce document ? Ses mouvements de stock seront contrepassés.")) != QMessageBox.Yes:
+            return
+        try:
+            cancelled = cancel_document(self.db, doc_id, shared_catalog(self.db))
+        except ValueError as e:
+            QMessageBox.warning(self, self.tr("Erreur"), str(e))
+            return
+        if not cancelled:
+            QMessageBox.warning(self, self.tr("Erreur"), self.tr("Ce document est déjà annulé"))
+
+    def _convert(self, target: str) -> None:
+        ids = self._selected_ids()
+        if not ids:
+            return
+        if len(ids) > 1 and QMessageBox.question(
+            self, self.tr("Confirmer"), self.tr("Convertir {count} documents ?").format(count=len(ids))
+        ) != QMessageBox.Yes:
+            return
+        try:
+            created = convert_documents(self.db, ids, target, catalog=shared_catalog(self.db))
+        except Exception as e:
+            QMessageBox.critical(self, self.tr("Erreur"), str(e))
+            return
+        message = self.tr("{created} document(s) créé(s)").format(created=len(created))
+        if len(created) < len(ids):
+            message += "\n" + self.tr("{skipped} ignoré(s) : non validés ou déjà convertis").format(skipped=len(ids) - len(created))
+        QMessageBox.information(self, self.tr("Information"), message)
+
+    def _base_dir(self) -> Path:
+        return Path(__file__).resolve().parents[3]
 
     def _generate_pdf_to_path(self, doc_id: int, path: Path) -> None:
-        base_dir = Path(__file__).resolve().parents[2]
-        generate_document_pdf(self.db, doc_id, path, base_dir)
+        generate_document_pdf(self.db, doc_id, path, self._base_dir())
 
     @Slot()
     def _export_pdf(self) -> None:
@@ -117,6 +217,7 @@ class SalesView(QWidget):
         if not path:
             return
         self._generate_pdf_to_path(doc_id, Path(path))
+        audit("export", "document", doc_id, {"format": "pdf"})
         QMessageBox.information(self, self.tr("Succ?s"), self.tr("PDF g?n?r?"))
 
     @Slot()
@@ -124,7 +225,14 @@ class SalesView(QWidget):
         doc_id = self._current_id()
         if not doc_id:
             return
-        tmp = Path.cwd() / f"preview-{self.kind}-{doc_id}.pdf"
-        self._generate_pdf_to_path(doc_id, tmp)
-        self.pdfDoc.load(str(tmp))
+        data = render_document_pdf(self.db, doc_id, self._base_dir())
+        self.pdfDoc.close()
+        if self._previewBuffer is not None:
+            self._previewBuffer.close()
+            self._previewBuffer.deleteLater()
+        buf = QBuffer(self)
+        buf.setData(QByteArray(data))
+        buf.open(QIODevice.ReadOnly)
+        self._previewBuffer = buf
+        self.pdfDoc.load(buf)
 
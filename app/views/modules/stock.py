@@ -1,9 +1,13 @@
 from __future__ import annotations
 
 from PySide6.QtCore import Slot
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QLabel
 
 from app.core.db import Database
+from app.core.metrics import timed
+from app.core.valuation import valuation_totals
+from app.views.data_watcher import PATCH_LIMIT, DataWatcher, patch_rows
+from app.views.replenishment_dialog import ReplenishmentDialog
 
 
 class StockView(QWidget):
@@ -12,32 +16,75 @@ class StockView(QWidget):
         self.db = db
         self._build_ui()
         self._load()
+        self.watcher = DataWatcher(db, ("products", "stock", "stock_valuation"), self)
+        self.watcher.changed.connect(self._on_data_changed)
 
     def _build_ui(self) -> None:
         layout = QVBoxLayout(self)
         top = QHBoxLayout()
         self.refreshBtn = QPushButton(self.tr("Actualiser"))
+        self.replenishBtn = QPushButton(self.tr("Réapprovisionnement"))
         top.addWidget(self.refreshBtn)
+        top.addWidget(self.replenishBtn)
+        self.totalLabel = QLabel(self)
+        top.addWidget(self.totalLabel, 1)
         layout.addLayout(top)
 
         self.table = QTableWidget(self)
-        self.table.setColumnCount(3)
-        self.table.setHorizontalHeaderLabels([self.tr("Produit ID"), self.tr("SKU"), self.tr("Quantit?")])
+        self.table.setColumnCount(6)
+        self.table.setHorizontalHeaderLabels([self.tr("Produit ID"), self.tr("SKU"), self.tr("Quantit?"), self.tr("Coût moyen"), self.tr("Valeur CMP"), self.tr("Valeur FIFO")])
         layout.addWidget(self.table)
 
         self.refreshBtn.clicked.connect(self._load)
+        self.replenishBtn.clicked.connect(self._replenish)
 
-    def _load(self) -> None:
-        rows = self.db.query("""
-        SELECT p.id as product_id, p.sku as sku, IFNULL(s.qty,0) as qty
+    _SELECT = """
+        SELECT p.id as product_id, p.sku as sku, IFNULL(s.qty,0) as qty,
+               IFNULL(v.avg_cost,0) as avg_cost, IFNULL(v.value,0) as value, IFNULL(v.fifo_value,0) as fifo_value
         FROM products p
         LEFT JOIN stock s ON s.product_id=p.id
+        LEFT JOIN stock_valuation v ON v.product_id=p.id
+        {where}
         ORDER BY p.id DESC
-        """)
-        self.table.setRowCount(len(rows))
-        for r, row in enumerate(rows):
-            self.table.setItem(r, 0, QTableWidgetItem(str(row["product_id"])))
-            self.table.setItem(r, 1, QTableWidgetItem(row["sku"]))
-            self.table.setItem(r, 2, QTableWidgetItem(str(row["qty"])))
-        self.table.resizeColumnsToContents()
+        """
+
+    def _load(self) -> None:
+        with timed("view.stock.load"):
+            rows = self.db.query(self._SELECT.format(where=""))
+            self.table.setRowCount(len(rows))
+            for r, row in enumerate(rows):
+                self._fill_row(r, row)
+            self.table.resizeColumnsToContents()
+            self._show_totals()
+
+    def _fill_row(self, r: int, row) -> None:
+        self.table.setItem(r, 0, QTableWidgetItem(str(row["product_id"])))
+        self.table.setItem(r, 1, QTableWidgetItem(row["sku"]))
+        self.table.setItem(r, 2, QTableWidgetItem(str(row["qty"])))
+        self.table.setItem(r, 3, QTableWidgetItem(f"{row['avg_cost']:.2f}"))
+        self.table.setItem(r, 4, QTableWidgetItem(f"{row['value']:.2f}"))
+        self.table.setItem(r, 5, QTableWidgetItem(f"{row['fifo_value']:.2f}"))
+
+    def _show_totals(self) -> None:
+        totals = valuation_totals(self.db)
+        self.totalLabel.setText(self.tr("Valeur du stock : CMP {wac:.2f}  FIFO {fifo:.2f}").format(wac=totals["wac"], fifo=totals["fifo"]))
+
+    @Slot(object)
+    def _on_data_changed(self, changes: dict) -> None:
+        # Product ids for all three tables: only the products that moved are re-read
+        ids: set[int] = set()
+        for table_ids in changes.values():
+            if table_ids is None:
+                self._load()
+                return
+            ids |= table_ids
+        if len(ids) > PATCH_LIMIT:
+            self._load()
+            return
+        rows = self.db.query(self._SELECT.format(where=f"WHERE p.id IN ({', '.join('?' for _ in ids)})"), tuple(ids))
+        patch_rows(self.table, ids, rows, self._fill_row)
+        self._show_totals()
 
+    @Slot()
+    def _replenish(self) -> None:
+        ReplenishmentDialog(self.db, self).exec()
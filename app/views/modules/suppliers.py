@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 from PySide6.QtCore import Slot
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QSpinBox, QMessageBox
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QSpinBox, QMessageBox, QAbstractItemView, QInputDialog
 
+from app.core.audit import audit
 from app.core.db import Database
+from app.core.metrics import timed
+from app.views.data_watcher import DataWatcher
 
 
 class SuppliersView(QWidget):
@@ -14,6 +17,8 @@ class SuppliersView(QWidget):
         self._page_size = 20
         self._build_ui()
         self._load()
+        self.watcher = DataWatcher(db, ("partners",), self)
+        self.watcher.changed.connect(self._on_data_changed)
 
     def _build_ui(self) -> None:
         layout = QVBoxLayout(self)
@@ -23,17 +28,19 @@ class SuppliersView(QWidget):
         self.addBtn = QPushButton(self.tr("Ajouter"))
         self.editBtn = QPushButton(self.tr("Modifier"))
         self.delBtn = QPushButton(self.tr("Supprimer"))
+        self.leadBtn = QPushButton(self.tr("Délai de livraison"))
         top.addWidget(self.searchEdit)
         top.addWidget(self.addBtn)
         top.addWidget(self.editBtn)
         top.addWidget(self.delBtn)
+        top.addWidget(self.leadBtn)
         layout.addLayout(top)
 
         self.table = QTableWidget(self)
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels([self.tr("ID"), self.tr("Nom (FR)"), self.tr("Nom (AR)"), self.tr("T?l?phone"), self.tr("Email")])
-        self.table.setSelectionBehavior(self.table.SelectRows)
-        self.table.setEditTriggers(self.table.NoEditTriggers)
+        self.table.setColumnCount(6)
+        self.table.setHorizontalHeaderLabels([self.tr("ID"), self.tr("Nom (FR)"), self.tr("Nom (AR)"), self.tr("T?l?phone"), self.tr("Email"), self.tr("Délai (j)")])
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         layout.addWidget(self.table)
 
         bottom = QHBoxLayout()
@@ -56,30 +63,38 @@ class SuppliersView(QWidget):
         self.addBtn.clicked.connect(self._add)
         self.editBtn.clicked.connect(self._edit)
         self.delBtn.clicked.connect(self._delete)
+        self.leadBtn.clicked.connect(self._edit_lead_time)
 
     def _query(self):
-        base = "SELECT id, name_fr, name_ar, phone, email FROM partners WHERE kind='supplier'"
+        base = "SELECT id, name_fr, name_ar, phone, email, lead_time_days FROM partners WHERE kind='supplier'"
         params = []
         q = self.searchEdit.text().strip()
         if q:
             base += " AND (name_fr LIKE ? OR name_ar LIKE ? OR phone LIKE ? OR email LIKE ?)"
-            like = f\"%{q}%\"
+            like = f"%{q}%"
             params.extend([like, like, like, like])
         base += " ORDER BY id DESC LIMIT ? OFFSET ?"
         params.extend([self._page_size, (self._page - 1) * self._page_size])
         return base, params
 
     def _load(self) -> None:
-        sql, params = self._query()
-        rows = self.db.query(sql, params)
-        self.table.setRowCount(len(rows))
-        for r, row in enumerate(rows):
-            self.table.setItem(r, 0, QTableWidgetItem(str(row["id"])))
-            self.table.setItem(r, 1, QTableWidgetItem(row["name_fr"]))
-            self.table.setItem(r, 2, QTableWidgetItem(row["name_ar"]))
-            self.table.setItem(r, 3, QTableWidgetItem(row["phone"]))
-            self.table.setItem(r, 4, QTableWidgetItem(row["email"]))
-        self.table.resizeColumnsToContents()
+        with timed("view.suppliers.load"):
+            sql, params = self._query()
+            rows = self.db.query(sql, params)
+            self.table.setRowCount(len(rows))
+            for r, row in enumerate(rows):
+                self.table.setItem(r, 0, QTableWidgetItem(str(row["id"])))
+                self.table.setItem(r, 1, QTableWidgetItem(row["name_fr"]))
+                self.table.setItem(r, 2, QTableWidgetItem(row["name_ar"]))
+                self.table.setItem(r, 3, QTableWidgetItem(row["phone"]))
+                self.table.setItem(r, 4, QTableWidgetItem(row["email"]))
+                self.table.setItem(r, 5, QTableWidgetItem("" if row["lead_time_days"] is None else str(row["lead_time_days"])))
+            self.table.resizeColumnsToContents()
+
+    @Slot(object)
+    def _on_data_changed(self, changes: dict) -> None:
+        # Reloads the current page: the list is filtered and paged
+        self._load()
 
     @Slot()
     def _on_page_change(self, val: int) -> None:
@@ -100,8 +115,8 @@ class SuppliersView(QWidget):
     @Slot()
     def _add(self) -> None:
         name_fr, name_ar = "Fournisseur", "????"
-        self.db.execute("INSERT INTO partners (kind, name_fr, name_ar) VALUES ('supplier', ?, ?);", (name_fr, name_ar))
-        self._load()
+        cur = self.db.execute("INSERT INTO partners (kind, name_fr, name_ar) VALUES ('supplier', ?, ?);", (name_fr, name_ar))
+        audit("create", "partner", cur.lastrowid)
 
     @Slot()
     def _edit(self) -> None:
@@ -109,7 +124,7 @@ class SuppliersView(QWidget):
         if not cid:
             return
         self.db.execute("UPDATE partners SET name_fr=name_fr||' *' WHERE id=?;", (cid,))
-        self._load()
+        audit("update", "partner", cid)
 
     @Slot()
     def _delete(self) -> None:
@@ -119,5 +134,18 @@ class SuppliersView(QWidget):
         if QMessageBox.question(self, self.tr("Confirmer"), self.tr("Supprimer ce fournisseur ?")) != QMessageBox.Yes:
             return
         self.db.execute("DELETE FROM partners WHERE id=?;", (cid,))
-        self._load()
+        audit("delete", "partner", cid)
+
 
+    @Slot()
+    def _edit_lead_time(self) -> None:
+        # Used for reorder points; 0 falls back to the default lead time setting
+        cid = self._current_id()
+        if not cid:
+            return
+        current = self.db.scalar("SELECT lead_time_days FROM partners WHERE id=?;", (cid,)) or 0
+        days, ok = QInputDialog.getInt(self, self.tr("Délai de livraison"), self.tr("Jours (0 = délai par défaut)"), current, 0, 365)
+        if not ok:
+            return
+        self.db.execute("UPDATE partners SET lead_time_days=? WHERE id=?;", (days or None, cid))
+        audit("update", "partner", cid, {"lead_time_days": days or None})
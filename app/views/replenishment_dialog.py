@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from PySide6.QtCore import Qt, Slot
+from PySide6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QLabel, QMessageBox, QAbstractItemView
+
+from app.core.db import Database
+from app.core.replenishment import create_purchase_orders, suggest
+
+
+class ReplenishmentDialog(QDialog):
+    # Reorder suggestions; the selected rows (all by default) become draft purchases
+    def __init__(self, db: Database, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.suggestions = []
+        self.setWindowTitle(self.tr("Réapprovisionnement"))
+        self.resize(1000, 600)
+        self._build_ui()
+        self._load()
+
+    def _build_ui(self) -> None:
+        layout = QVBoxLayout(self)
+        self.summaryLabel = QLabel(self)
+        layout.addWidget(self.summaryLabel)
+
+        self.table = QTableWidget(self)
+        self.table.setColumnCount(8)
+        self.table.setHorizontalHeaderLabels([
+            self.tr("SKU"), self.tr("Désignation"), self.tr("Fournisseur"), self.tr("Ventes / jour"),
+            self.tr("Stock"), self.tr("En commande"), self.tr("Point de commande"), self.tr("À commander"),
+        ])
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        bottom = QHBoxLayout()
+        self.refreshBtn = QPushButton(self.tr("Actualiser"))
+        self.createBtn = QPushButton(self.tr("Créer les commandes"))
+        self.closeBtn = QPushButton(self.tr("Fermer"))
+        bottom.addWidget(self.refreshBtn)
+        bottom.addStretch(1)
+        bottom.addWidget(self.createBtn)
+        bottom.addWidget(self.closeBtn)
+        layout.addLayout(bottom)
+
+        self.refreshBtn.clicked.connect(self._load)
+        self.createBtn.clicked.connect(self._create)
+        self.closeBtn.clicked.connect(self.accept)
+
+    @Slot()
+    def _load(self) -> None:
+        self.suggestions = suggest(self.db)
+        self.table.setRowCount(len(self.suggestions))
+        for r, s in enumerate(self.suggestions):
+            values = [s.sku, s.name, s.supplier or self.tr("(aucun)"), f"{s.velocity:.2f}", f"{s.stock:g}", f"{s.on_order:g}", f"{s.reorder_point:.0f}", f"{s.qty:g}"]
+            for c, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if c >= 3:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(r, c, item)
+        self.table.resizeColumnsToContents()
+        suppliers = len({s.supplier_id for s in self.suggestions})
+        self.summaryLabel.setText(self.tr("{count} produit(s) à commander chez {suppliers} fournisseur(s)").format(count=len(self.suggestions), suppliers=suppliers))
+        self.createBtn.setEnabled(bool(self.suggestions))
+
+    @Slot()
+    def _create(self) -> None:
+        rows = sorted({i.row() for i in self.table.selectionModel().selectedRows()})
+        chosen = [self.suggestions[r] for r in rows] if rows else self.suggestions
+        try:
+            orders = create_purchase_orders(self.db, chosen)
+        except Exception as e:
+            QMessageBox.critical(self, self.tr("Erreur"), str(e))
+            return
+        QMessageBox.information(
+            self, self.tr("Réapprovisionnement"),
+            self.tr("{count} commande(s) brouillon créée(s) dans Achats").format(count=len(orders)),
+        )
+        self._load()
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 from PySide6.QtCore import Slot
-from PySide6.QtWidgets import QDialog, QFormLayout, QLineEdit, QPushButton, QVBoxLayout, QFileDialog
+from PySide6.QtWidgets import QDialog, QFormLayout, QLineEdit, QCheckBox, QPushButton, QVBoxLayout, QFileDialog, QMessageBox
 
+from app.core.audit import audit
 from app.core.db import Database
+from app.core.numbering import unscoped_numbers, validate_store_code
 from app.core.settings import AppSettings
 
 
@@ -21,18 +23,25 @@ class SettingsDialog(QDialog):
         form = QFormLayout()
         self.vatEdit = QLineEdit(self)
         self.currencyEdit = QLineEdit(self)
+        self.companyEdit = QLineEdit(self)
         self.logoEdit = QLineEdit(self)
         self.logoBtn = QPushButton(self.tr("Choisir..."))
         self.invSeqEdit = QLineEdit(self)
         self.quoteSeqEdit = QLineEdit(self)
         self.delivSeqEdit = QLineEdit(self)
+        self.storeEdit = QLineEdit(self)
+        self.storeEdit.setMaxLength(8)
+        self.negativeStockCheck = QCheckBox(self.tr("Autoriser le stock négatif"), self)
         form.addRow(self.tr("TVA (%)"), self.vatEdit)
         form.addRow(self.tr("Devise"), self.currencyEdit)
+        form.addRow(self.tr("Société"), self.companyEdit)
         form.addRow(self.tr("Logo"), self.logoEdit)
         form.addRow("", self.logoBtn)
         form.addRow(self.tr("Num?rotation facture"), self.invSeqEdit)
         form.addRow(self.tr("Num?rotation devis"), self.quoteSeqEdit)
         form.addRow(self.tr("Num?rotation BL"), self.delivSeqEdit)
+        form.addRow(self.tr("Code magasin"), self.storeEdit)
+        form.addRow("", self.negativeStockCheck)
         layout.addLayout(form)
         self.saveBtn = QPushButton(self.tr("Enregistrer"))
         layout.addWidget(self.saveBtn)
@@ -42,10 +51,16 @@ class SettingsDialog(QDialog):
     def _load(self) -> None:
         self.vatEdit.setText(self.settings.get("vat_rate", "20.0") or "")
         self.currencyEdit.setText(self.settings.get("currency", "EUR") or "")
+        self.companyEdit.setText(self.settings.get("company_name", "") or "")
         self.logoEdit.setText(self.settings.get("company_logo_path", "") or "")
         self.invSeqEdit.setText(self.settings.get("invoice_seq", "INV-000000") or "")
         self.quoteSeqEdit.setText(self.settings.get("quote_seq", "QTE-000000") or "")
         self.delivSeqEdit.setText(self.settings.get("delivery_seq", "BL-000000") or "")
+        self.storeEdit.setText(self.settings.get("store_code", "") or "")
+        self.negativeStockCheck.setChecked(self.settings.get("allow_negative_stock", "1") != "0")
+        # Synced rows are keyed by the store code: it cannot change after a first sync
+        if self.storeEdit.text() and self.db.scalar("SELECT COUNT(*) FROM sync_peers;"):
+            self.storeEdit.setReadOnly(True)
 
     @Slot()
     def _choose_logo(self) -> None:
@@ -55,11 +70,36 @@ class SettingsDialog(QDialog):
 
     @Slot()
     def _save(self) -> None:
+        try:
+            store = validate_store_code(self.storeEdit.text())
+        except ValueError:
+            QMessageBox.warning(self, self.tr("Paramètres"), self.tr("Le code magasin doit contenir 1 à 8 lettres ou chiffres."))
+            return
         self.settings.set("vat_rate", self.vatEdit.text().strip())
         self.settings.set("currency", self.currencyEdit.text().strip())
+        self.settings.set("company_name", self.companyEdit.text().strip())
         self.settings.set("company_logo_path", self.logoEdit.text().strip())
         self.settings.set("invoice_seq", self.invSeqEdit.text().strip())
         self.settings.set("quote_seq", self.quoteSeqEdit.text().strip())
         self.settings.set("delivery_seq", self.delivSeqEdit.text().strip())
+        previous = self.settings.get("store_code", "") or ""
+        self.settings.set("store_code", store)
+        self.settings.set("allow_negative_stock", "1" if self.negativeStockCheck.isChecked() else "0")
+        audit("update", "settings")
+        if store and store != previous:
+            # Numbers issued so far have no store part and could collide with another shop's
+            unscoped = len(unscoped_numbers(self.db))
+            if unscoped:
+                QMessageBox.warning(
+                    self,
+                    self.tr("Paramètres"),
+                    self.tr(
+                        "%n document(s) ont été numérotés sans code magasin. Avant la première synchronisation, "
+                        "lancez « python -m app sync renumber » : le code magasin sera inséré dans leurs numéros "
+                        "(BL-000150 devient BL-{store}-000150).",
+                        "",
+                        unscoped,
+                    ).format(store=store),
+                )
         self.accept()
 
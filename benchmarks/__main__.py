@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from fnmatch import fnmatch
+from pathlib import Path
+
+# Views are timed without a display
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from app.core.datagen import SCALES, generate  # noqa: E402
+from app.core.db import Database  # noqa: E402
+from app.core.migrations import MigrationManager  # noqa: E402
+from app.core.settings import AppSettings  # noqa: E402
+
+from benchmarks import cases  # noqa: E402
+
+DATA_DIR = Path(__file__).resolve().parent / ".data"
+
+
+def open_dataset(scale: str, seed: int, path: Path | None) -> Database:
+    # Generated databases are cached; regenerating the large scale takes a while
+    path = path or DATA_DIR / f"{scale}-{seed}.db"
+    fresh = not path.exists()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = Database(path)
+    MigrationManager(db=db, migrations_dir=BASE_DIR / "app" / "migrations").apply_pending_migrations()
+    AppSettings(db=db).ensure_defaults()
+    if fresh:
+        print(f"Generating {scale} dataset (seed {seed}) into {path}")
+        last = {}
+
+        def progress(table: str, done: int, total: int) -> None:
+            pct = done * 100 // max(1, total)
+            if pct // 10 != last.get(table):
+                last[table] = pct // 10
+                print(f"  {table}: {done}/{total}", flush=True)
+
+        try:
+            generate(db, SCALES[scale], seed, progress)
+        except BaseException:
+            db.conn.close()
+            path.unlink(missing_ok=True)
+            raise
+    return db
+
+
+def measure(fn, repeat: int) -> dict:
+    fn()  # warm-up: caches, prepared statements, lazy imports
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": round(statistics.median(samples), 3), "min_ms": round(min(samples), 3), "repeat": repeat}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, res in results.items():
+        ref = baseline.get(name)
+        if not ref:
+            res["status"] = "new"
+            continue
+        ratio = res["median_ms"] / max(ref["median_ms"], 1e-6)
+        res["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            res["status"] = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            res["status"] = "faster"
+        else:
+            res["status"] = "ok"
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark suite on a generated dataset")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", type=Path, help="dataset path (default: benchmarks/.data/<scale>-<seed>.db)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", action="append", default=[], help="glob on case names, e.g. 'view.*' (repeatable)")
+    parser.add_argument("--baseline", type=Path, help="default: benchmarks/baseline-<scale>.json")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before reporting a regression")
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    parser.add_argument("--generate-only", action="store_true")
+    args = parser.parse_args(argv)
+
+    db = open_dataset(args.scale, args.seed, args.db)
+    if args.generate_only:
+        return 0
+
+    suite = {}
+    suite.update(cases.query_cases(db))
+    suite.update(cases.view_cases(db))
+    suite.update(cases.io_cases(db))
+    suite.update(cases.pos_cases(db))
+    suite.update(cases.pdf_cases(db, BASE_DIR))
+    if args.only:
+        suite = {name: fn for name, fn in suite.items() if any(fnmatch(name, pattern) for pattern in args.only)}
+
+    results = {}
+    for name, fn in suite.items():
+        results[name] = measure(fn, args.repeat)
+        print(f"{name:<36} {results[name]['median_ms']:>10.1f} ms", flush=True)
+
+    baseline_path = args.baseline or Path(__file__).resolve().parent / f"baseline-{args.scale}.json"
+    regressions: list[str] = []
+    if baseline_path.exists() and not args.save_baseline:
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        if baseline.get("seed") != args.seed:
+            print(f"warning: baseline was recorded with seed {baseline.get('seed')}")
+        regressions = compare(results, baseline["results"], args.threshold)
+        print()
+        for name, res in results.items():
+            if res.get("status") not in ("ok", None):
+                print(f"{res['status']:<10} {name} (x{res.get('vs_baseline', '-')})")
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%} against {baseline_path.name}")
+
+    report = {"scale": args.scale, "seed": args.seed, "python": sys.version.split()[0], "results": results}
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Baseline saved to {baseline_path}")
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
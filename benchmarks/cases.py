@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import tempfile
+from datetime import date
+from io import BytesIO
+from pathlib import Path
+from typing import Callable
+
+from app.core.db import Database
+
+# name -> zero-argument callable; built once per run so setup cost is not timed
+Cases = dict[str, Callable[[], object]]
+
+
+def query_cases(db: Database) -> Cases:
+    from app.core import cash, receivables, replenishment, rollups, valuation
+
+    year = db.scalar("SELECT MAX(substr(date, 1, 4)) FROM documents;") or str(date.today().year)
+    date_from, date_to = f"{year}-01-01", f"{year}-12-31"
+    last_day = db.scalar("SELECT MAX(date) FROM documents;") or date.today().isoformat()
+    partner = db.scalar("SELECT partner_id FROM documents WHERE kind='invoice' GROUP BY partner_id ORDER BY COUNT(*) DESC LIMIT 1;")
+    return {
+        "query.aging_report": lambda: receivables.aging_report(db, date_to),
+        "query.open_invoices.partner": lambda: receivables.open_invoices(db, partner),
+        "query.sales_summary.month": lambda: rollups.sales_summary(db, date_from, date_to, "month"),
+        "query.sales_summary.partner": lambda: rollups.sales_summary(db, date_from, date_to, "partner", limit=50),
+        "query.sales_summary.product": lambda: rollups.sales_summary(db, date_from, date_to, "product", limit=50),
+        "query.cash.open_movements": lambda: cash.open_movements(db, 100),
+        "query.replenishment.suggest": lambda: replenishment.suggest(db, last_day),
+        "query.valuation.totals": lambda: valuation.valuation_totals(db),
+        "query.partner_search": lambda: db.query(
+            "SELECT id, name_fr FROM partners WHERE kind='client' AND (name_fr LIKE ? OR phone LIKE ?) ORDER BY id DESC LIMIT 20;", ("%Haddad%", "%Haddad%")
+        ),
+    }
+
+
+def view_cases(db: Database) -> Cases:
+    from PySide6.QtWidgets import QApplication
+
+    from app.views.modules.cash import CashView
+    from app.views.modules.customers import CustomersView
+    from app.views.modules.dashboard import DashboardView
+    from app.views.modules.payments import PaymentsView
+    from app.views.modules.products import ProductsView
+    from app.views.modules.purchases import PurchasesView
+    from app.views.modules.receivables import ReceivablesView
+    from app.views.modules.sales import SalesView
+    from app.views.modules.stock import StockView
+    from app.views.modules.suppliers import SuppliersView
+
+    QApplication.instance() or QApplication([])
+    views = {
+        "customers": CustomersView(db),
+        "suppliers": SuppliersView(db),
+        "products": ProductsView(db),
+        "stock": StockView(db),
+        "invoices": SalesView(db, kind="invoice"),
+        "purchases": PurchasesView(db),
+        "payments": PaymentsView(db),
+        "receivables": ReceivablesView(db),
+        "cash": CashView(db),
+        "dashboard": DashboardView(db),
+    }
+    cases: Cases = {f"view.{name}.load": view._load for name, view in views.items()}
+
+    def searched(view, text: str) -> Callable[[], None]:
+        def run() -> None:
+            view.searchEdit.blockSignals(True)
+            view.searchEdit.setText(text)
+            view.searchEdit.blockSignals(False)
+            view._load()
+
+        return run
+
+    cases["view.customers.search"] = searched(CustomersView(db), "Haddad")
+    cases["view.products.search"] = searched(ProductsView(db), "Lampe")
+    return cases
+
+
+def io_cases(db: Database) -> Cases:
+    from app.core import products_io
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench-io-"))
+    csv_path, xlsx_path = tmp / "products.csv", tmp / "products.xlsx"
+    products_io.export_products_csv(db, csv_path)
+    return {
+        "io.products.export_csv": lambda: products_io.export_products_csv(db, csv_path),
+        "io.products.export_xlsx": lambda: products_io.export_products_xlsx(db, xlsx_path),
+        # Re-importing the export upserts identical rows, so the database is left unchanged
+        "io.products.import_csv": lambda: products_io.import_products_csv(db, csv_path),
+    }
+
+
+def pos_cases(db: Database) -> Cases:
+    from app.core.catalog import Catalog
+
+    catalog = Catalog(db)
+    catalog.load()
+    codes = [r[0] for r in db.query("SELECT IFNULL(barcode, sku) FROM products ORDER BY random() LIMIT 100;")]
+    return {
+        "pos.catalog.load": catalog.load,
+        "pos.catalog.refresh": catalog.refresh,
+        # 100 lookups per run, as a till does during a busy hour
+        "pos.scan.x100": lambda: [catalog.lookup(c) for c in codes],
+        "catalog.search.one_letter": lambda: catalog.search("l"),
+        # Every SKU starts with P: the widest prefix range there is
+        "catalog.search.sku_prefix": lambda: catalog.search("p"),
+        "catalog.search.word": lambda: catalog.search("lampe"),
+        "catalog.search.two_words": lambda: catalog.search("lam gr"),
+        "catalog.search.sku": lambda: catalog.search("P00012"),
+    }
+
+
+def pdf_cases(db: Database, base_dir: Path) -> Cases:
+    from app.core.pdf import generate_document_pdf, generate_statement_pdf
+
+    largest = db.scalar("SELECT document_id FROM document_lines GROUP BY document_id ORDER BY COUNT(*) DESC LIMIT 1;")
+    typical = db.scalar("SELECT id FROM documents WHERE kind='invoice' ORDER BY id LIMIT 1;")
+    partner = db.scalar("SELECT partner_id FROM documents WHERE kind='invoice' GROUP BY partner_id ORDER BY COUNT(*) DESC LIMIT 1;")
+    return {
+        "pdf.document.typical": lambda: generate_document_pdf(db, typical, BytesIO(), base_dir),
+        "pdf.document.largest": lambda: generate_document_pdf(db, largest, BytesIO(), base_dir),
+        "pdf.statement.busiest_client": lambda: generate_statement_pdf(db, partner, BytesIO(), base_dir),
+    }